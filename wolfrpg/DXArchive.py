@@ -1,18 +1,33 @@
-from io import SEEK_END, SEEK_SET, TextIOWrapper
-from pathlib import Path
-from stat import FILE_ATTRIBUTE_DIRECTORY
+from array import array
+from functools import lru_cache
+from io import SEEK_END, SEEK_SET, BytesIO, TextIOWrapper
+from pathlib import Path, PurePosixPath
+from stat import FILE_ATTRIBUTE_ARCHIVE, FILE_ATTRIBUTE_DIRECTORY
 
 try:
-    from .huffman import huffman_Decode
+    from .huffman import huffman_Decode, huffman_Encode, huffman_Histogram
 except ImportError:
-    from huffman import huffman_Decode
+    from huffman import huffman_Decode, huffman_Encode, huffman_Histogram
+
+HAS_NUMPY = True
+try:
+    import numpy as np
+except ImportError:
+    HAS_NUMPY = False
+import hashlib
+import json
+import math
+import mmap
+import os
 import struct
+import zlib
 
 
 DXA_HEAD = struct.unpack("H", b"DX")[0]  # Header
 DXA_VER = 0x0008  # Version
 DXA_VER_MIN = 0x0008  # The minimum version supported.
 DXA_BUFFERSIZE = 0x1000000  # Size of the buffer used when creating the archive
+DXA_STREAM_SIZE = DXA_BUFFERSIZE  # Files larger than this are written in pieces, without LZ compression
 DXA_KEY_BYTES = 7  # Number of bytes in the key
 DXA_KEY_STRING_LENGTH = 63  # Length of key string
 DXA_KEY_STRING_MAXLENGTH = 2048  # Size of key string buffer
@@ -22,9 +37,37 @@ defaultKeyString = bytearray(
     [0x44, 0x58, 0x42, 0x44, 0x58, 0x41, 0x52, 0x43, 0x00]
 )  # "DXLIBARC" # It's actually b"DXBDXARC\x00" ¯\_(ツ)_/¯
 
+# Key string of WolfRPG archives
+wolfKeyString = b"WLFRPrO!p(;s5((8P@((UFWlu$#5(="
+
+# Index sidecar written next to the archive by loadArchive(useIndex=True)
+DXA_INDEX_SUFFIX = ".idx"
+DXA_INDEX_VERSION = 2
+
 # Length of the log string
 logStringLength = 0
 
+# Code pages of file names (DARC_HEAD.charCodeFormat)
+DXA_CHARCODEFORMAT_SHIFTJIS = 932
+DXA_CHARCODEFORMAT_UTF8 = 65001
+
+# FILETIME of the unix epoch (100ns units since 1601)
+DXA_FILETIME_EPOCH = 116444736000000000
+
+# Whether files are compressed, by extension: False for formats that are compressed already, True to always try.
+# Other files are compressed unless a sample of them looks like random data (see isCompressible)
+DXA_COMPRESS_POLICY = {
+    ".ogg": False, ".mp3": False, ".m4a": False, ".aac": False, ".opus": False, ".flac": False, ".wma": False,
+    ".png": False, ".jpg": False, ".jpeg": False, ".webp": False, ".gif": False,
+    ".webm": False, ".mp4": False, ".wmv": False, ".mpg": False, ".mpeg": False, ".ogv": False,
+    ".zip": False, ".7z": False, ".rar": False, ".gz": False, ".wolf": False,
+    ".mps": True, ".dat": True, ".project": True, ".txt": True, ".csv": True, ".bmp": True, ".wav": True,
+    ".mid": True, ".midi": True, ".ttf": True,
+}
+DXA_SAMPLE_SIZE = 4096  # Bytes per sample of isCompressible
+DXA_SAMPLE_COUNT = 4  # Samples taken over the file
+DXA_ENTROPY_LIMIT = 7.9  # Bits per byte from which a sample is taken for incompressible
+
 # Flags
 DXA_FLAG_NO_KEY = 0x00000001  # No key processing
 DXA_FLAG_NO_HEAD_PRESS = 0x00000002  # No header compression
@@ -114,10 +157,10 @@ class DARC_FILEHEAD:
     pressDataSize = None  # The size of the data after compression ( 0xffffffffffffffffff: not compressed ) (added in Ver0x0002)
     huffPressDataSize = None  # Size of the data after Huffman compression ( 0xffffffffffffffff: not compressed ) (added in Ver0x0008)
 
-    def __init__(self, fileHead_bytes=None):
+    def __init__(self, fileHead_bytes=None, offset=0):
         if fileHead_bytes is None:
             return
-        unpacked = struct.unpack("QQQQQQQQQ", fileHead_bytes[: len(self)])
+        unpacked = struct.unpack_from("QQQQQQQQQ", fileHead_bytes, offset)
         self.nameAddress = unpacked[0]
         self.attributes = unpacked[1]
         self.time = DARC_FILETIME()
@@ -151,10 +194,10 @@ class DARC_DIRECTORY:
     fileHeadNum = None  # Number of files in the directory
     fileHeadAddress = None  # The address where the header column of the file in the directory is stored ( The address indicated by the member variable FileTableStartAddress of the DARC_HEAD structure is set to address 0.)
 
-    def __init__(self, directory_bytes=None):
+    def __init__(self, directory_bytes=None, offset=0):
         if directory_bytes is None:
             return
-        unpacked = struct.unpack("QQQQ", directory_bytes[: len(self)])
+        unpacked = struct.unpack_from("QQQQ", directory_bytes, offset)
         self.directoryAddress = unpacked[0]
         self.parentDirectoryAddress = unpacked[1]
         self.fileHeadNum = unpacked[2]
@@ -199,6 +242,7 @@ class ArchivedFile:
     dataSize: int
     pressDataSize: int
     huffPressDataSize: int
+    time: tuple  # DARC_FILETIME create, lastAccess, lastWrite
 
     def __str__(self) -> str:
         return f"""ArchivedFile(
@@ -210,6 +254,7 @@ class ArchivedFile:
 \tdataSize: {self.dataSize}
 \tpressDataSize: {self.pressDataSize}
 \thuffPressDataSize: {self.huffPressDataSize}
+\ttime: {self.time}
 )"""
 
 
@@ -224,11 +269,23 @@ class DXArchive:
     )  # Maximum size to copy from a reference address ( Maximum copy size that a compression code can represent + Minimum number of compressed bytes )
     MAX_ADDRESSLISTNUM = 1024 * 1024 * 1  # Maximum size of slide dictionary
     MAX_POSITION = 1 << 24  # Maximum relative address that can be referenced ( 16MB )
+    # Effort levels of encode(): (candidates tried per position, window, length that ends
+    # the search early, lazy matching)
+    ENCODE_LEVELS = {
+        'fast': (4, MAX_ADDRESSLISTNUM, 32, False),
+        'default': (MAX_SEARCHLISTNUM, MAX_ADDRESSLISTNUM, 256, False),
+        'max': (MAX_SUBLISTNUM, MAX_POSITION, MAX_COPYSIZE, True),
+    }
 
     def __init__(self) -> None:
         self.archivedFiles = []
+        self.fileIndex = {}  # memberName() -> ArchivedFile
+        self.data = None  # The archive mapped into memory, see mapArchive()
+        self.fp = None
+        self.storedContents = None
 
     def error(self) -> bool:
+        self.unmapArchive()
         if self.fp is not None:
             self.fp.close()
 
@@ -239,8 +296,16 @@ class DXArchive:
         archivePath: Path,
         outputPath: Path = Path("."),
         keyString_: bytearray = None,
+        useIndex: bool = False,
     ):
+        """
+        Reads the member list of the archive at `archivePath`; members are extracted under `outputPath`.
+        With `useIndex` the decoded member list is kept in a sidecar file (archive + DXA_INDEX_SUFFIX)
+        and reused as long as the archive and the key stay the same.
+        """
         self.fp = open(archivePath, mode="rb")
+        self.mapArchive()
+        self.archivePath = archivePath
         self.outputPath = outputPath
         self.directory = self.outputPath
 
@@ -258,6 +323,8 @@ class DXArchive:
 
         # Creating a key
         key = self.keyCreate(keyString, keyStringBytes, key)
+        self.keyString = keyString
+        self.key = key
 
         self.archiveHead = DARC_HEAD(self.fp.read(len(DARC_HEAD())))  # 64
 
@@ -267,17 +334,21 @@ class DXArchive:
         if self.archiveHead.version > DXA_VER or self.archiveHead.version < DXA_VER_MIN:
             return self.error()
 
-        headBuffer = [0] * self.archiveHead.headSize
-
         self.noKey = (self.archiveHead.flags & DXA_FLAG_NO_KEY) != 0
 
         if self.archiveHead.headSize is None or self.archiveHead.headSize == 0:
             return self.error()
 
+        indexStamp = self.indexStamp(keyString) if useIndex else None
+        if indexStamp is not None and self.loadIndex(indexStamp):
+            return True
+
         if (self.archiveHead.flags & DXA_FLAG_NO_HEAD_PRESS) != 0:
             # If not compressed, read normally
             self.fp.seek(self.archiveHead.fileNameTableStartAddress, SEEK_SET)
-            headBuffer = self.keyConvFileRead(self.archiveHead.headSize, 0)
+            headBuffer = self.keyConvFileRead(
+                None, self.archiveHead.headSize, None if self.noKey else key, 0
+            )
         else:
             # Get compressed header capacity
             self.fp.seek(0, SEEK_END)
@@ -288,7 +359,7 @@ class DXArchive:
             if huffHeadSize is None or huffHeadSize <= 0:
                 return self.error()
 
-            huffHeadBuffer = bytearray([0] * huffHeadSize)
+            huffHeadBuffer = bytearray(huffHeadSize)
 
             # Read Huffman compressed headers into memory
             huffHeadBuffer = self.keyConvFileRead(
@@ -301,97 +372,139 @@ class DXArchive:
             if lzHeadSize is None or lzHeadSize <= 0:
                 return self.error()
 
-            lzHeadBuffer = bytearray([0] * lzHeadSize)
+            lzHeadBuffer = bytearray(lzHeadSize)
 
             # Decompress Huffman compressed headers
             (lzHeadBuffer, originalSize) = huffman_Decode(huffHeadBuffer, lzHeadBuffer)
 
             # Decompress LZ compressed headers
-            (headBuffer, size) = self.decode(lzHeadBuffer, bytearray(headBuffer))
+            (headBuffer, size) = self.decode(lzHeadBuffer, bytearray(self.archiveHead.headSize))
+
+        # The file and directory tables are only read with unpack_from, so they can be views
+        headView = memoryview(headBuffer)
+        self.nameTable = headBuffer[: self.archiveHead.fileTableStartAddress]
+        self.fileTable = headView[
+            self.archiveHead.fileTableStartAddress : self.archiveHead.directoryTableStartAddress
+        ]
+        self.directoryTable = headView[
+            self.archiveHead.directoryTableStartAddress :
+        ]
+
+        self.directoryDecode(
+            DARC_DIRECTORY(self.directoryTable), key, keyString, keyStringBytes
+        )
+        self.fileIndex = {self.memberName(archivedFile): archivedFile for archivedFile in self.archivedFiles}
+        if indexStamp is not None:
+            self.saveIndex(indexStamp)
 
-            self.nameTable = headBuffer[: self.archiveHead.fileTableStartAddress]
-            self.fileTable = headBuffer[
-                self.archiveHead.fileTableStartAddress : self.archiveHead.directoryTableStartAddress
-            ]
-            self.directoryTable = headBuffer[
-                self.archiveHead.directoryTableStartAddress :
-            ]
+        return True
 
-            self.directoryDecode(
-                DARC_DIRECTORY(self.directoryTable), key, keyString, keyStringBytes
-            )
+    def mapArchive(self) -> None:
+        """ Maps the opened archive into memory for writeMember(); without a mapping it reads through self.fp """
+        try:
+            self.data = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # empty files can't be mapped
+            self.data = None
+
+    def unmapArchive(self) -> None:
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+    def indexPath(self) -> Path:
+        return Path(str(self.archivePath) + DXA_INDEX_SUFFIX)
+
+    def indexStamp(self, keyString: bytearray) -> dict:
+        """ What an index sidecar must have been made from to be valid for this archive and key """
+        stat = os.fstat(self.fp.fileno())
+        # the header and the (still encoded) tables, not the member data
+        headerHash = hashlib.sha1()
+        self.fp.seek(0, SEEK_SET)
+        headerHash.update(self.fp.read(len(DARC_HEAD())))
+        self.fp.seek(self.archiveHead.fileNameTableStartAddress, SEEK_SET)
+        for chunk in iter(lambda: self.fp.read(DXA_BUFFERSIZE), b""):
+            headerHash.update(chunk)
+        self.fp.seek(len(DARC_HEAD()), SEEK_SET)
+        return {
+            "version": DXA_INDEX_VERSION,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "header": headerHash.hexdigest(),
+            "key": hashlib.sha1(bytes(keyString)).hexdigest(),
+        }
 
-            return True
+    def loadIndex(self, indexStamp: dict) -> bool:
+        """ Fills archivedFiles from the index sidecar; False if there is none or it's stale """
+        try:
+            with open(self.indexPath(), "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if index.get("stamp") != indexStamp:
+            return False
 
-    def keyCreate(self, source: bytearray, sourceBytes: int, key: bytearray):
-        workBuffer = bytearray([0] * 1024)
+        self.archivedFiles = []
+        for name, dataStart, dataSize, pressDataSize, huffPressDataSize, key, time in index["members"]:
+            archivedFile = ArchivedFile()
+            archivedFile.filePath = self.outputPath / name
+            archivedFile.compressed = pressDataSize != 0xFFFFFFFFFFFFFFFF
+            archivedFile.huffmanCompressed = huffPressDataSize != 0xFFFFFFFFFFFFFFFF
+            archivedFile.key = None if key is None else bytearray.fromhex(key)
+            archivedFile.dataStart = dataStart
+            archivedFile.dataSize = dataSize
+            archivedFile.pressDataSize = pressDataSize
+            archivedFile.huffPressDataSize = huffPressDataSize
+            archivedFile.time = tuple(time)
+            self.archivedFiles.append(archivedFile)
+        self.fileIndex = {self.memberName(archivedFile): archivedFile for archivedFile in self.archivedFiles}
+        return True
+
+    def saveIndex(self, indexStamp: dict) -> None:
+        members = [
+            [
+                archivedFile.filePath.relative_to(self.outputPath).as_posix(),
+                archivedFile.dataStart,
+                archivedFile.dataSize,
+                archivedFile.pressDataSize,
+                archivedFile.huffPressDataSize,
+                None if archivedFile.key is None else archivedFile.key.hex(),
+                archivedFile.time,
+            ]
+            for archivedFile in self.archivedFiles
+        ]
+        indexPath = self.indexPath()
+        tempPath = indexPath.with_name(indexPath.name + ".tmp")
+        try:
+            with open(tempPath, "w", encoding="utf-8") as f:
+                json.dump({"stamp": indexStamp, "members": members}, f)
+            os.replace(tempPath, indexPath)
+        except OSError as e:
+            # a read-only game folder just means no index
+            print(f"couldn't write archive index {indexPath}: {e}")
 
+    def keyCreate(self, source: bytearray, sourceBytes: int, key: bytearray):
         if sourceBytes == 0:
             sourceBytes = len(source)
 
         # If it's too short, add defaultKeyString
         if sourceBytes < 4:
-            sourceTempBuffer = source
-            sourceTempBuffer += defaultKeyString
-            source = sourceTempBuffer
+            source = source + defaultKeyString
             sourceBytes = len(source)
 
-        if sourceBytes > len(workBuffer):
-            useWorkBuffer = bytearray([0] * sourceBytes)
-        else:
-            useWorkBuffer = workBuffer
-
-        j = 0
-        for i in range(0, sourceBytes, 2):
-            useWorkBuffer[j] = source[i]
-            j += 1
-
-        CRC32_0 = self.CRC32(useWorkBuffer, j)
+        # CRC32 of the even and of the odd bytes
+        source = bytes(source[:sourceBytes])
+        CRC32_0 = self.CRC32(source[0::2], len(source[0::2]))
+        CRC32_1 = self.CRC32(source[1::2], len(source[1::2]))
 
-        j = 0
-        for i in range(1, sourceBytes, 2):
-            useWorkBuffer[j] = source[i]
-            j += 1
-
-        CRC32_1 = self.CRC32(useWorkBuffer, j)
-
-        key[0] = (CRC32_0 >> 0) % 256
-        key[1] = (CRC32_0 >> 8) % 256
-        key[2] = (CRC32_0 >> 16) % 256
-        key[3] = (CRC32_0 >> 24) % 256
-        key[4] = (CRC32_1 >> 0) % 256
-        key[5] = (CRC32_1 >> 8) % 256
-        key[6] = (CRC32_1 >> 16) % 256
+        key[0:4] = CRC32_0.to_bytes(4, "little")
+        key[4:7] = CRC32_1.to_bytes(4, "little")[:3]
 
         return key
 
-    def CRC32(self, SrcData: bytearray, SrcDataSize: bytearray) -> int:
-        CRC32TableInit = 0
-        CRC32Table = []
-        CRC = 0xFFFFFFFF
-
-        # Initialize the table if it is not already initialized
-        if CRC32TableInit == 0:
-            Magic = 0xEDB88320  # The bit-wise reverse order of 0x4c11db7 is 0xedb88320
-
-            for i in range(256):
-                Data = i
-                for j in range(8):
-                    b = Data & 1
-                    Data = Data >> 1
-                    if b != 0:
-                        Data = Data ^ Magic
-
-                CRC32Table.append(Data)
-
-            # Sets the table initialization flag
-            CRC32TableInit = 1
-
-        for i in range(SrcDataSize):
-            tmp = (CRC ^ SrcData[i]) % 256
-            CRC = CRC32Table[tmp] ^ (CRC >> 8)
-
-        return CRC ^ 0xFFFFFFFF
+    def CRC32(self, SrcData: bytearray, SrcDataSize: int) -> int:
+        # zlib uses the same reversed 0x4c11db7 polynomial (0xedb88320)
+        return zlib.crc32(SrcData[:SrcDataSize])
 
     def keyConvFileRead(
         self,
@@ -409,8 +522,10 @@ class DXArchive:
             else:
                 pos = position
 
-        # fetch
-        data = bytearray(self.fp.read(size))  # For assignment in keyConv data[i] ^= key[j]
+        # fetch, into `data` when it is a big enough buffer
+        if not isinstance(data, bytearray) or len(data) != size:
+            data = bytearray(size)
+        self.fp.readinto(data)
 
         if key is not None:
             # Xor operation with data using key string
@@ -421,108 +536,171 @@ class DXArchive:
     def keyConv(
         self, data: bytearray, size: int, position: int, key: bytearray
     ) -> bytes:
+        """ XORs the first `size` bytes of `data` in place with `key`, which starts at `position` """
         if key is None:
             return data
 
-        position %= DXA_KEY_BYTES
+        if not isinstance(data, bytearray):
+            data = bytearray(data)
 
-        if size < 0x100000000:
-            j = position % 0xFFFFFFFF
-            for i in range(size):
-                data[i] ^= key[j]
-                j += 1
-                if j == DXA_KEY_BYTES:
-                    j = 0
+        position %= DXA_KEY_BYTES
+        # the key as it lines up with data[0:7], data[7:14], ...
+        rotated = bytes(key[position:DXA_KEY_BYTES]) + bytes(key[:position])
+
+        if HAS_NUMPY:
+            buffer = np.frombuffer(data, dtype=np.uint8, count=size)
+            whole = size - size % DXA_KEY_BYTES
+            keyRow = np.frombuffer(rotated, dtype=np.uint8)
+            rows = buffer[:whole].reshape(-1, DXA_KEY_BYTES)
+            rows ^= keyRow
+            buffer[whole:] ^= keyRow[: size - whole]
         else:
-            j = position
-            for i in range(size):
-                data[i] ^= key[j]
-                j += 1
-                if j == DXA_KEY_BYTES:
-                    j = 0
+            keyStream = rotated * (size // DXA_KEY_BYTES + 1)
+            data[:size] = (
+                int.from_bytes(data[:size], "little") ^ int.from_bytes(keyStream[:size], "little")
+            ).to_bytes(size, "little")
 
         return data
 
-    def decode(self, src, dest) -> tuple:
-        srcp = src
+    def readData(self, start: int, size: int, key: bytearray, position: int) -> bytearray:
+        """ `size` bytes of the archive at `start`, un-XORed with `key` starting at key `position` """
+        if self.data is None:
+            self.fp.seek(start, SEEK_SET)
+            return self.keyConvFileRead(None, size, key, position)
+        data = bytearray(size)
+        with memoryview(self.data) as view:
+            data[:] = view[start : start + size]
+        return self.keyConv(data, size, position, key)
+
+    def copyData(self, start: int, size: int, destP, key: bytearray = None, position: int = 0, srcP=None) -> None:
+        """
+        Copies `size` bytes of the archive (or of `srcP`) at `start` to `destP`, XORed with `key` starting at key `position`
+
+        Unkeyed data is copied inside the kernel when `destP` is a file, the rest goes
+        through one DXA_BUFFERSIZE buffer, so memory use doesn't grow with `size`
+        """
+        if srcP is None:
+            srcP = self.fp
+        writeSize = self.sendData(start, size, destP, srcP) if key is None else 0
+        if writeSize == size:
+            return
+
+        buffer = bytearray(min(size - writeSize, DXA_BUFFERSIZE))
+        with memoryview(buffer) as view:
+            srcP.seek(start + writeSize, SEEK_SET)
+            while writeSize < size:
+                moveSize = min(size - writeSize, DXA_BUFFERSIZE)
+                if srcP.readinto(view[:moveSize]) != moveSize:
+                    raise Exception(f"Unexpected end of {srcP.name} at {start + size}")
+                self.keyConv(buffer, moveSize, position + writeSize, key)
+                destP.write(view[:moveSize])
+                writeSize += moveSize
+
+    def sendData(self, start: int, size: int, destP, srcP) -> int:
+        """ Copies up to `size` bytes of `srcP` at `start` into the file behind `destP` without reading them, returns how many """
+        try:
+            destFd = destP.fileno()
+            destP.flush()
+            offset = destP.tell()
+        except (AttributeError, OSError, ValueError):
+            # not a file, or not a seekable one
+            return 0
+        srcFd = srcP.fileno()
+        copied = 0
 
-        destsize = struct.unpack("I", srcp[0:4])[0]
-        srcsize = struct.unpack("I", srcp[4:8])[0] - 9
+        try:
+            while copied < size:
+                moved = os.copy_file_range(srcFd, destFd, size - copied, start + copied, offset + copied)
+                if moved == 0:
+                    break
+                copied += moved
+        except (AttributeError, OSError):
+            # Python < 3.8, not Linux, or files on different file systems with an older kernel
+            try:
+                os.lseek(destFd, offset + copied, SEEK_SET)
+                while copied < size:
+                    moved = os.sendfile(destFd, srcFd, start + copied, size - copied)
+                    if moved == 0:
+                        break
+                    copied += moved
+            except (AttributeError, OSError):
+                pass
 
-        keycode = srcp[8]
+        # keep the file object's position in line with what was written under it
+        destP.seek(offset + copied, SEEK_SET)
+        return copied
+
+    def decode(self, src, dest) -> tuple:
+        destsize, srcsize, keycode = struct.unpack_from("IIB", src, 0)
 
         if dest is None:
             return destsize
 
-        sp = srcp[9:]
+        if not isinstance(src, (bytes, bytearray)):
+            src = bytes(src)
+        view = memoryview(src)
+        find = src.find
+        key = bytes([keycode])
+        MIN_COMPRESS = self.MIN_COMPRESS
 
-        tda = bytearray([0] * destsize)
+        # Decode into `dest` when it is a buffer of exactly the decoded size
+        tda = dest if isinstance(dest, bytearray) and len(dest) == destsize else bytearray(destsize)
         tdac = 0
+        sp = 9
 
-        while srcsize > 0:
-            if sp[0] != keycode:
-                tda[tdac] = sp[0]
-                tdac += 1
-                sp = sp[1:]
-                srcsize -= 1
-                continue
+        while sp < srcsize:
+            # Copy everything up to the next escape in one go
+            nxt = find(key, sp, srcsize)
+            if nxt < 0:
+                nxt = srcsize
+            if nxt > sp:
+                tda[tdac : tdac + nxt - sp] = view[sp:nxt]
+                tdac += nxt - sp
+                sp = nxt
+                if sp >= srcsize:
+                    break
 
-            if sp[1] == keycode:
-                tda[tdac] = keycode % 256
+            code = src[sp + 1]
+            if code == keycode:
+                tda[tdac] = keycode
                 tdac += 1
-                sp = sp[2:]
-                srcsize -= 2
+                sp += 2
                 continue
 
-            code = sp[1]
-
             if code > keycode:
                 code -= 1
-
-            sp = sp[2:]
-            srcsize -= 2
+            sp += 2
 
             conbo = code >> 3
             if code & (0x1 << 2):
-                conbo |= sp[0] << 5
-                sp = sp[1:]
-                srcsize -= 1
-
-            conbo += self.MIN_COMPRESS
+                conbo |= src[sp] << 5
+                sp += 1
+            conbo += MIN_COMPRESS
 
             indexsize = code & 0x3
             if indexsize == 0:
-                index = sp[0]
-                sp = sp[1:]
-                srcsize -= 1
+                index = src[sp]
+                sp += 1
             elif indexsize == 1:
-                index = struct.unpack("H", sp[0:2])[0]
-                sp = sp[2:]
-                srcsize -= 2
-            elif indexsize == 2:
-                index = struct.unpack("H", sp[0:2])[0] | (sp[2] << 16)
-                sp = sp[3:]
-                srcsize -= 3
-
+                index = src[sp] | (src[sp + 1] << 8)
+                sp += 2
+            else:
+                index = src[sp] | (src[sp + 1] << 8) | (src[sp + 2] << 16)
+                sp += 3
             index += 1
 
-            if index < conbo:
-                num = index
-                while conbo > num:
-                    copied_bytes = tda[tdac - num : tdac - num + num]
-                    tda[tdac : tdac + num] = copied_bytes
-                    tdac += num
-                    conbo -= num
-                    num += num
-                if conbo != 0:
-                    copied_bytes = tda[tdac - num : tdac - num + conbo]
-                    tda[tdac : tdac + conbo] = copied_bytes
-                    tdac += conbo
+            start = tdac - index
+            if index >= conbo:
+                tda[tdac : tdac + conbo] = tda[start : start + conbo]
+            elif index == 1:
+                # a run of the previous byte
+                tda[tdac : tdac + conbo] = tda[start:tdac] * conbo
             else:
-                copied_bytes = tda[tdac - index : tdac - index + conbo]
-                tda[tdac : tdac + conbo] = copied_bytes
-                tdac += conbo
+                # the copy overlaps what it writes: repeat the last `index` bytes
+                tda[tdac : tdac + conbo] = (tda[start:tdac] * (conbo // index + 1))[:conbo]
+            tdac += conbo
 
+        view.release()
         return (tda, destsize)
 
     def directoryDecode(
@@ -531,11 +709,13 @@ class DXArchive:
         key: bytearray,
         keyString: str,
         keyStringBytes: int,
+        directoryString: bytes = b"",
     ) -> None:
         """
         Recursively get all directory information from directoryTable:
             Directory Name
             Information about files inside directory (actual files and other directories)
+        `directoryString` is the directory part of the file keys in this directory (see createKeyFileString)
         """
 
         # Save current directory
@@ -545,29 +725,34 @@ class DXArchive:
             directoryInfo.directoryAddress != 0xFFFFFFFFFFFFFFFF
             and directoryInfo.parentDirectoryAddress != 0xFFFFFFFFFFFFFFFF
         ):
-            dirFile = DARC_FILEHEAD(self.fileTable[directoryInfo.directoryAddress :])
-            pName = self.getOriginalFileName(self.nameTable[dirFile.nameAddress :])
+            dirFile = DARC_FILEHEAD(self.fileTable, directoryInfo.directoryAddress)
+            pName = self.getOriginalFileName(self.nameTable, dirFile.nameAddress)
             self.directory = self.directory / pName
 
+        keyPrefixBytes = keyStringBytes if keyString is not None else 0
+        fileHeadSize = len(DARC_FILEHEAD())
+
         # Get info about file sinside this directory
         for i in range(directoryInfo.fileHeadNum):
-            offset = len(DARC_FILEHEAD()) * i
             fileInfo = DARC_FILEHEAD(
-                self.fileTable[directoryInfo.fileHeadAddress + offset :]
+                self.fileTable, directoryInfo.fileHeadAddress + fileHeadSize * i
             )
 
             # Is the file another directory?
             if fileInfo.attributes & FILE_ATTRIBUTE_DIRECTORY:
                 # Get that info too
+                subDirectory = DARC_DIRECTORY(self.directoryTable, fileInfo.dataAddress)
+                subDirectoryFile = DARC_FILEHEAD(self.fileTable, subDirectory.directoryAddress)
                 self.directoryDecode(
-                    DARC_DIRECTORY(self.directoryTable[fileInfo.dataAddress :]),
+                    subDirectory,
                     key,
                     keyString,
                     keyStringBytes,
+                    self.keyFileName(subDirectoryFile.nameAddress, keyPrefixBytes) + directoryString,
                 )
             else:
                 # It's an actual file
-                pName = self.getOriginalFileName(self.nameTable[fileInfo.nameAddress :])
+                pName = self.getOriginalFileName(self.nameTable, fileInfo.nameAddress)
                 filePath = self.directory / pName
 
                 archivedFile = ArchivedFile()
@@ -583,243 +768,222 @@ class DXArchive:
                 archivedFile.dataSize = fileInfo.dataSize
                 archivedFile.pressDataSize = fileInfo.pressDataSize
                 archivedFile.huffPressDataSize = fileInfo.huffPressDataSize
+                archivedFile.time = (fileInfo.time.create, fileInfo.time.lastAccess, fileInfo.time.lastWrite)
 
                 # Create individual file keys
                 if not self.noKey:
                     keyStringBuffer = self.createKeyFileString(
-                        keyString, keyStringBytes, directoryInfo, fileInfo
+                        keyString, keyStringBytes, directoryInfo, fileInfo, directoryString
                     )
                     keyStringBufferBytes = len(keyStringBuffer)
                     lKey = self.keyCreate(
                         keyStringBuffer,
                         keyStringBufferBytes,
-                        bytearray([0] * DXA_KEY_BYTES),
+                        bytearray(DXA_KEY_BYTES),
                     )
                     archivedFile.key = lKey
 
                 self.archivedFiles.append(archivedFile)
 
-            if i == directoryInfo.fileHeadNum - 1:
-                break
-
         # Like going one directory up ../
         self.directory = old_directory
 
-    def getOriginalFileName(self, fileNameTable) -> Path:
-        filename_start_pos = fileNameTable[0] * 4 + 4
-        null_pos = fileNameTable[filename_start_pos:].find(0x0)
-        pName = fileNameTable[filename_start_pos : filename_start_pos + null_pos]
+    def getOriginalFileName(self, fileNameTable, offset: int = 0) -> Path:
+        filename_start_pos = offset + fileNameTable[offset] * 4 + 4
+        null_pos = fileNameTable.find(0x0, filename_start_pos)
+        pName = bytes(fileNameTable[filename_start_pos : null_pos])
         try:
             return Path(pName.decode("utf8"))
         except UnicodeDecodeError:
             return Path(pName.decode("cp932"))  # For Japanese characters
 
+    def keyFileName(self, nameAddress: int, keyPrefixBytes: int) -> bytes:
+        """ The part of a file key that one file or directory name adds (its upper case name) """
+        amount = (DXA_KEY_STRING_MAXLENGTH - 8) - keyPrefixBytes
+        start = nameAddress + 4
+        end = self.nameTable.find(0x0, start)
+        return bytes(self.nameTable[start : start + min(end - start, amount - 1)])
+
     def createKeyFileString(
         self,
         keyString,
         keyStringBytes,
         directory: DARC_DIRECTORY,
         fileHead: DARC_FILEHEAD,
+        directoryString: bytes = None,
     ) -> bytearray:
         # At the end of the day this create a key that is comprised of
         # keyString + FILENAME + PARENT DIRECTORY [ + PARENT PARENT DIRECTORY ]
         # So the key for ./test1/test2/test3/file.txt
         # would be keyStringFILE.TXTTEST3TEST2TEST1
-        fileString = bytearray([0] * DXA_KEY_STRING_MAXLENGTH)
-        # First, set the password string
+        # The directory part is the same for every file of a directory, so directoryDecode()
+        # passes it in instead of having it walked up again for each file.
         if keyString is not None and keyStringBytes != 0:
-            fileString[:keyStringBytes] = keyString[:keyStringBytes]
-            fileString[keyStringBytes] = 0
-            startAddr = keyStringBytes
+            fileString = bytes(keyString[:keyStringBytes])
         else:
-            fileString[0] = 0
-            startAddr = 0
-
-        og_startAddr = startAddr
-
-        fileString[DXA_KEY_STRING_MAXLENGTH - 8 : DXA_KEY_STRING_MAXLENGTH] = bytearray(
-            b"00000000"
-        )
-
-        src = self.nameTable[fileHead.nameAddress + 4 :]
-        amount = (DXA_KEY_STRING_MAXLENGTH - 8) - og_startAddr
-        end_string = min(src.find(0x0), amount - 1)
-        copied = src[:end_string]
-        fileString[startAddr : startAddr + len(copied)] = copied
-        startAddr = startAddr + len(copied)
-
-        if directory.parentDirectoryAddress != 0xFFFFFFFFFFFFFFFF:
-            while True:
-                fileHead = DARC_FILEHEAD(self.fileTable[directory.directoryAddress :])
-                src = self.nameTable[fileHead.nameAddress + 4 :]
-                amount = (DXA_KEY_STRING_MAXLENGTH - 8) - og_startAddr
-                end_string = min(src.find(0x0), amount - 1)
-                copied = src[:end_string]
-                fileString[startAddr : startAddr + len(copied)] = copied
-                startAddr = startAddr + len(copied)
-                directory = DARC_DIRECTORY(
-                    self.directoryTable[directory.parentDirectoryAddress :]
-                )
-                if directory.parentDirectoryAddress == 0xFFFFFFFFFFFFFFFF:
-                    break
-
-        new_key = fileString[:startAddr]
-        return new_key
+            fileString = b""
+
+        if directoryString is None:
+            directoryString = b""
+            if directory.parentDirectoryAddress != 0xFFFFFFFFFFFFFFFF:
+                while True:
+                    dirHead = DARC_FILEHEAD(self.fileTable, directory.directoryAddress)
+                    directoryString += self.keyFileName(dirHead.nameAddress, len(fileString))
+                    directory = DARC_DIRECTORY(
+                        self.directoryTable, directory.parentDirectoryAddress
+                    )
+                    if directory.parentDirectoryAddress == 0xFFFFFFFFFFFFFFFF:
+                        break
 
-    def extractAll(self) -> None:
+        return bytearray(fileString + self.keyFileName(fileHead.nameAddress, len(fileString)) + directoryString)
+
+    def memberName(self, archivedFile: ArchivedFile) -> str:
+        """ Path of a member inside the archive, as used for lookups ("mapdata/map000.mps") """
+        return archivedFile.filePath.relative_to(self.outputPath).as_posix().lower()
+
+    def getMember(self, path) -> ArchivedFile:
+        """ The member at `path` inside the archive (any case and slash style), or None """
+        name = PurePosixPath(str(path).replace("\\", "/")).as_posix().lower()
+        return self.fileIndex.get(name)
+
+    def read_member(self, path) -> bytes:
+        """ Contents of the member at `path`, decoded in memory """
+        archivedFile = self.getMember(path)
+        if archivedFile is None:
+            raise Exception(f"{path} is not in {self.archivePath}")
+        destP = BytesIO()
+        self.writeMember(archivedFile, destP)
+        return destP.getvalue()
+
+    def open_member(self, path) -> BytesIO:
+        """ Read-only file object over the member at `path`; its `name` is the member path """
+        member = BytesIO(self.read_member(path))
+        member.name = str(path)
+        return member
+
+    def matchFiles(self, patterns=None) -> list:
+        """
+        Archived files whose path inside the archive matches one of the glob `patterns`
+        (case-insensitive, e.g. "*.mps" or "BasicData/*.project"); all of them without patterns
+        """
+        if not patterns:
+            return list(self.archivedFiles)
+        patterns = [pattern.lower() for pattern in patterns]
+        matched = []
         for archivedFile in self.archivedFiles:
-            self.extractFile(archivedFile)
+            name = PurePosixPath(self.memberName(archivedFile))
+            if any(name.match(pattern) for pattern in patterns):
+                matched.append(archivedFile)
+        return matched
 
-    def extractFile(self, archivedFile: ArchivedFile) -> None:
-        if not archivedFile.filePath.parent.exists():
-            archivedFile.filePath.parent.mkdir(parents=True)
+    def extractAll(self, patterns=None, jobs=1) -> None:
+        """
+        Extracts every archived file, or only those matching the glob `patterns`.
 
-        destP = open(archivedFile.filePath, mode="wb")
+        With `jobs` > 1 (0 = all CPUs) the files are split over worker processes that
+        each read the archive through their own handle, largest stored size first.
+        """
+        archivedFiles = self.matchFiles(patterns)
+        if jobs == 0:
+            jobs = os.cpu_count() or 1
+        if jobs <= 1 or len(archivedFiles) <= 1:
+            for archivedFile in archivedFiles:
+                self.extractFile(archivedFile)
+            return
 
-        if archivedFile.dataSize != 0:
-            outputSize = archivedFile.dataSize
+        # Hand the next largest member to the least loaded worker
+        jobs = min(jobs, len(archivedFiles))
+        batches = [[] for _ in range(jobs)]
+        loads = [0] * jobs
+        huffmanEncodeKB = self.archiveHead.huffmanEncodeKB
+        for archivedFile in sorted(archivedFiles, key=lambda archivedFile: storedSize(archivedFile, huffmanEncodeKB), reverse=True):
+            worker = loads.index(min(loads))
+            batches[worker].append(archivedFile)
+            loads[worker] += storedSize(archivedFile, huffmanEncodeKB)
+
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(extractFiles, self.archivePath, batch) for batch in batches]
+            for future in futures:
+                future.result()
 
-            if self.fp.tell() != archivedFile.dataStart:
-                self.fp.seek(archivedFile.dataStart, SEEK_SET)
+    def extractFile(self, archivedFile: ArchivedFile) -> None:
+        archivedFile.filePath.parent.mkdir(parents=True, exist_ok=True)
 
-            if archivedFile.compressed:
-                outputSize += archivedFile.pressDataSize
+        with open(archivedFile.filePath, mode="wb") as destP:
+            self.writeMember(archivedFile, destP)
 
-            if archivedFile.huffmanCompressed:
-                outputSize += archivedFile.huffPressDataSize
+    def writeMember(self, archivedFile: ArchivedFile, destP) -> None:
+        """ Decodes a member into the writable file object `destP` """
+        if archivedFile.dataSize == 0:
+            return
 
-            output = bytearray([0] * (outputSize))
+        # Every part of a member is keyed as if it started at key position dataSize
+        dataStart = archivedFile.dataStart
+        position = archivedFile.dataSize
 
-            # If there's huffman compression
-            if archivedFile.huffmanCompressed:
-                keyConvFileReadSize = (
-                    archivedFile.pressDataSize
-                    if archivedFile.compressed
-                    else archivedFile.dataSize
-                )
+        if not archivedFile.compressed and not archivedFile.huffmanCompressed:
+            # Stored as is
+            self.copyData(dataStart, archivedFile.dataSize, destP, archivedFile.key, position)
+            return
 
-                read = self.keyConvFileRead(
-                    output,
-                    archivedFile.huffPressDataSize,
+        # If there's huffman compression
+        if archivedFile.huffmanCompressed:
+            lzSize = (
+                archivedFile.pressDataSize
+                if archivedFile.compressed
+                else archivedFile.dataSize
+            )
+            press = self.readData(
+                dataStart, archivedFile.huffPressDataSize, archivedFile.key, position
+            )
+            huffmanSize = self.archiveHead.huffmanEncodeKB * 1024
+            partial = self.archiveHead.huffmanEncodeKB != 0xFF and lzSize > huffmanSize * 2
+            if partial and not archivedFile.compressed:
+                # Nothing to LZ decode, so the raw middle part is streamed between the two huffman parts
+                lzData = bytearray(huffmanSize * 2)
+                huffman_Decode(press, lzData)
+                del press
+                destP.write(lzData[:huffmanSize])
+                self.copyData(
+                    dataStart + archivedFile.huffPressDataSize,
+                    lzSize - huffmanSize * 2,
+                    destP,
                     archivedFile.key,
-                    archivedFile.dataSize,
+                    position + archivedFile.huffPressDataSize,
                 )
-                output[: len(read)] = read
-
-                (decoded, _) = huffman_Decode(
-                    output, output[archivedFile.huffPressDataSize :]
+                destP.write(lzData[huffmanSize:])
+                return
+
+            lzData = bytearray(lzSize)
+            huffman_Decode(press, lzData)
+            del press
+            if partial:
+                # Only the first and the last huffmanEncodeKB were huffman compressed (decoded back to back),
+                # the middle part follows the huffman data as is
+                lzData[lzSize - huffmanSize :] = lzData[huffmanSize : huffmanSize * 2]
+                lzData[huffmanSize : lzSize - huffmanSize] = self.readData(
+                    dataStart + archivedFile.huffPressDataSize,
+                    lzSize - huffmanSize * 2,
+                    archivedFile.key,
+                    position + archivedFile.huffPressDataSize,
                 )
-                output[archivedFile.huffPressDataSize :] = decoded
-
-                if (
-                    self.archiveHead.huffmanEncodeKB != 0xFF
-                    and keyConvFileReadSize
-                    > self.archiveHead.huffmanEncodeKB * 1024 * 2
-                ):
-                    amount_to_move = self.archiveHead.huffmanEncodeKB * 1024
-                    start_dest = (
-                        archivedFile.huffPressDataSize
-                        + keyConvFileReadSize
-                        - self.archiveHead.huffmanEncodeKB * 1024
-                    )
-                    start_src = (
-                        archivedFile.huffPressDataSize
-                        + self.archiveHead.huffmanEncodeKB * 1024
-                    )
-                    moved_bytes = output[start_src : start_src + amount_to_move]
-                    output[start_dest : start_dest + amount_to_move] = moved_bytes
-
-                    data = self.keyConvFileRead(
-                        output[
-                            archivedFile.huffPressDataSize
-                            + self.archiveHead.huffmanEncodeKB * 1024 :
-                        ],
-                        keyConvFileReadSize
-                        - self.archiveHead.huffmanEncodeKB * 1024 * 2,
-                        archivedFile.key,
-                        archivedFile.dataSize + archivedFile.huffPressDataSize,
-                    )
-                    output[
-                        archivedFile.huffPressDataSize
-                        + self.archiveHead.huffmanEncodeKB * 1024 : len(data)
-                    ] = data
-
-                if archivedFile.compressed:
-                    (decoded, _) = self.decode(
-                        output[archivedFile.huffPressDataSize :],
-                        output[
-                            archivedFile.huffPressDataSize
-                            + archivedFile.pressDataSize :
-                        ],
-                    )
-
-                    output[
-                        archivedFile.huffPressDataSize + archivedFile.pressDataSize :
-                    ] = decoded
-                    destP.write(
-                        output[
-                            archivedFile.huffPressDataSize
-                            + archivedFile.pressDataSize : archivedFile.huffPressDataSize
-                            + archivedFile.pressDataSize
-                            + archivedFile.dataSize
-                        ]
-                    )
-                else:
-                    destP.write(
-                        output[
-                            archivedFile.huffPressDataSize : archivedFile.huffPressDataSize
-                            + archivedFile.dataSize
-                        ]
-                    )
-
-            else:
-                # There's no huffman compression, check for regular compression
-                if archivedFile.compressed:
-                    read = self.keyConvFileRead(
-                        output,
-                        archivedFile.pressDataSize,
-                        archivedFile.key,
-                        archivedFile.dataSize,
-                    )
-                    output[: len(read)] = read
-
-                    (decoded, _) = self.decode(
-                        output, output[archivedFile.pressDataSize :]
-                    )
-                    output[archivedFile.pressDataSize :] = decoded
-
-                    destP.write(
-                        output[
-                            archivedFile.pressDataSize : archivedFile.pressDataSize
-                            + archivedFile.dataSize
-                        ]
-                    )
-                else:
-                    writeSize = 0
-                    while writeSize < archivedFile.dataSize:
-                        if archivedFile.dataSize - writeSize > DXA_BUFFERSIZE:
-                            moveSize = DXA_BUFFERSIZE
-                        else:
-                            moveSize = archivedFile.dataSize - writeSize
-
-                        read = self.keyConvFileRead(
-                            output,
-                            moveSize,
-                            archivedFile.key,
-                            archivedFile.dataSize + writeSize,
-                        )
-                        output[: len(read)] = read
-
-                        destP.write(output[:moveSize])
-
-                        writeSize += moveSize
+        else:
+            lzData = self.readData(
+                dataStart, archivedFile.pressDataSize, archivedFile.key, position
+            )
 
-        destP.close()
+        if archivedFile.compressed:
+            (lzData, _) = self.decode(lzData, bytearray(archivedFile.dataSize))
 
+        destP.write(lzData)
 
-    def encode(src, dest=None):
+    def encode(self, src, dest=None, level='default'):
         """
         LZ compression function for DXArchive
+
+        Matches are found through hash chains over 4-byte prefixes; `level` picks
+        one of ENCODE_LEVELS to trade speed for ratio
         """
         srcsize = len(src)
 
@@ -827,437 +991,563 @@ class DXArchive:
             # Just calculate the size
             return srcsize + (srcsize // 8) + 9
 
-        # Find a character that appears least in the source data for use as an escape character
-        keycode = 0
-        keycodecount = 0xffffffff
-
-        # Count occurrences of each byte value
-        count = [0] * 256
-        for i in range(srcsize):
-            count[src[i]] += 1
+        if not isinstance(src, bytes):
+            src = bytes(src)
+        depth, window, nice, lazy = self.ENCODE_LEVELS[level]
+        window = min(window, self.MAX_POSITION)
 
-        # Find the least common byte value
-        for i in range(256):
-            if count[i] < keycodecount:
-                keycode = i
-                keycodecount = count[i]
+        # The least common byte value becomes the escape character
+        counts = [src.count(i) for i in range(256)]
+        keycode = counts.index(min(counts))
+        escaped = bytes([keycode, keycode])
 
         # Write header
         dest[0:4] = struct.pack("I", srcsize)
-        dest[4:8] = struct.pack("I", 0)  # Will be filled in later
         dest[8] = keycode
 
+        # head: most recent position of each 4-byte prefix, prev: the previous
+        # position with the same prefix, kept for the last `ring` positions
+        head = {}
+        ring = max(1, min(window, srcsize))
+        prev = array('l', [-1]) * ring
+        MIN_COMPRESS = self.MIN_COMPRESS
+        MAX_COPYSIZE = self.MAX_COPYSIZE
+        last = srcsize - MIN_COMPRESS  # last position a match can start at
+
+        def insert(pos):
+            key = src[pos:pos + MIN_COMPRESS]
+            prev[pos % ring] = head.get(key, -1)
+            head[key] = pos
+
+        def find(pos):
+            """ Returns (length, distance) of the longest match for `pos` found within `depth` candidates """
+            best_len = MIN_COMPRESS - 1
+            best_dist = 0
+            limit = min(MAX_COPYSIZE, srcsize - pos)
+            cand = head.get(src[pos:pos + MIN_COMPRESS], -1)
+            tries = depth
+            while cand >= 0 and tries:
+                dist = pos - cand
+                if dist > window:
+                    break
+                if best_len < limit and src[cand + best_len] == src[pos + best_len]:
+                    n = MIN_COMPRESS
+                    while n + 32 <= limit and src[cand + n:cand + n + 32] == src[pos + n:pos + n + 32]:
+                        n += 32
+                    while n < limit and src[cand + n] == src[pos + n]:
+                        n += 1
+                    if n > best_len:
+                        best_len = n
+                        best_dist = dist
+                        if n >= nice:
+                            break
+                nxt = prev[cand % ring]
+                if nxt >= cand:  # slot reused by a newer position
+                    break
+                cand = nxt
+                tries -= 1
+            if best_dist == 0:
+                return 0, 0
+            # a token must not take more room than the bytes it replaces
+            index = best_dist - 1
+            cost = 2 + (best_len - MIN_COMPRESS > 0x1f) + (1 if index <= 0xff else 2 if index <= 0xffff else 3)
+            if best_len < cost:
+                return 0, 0
+            return best_len, best_dist
+
         dp = 9  # Destination pointer
         sp = 0  # Source pointer
+        lit = 0  # Start of the pending literal run
 
-        # Process the source data
-        while sp < srcsize:
-            # If the current byte is the keycode, we need to escape it
-            if src[sp] == keycode:
-                dest[dp] = keycode
-                dp += 1
-                dest[dp] = keycode
-                dp += 1
+        while sp <= last:
+            matchlen, dist = find(sp)
+            insert(sp)
+            if matchlen and lazy and sp < last and find(sp + 1)[0] > matchlen:
+                # a longer match starts at the next byte; leave this one as a literal
+                sp += 1
+                continue
+            if not matchlen:
                 sp += 1
                 continue
 
-            # Try to find a match
-            maxlen = 0
-            maxpos = 0
-
-            # Look back for matches up to MAX_POSITION
-            searchlen = min(sp, self.MAX_POSITION)
-            for i in range(1, searchlen + 1):
-                pos = sp - i
-                # Check how many bytes match
-                matchlen = 0
-                while sp + matchlen < srcsize and src[pos + matchlen] == src[sp + matchlen]:
-                    matchlen += 1
-                    if matchlen >= self.MAX_COPYSIZE:
-                        break
-                    if pos + matchlen >= sp:
-                        # Don't go beyond current position
-                        break
-
-                if matchlen > maxlen:
-                    maxlen = matchlen
-                    maxpos = i
-
-            # If we found a good match, encode it
-            if maxlen >= self.MIN_COMPRESS:
-                # Calculate the code value
-                code = 0
-                index = maxpos - 1
-
-                # Determine index size
-                if index <= 0xff:
-                    indexsize = 0
-                elif index <= 0xffff:
-                    indexsize = 1
-                else:
-                    indexsize = 2
-
-                # Set the combo size
-                conbo = maxlen - self.MIN_COMPRESS
-
-                # Create the code
-                code = (conbo << 3) | indexsize
-
-                # If the code value is the keycode or larger, increment it
-                if code >= keycode:
-                    code += 1
-
-                # Write the escape code and the LZ code
-                dest[dp] = keycode
-                dp += 1
-                dest[dp] = code
+            # Flush the literals before the match, escaping the keycode
+            if lit < sp:
+                run = src[lit:sp].replace(escaped[:1], escaped)
+                dest[dp:dp + len(run)] = run
+                dp += len(run)
+
+            index = dist - 1
+            indexsize = 0 if index <= 0xff else 1 if index <= 0xffff else 2
+            conbo = matchlen - MIN_COMPRESS
+            code = ((conbo & 0x1f) << 3) | indexsize
+            if conbo > 0x1f:
+                code |= 0x1 << 2
+            # Codes from the keycode on are shifted up so they never read as an escaped literal
+            if code >= keycode:
+                code += 1
+            dest[dp] = keycode
+            dest[dp + 1] = code
+            dp += 2
+            if conbo > 0x1f:
+                dest[dp] = conbo >> 5
                 dp += 1
+            dest[dp:dp + indexsize + 1] = index.to_bytes(indexsize + 1, 'little')
+            dp += indexsize + 1
 
-                # Write the index value based on size
-                if indexsize == 0:
-                    dest[dp] = index & 0xff
-                    dp += 1
-                elif indexsize == 1:
-                    dest[dp:dp+2] = struct.pack("H", index)
-                    dp += 2
-                elif indexsize == 2:
-                    dest[dp:dp+2] = struct.pack("H", index & 0xffff)
-                    dp += 2
-                    dest[dp] = (index >> 16) & 0xff
-                    dp += 1
-
-                sp += maxlen
-            else:
-                # Just copy the byte as is
-                dest[dp] = src[sp]
-                dp += 1
-                sp += 1
+            # Index the positions inside the match, up to `nice` of them
+            end = sp + matchlen
+            for pos in range(sp + 1, min(end, last + 1, sp + nice)):
+                insert(pos)
+            sp = lit = end
+
+        if lit < srcsize:
+            run = src[lit:].replace(escaped[:1], escaped)
+            dest[dp:dp + len(run)] = run
+            dp += len(run)
 
         # Update the compressed size in the header
         dest[4:8] = struct.pack("I", dp)
 
         return dp
 
-    def create_archive(self, output_path, input_files, key_string=None, use_compression=True, use_huffman=True):
+    def create_archive(self, output_path, input_files, key_string=None, use_compression=True, use_huffman=True,
+                       level='default', dedup=False, jobs=1):
         """
-        Create a DXArchive from a list of files
+        Create a DXArchive from a list of files.
+        Each entry is either a path, stored under that same (relative) path, or a (path inside the archive, path) pair.
+        With `dedup` files with the same contents are compressed once; without a key they also share their data.
+        With `jobs` > 1 (0 = all CPUs) files are compressed by worker processes, see writeMembers().
         """
-        if key_string is None:
-            key_string = defaultKeyString
-            self.noKey = True
-        else:
-            self.noKey = False
+        self.beginArchive(key_string, DXA_CHARCODEFORMAT_SHIFTJIS, 0x10 if use_huffman else 0)  # 16KB
+        members = self.buildTables(self.collectMembers(input_files))
+        self.storedContents = {} if dedup else None  # sha256 of the file -> where and how it was stored
 
-        key = self.keyCreate(key_string, len(key_string), bytearray([0] * DXA_KEY_BYTES))
+        with open(output_path, "w+b") as self.output_fp:
+            # The data comes first, the header is written last
+            self.output_fp.write(bytearray(len(DARC_HEAD())))
+            self.writeMembers(members, use_compression, use_huffman, level, jobs)
+            self.writeTables(level)
 
-        # Open output file
-        self.output_fp = open(output_path, "wb")
+        return True
+
+    def add_to_archive(self, archive_path, files_to_add, key_string=None, use_compression=True, use_huffman=True,
+                       level='default', in_place=True):
+        """
+        Add files to an existing archive, replacing the members with the same path.
+        Files are given like for create_archive() and only they are compressed. With `in_place` their data and
+        the new tables are appended to the archive and the header is rewritten last, so the archive stays valid
+        until then (what replaced members and the old tables took up is left unused). Otherwise the archive is
+        rewritten with the stored data of the other members copied over as is.
+        """
+        archive_path = Path(archive_path)
+        if not self.loadArchive(archive_path, Path("."), None if key_string is None else bytearray(key_string)):
+            print(f"Failed to load archive {archive_path}")
+            return False
+
+        oldHead = self.archiveHead
+        oldNames = self.nameEntries()
+        added = self.collectMembers(files_to_add)
+        addedNames = {member["name"].lower() for member in added}
+        members = [
+            {
+                "name": archivedFile.filePath.relative_to(self.outputPath).as_posix(),
+                "archived": archivedFile,
+                "time": archivedFile.time,
+            }
+            for archivedFile in self.archivedFiles
+            if self.memberName(archivedFile) not in addedNames
+        ]
+
+        self.beginArchive(None if self.noKey else self.keyString, oldHead.charCodeFormat, oldHead.huffmanEncodeKB)
+        self.storedContents = None
+        self.archiveHead.dataStartAddress = oldHead.dataStartAddress
+        members = self.buildTables(members + added, oldNames)
+
+        if in_place:
+            self.unmapArchive()
+            self.fp.close()
+            with open(archive_path, "r+b") as self.output_fp:
+                # New data goes after the old tables, which the old header keeps pointing at until the end
+                self.output_fp.seek(0, SEEK_END)
+                for member in members:
+                    archivedFile = member.get("archived")
+                    if archivedFile is None:
+                        self.writeNewMember(member, use_compression, use_huffman, level)
+                    else:
+                        self.setFileHead(member, archivedFile.dataStart - oldHead.dataStartAddress, archivedFile)
+                self.writeTables(level)
+            return True
+
+        tempPath = archive_path.with_name(archive_path.name + ".tmp")
+        with open(tempPath, "wb") as self.output_fp:
+            self.output_fp.write(bytearray(self.archiveHead.dataStartAddress))
+            for member in members:
+                archivedFile = member.get("archived")
+                if archivedFile is None:
+                    self.writeNewMember(member, use_compression, use_huffman, level)
+                else:
+                    self.setFileHead(member, self.output_fp.tell() - self.archiveHead.dataStartAddress, archivedFile)
+                    self.copyData(archivedFile.dataStart, storedSize(archivedFile, oldHead.huffmanEncodeKB), self.output_fp)
+            self.writeTables(level)
+        self.unmapArchive()
+        self.fp.close()
+        os.replace(tempPath, archive_path)
+        return True
+
+    def beginArchive(self, key_string, charCodeFormat: int, huffmanEncodeKB: int) -> None:
+        """ Starts the header of a new archive. Without `key_string` it isn't keyed (DXA_FLAG_NO_KEY) """
+        self.noKey = key_string is None
+        self.keyString = bytearray(defaultKeyString if self.noKey else key_string[:DXA_KEY_STRING_LENGTH])
+        self.key = self.keyCreate(bytearray(self.keyString), len(self.keyString), bytearray(DXA_KEY_BYTES))
 
-        # Initialize archive header
         self.archiveHead = DARC_HEAD()
         self.archiveHead.head = DXA_HEAD
         self.archiveHead.version = DXA_VER
         self.archiveHead.headSize = 0  # To be filled in later
-        self.archiveHead.dataStartAddress = 0  # To be filled in later
-        self.archiveHead.fileNameTableStartAddress = len(DARC_HEAD())
+        self.archiveHead.dataStartAddress = len(DARC_HEAD())
+        self.archiveHead.fileNameTableStartAddress = 0  # To be filled in later
         self.archiveHead.fileTableStartAddress = 0  # To be filled in later
         self.archiveHead.directoryTableStartAddress = 0  # To be filled in later
-        self.archiveHead.charCodeFormat = 0  # UTF-8
+        self.archiveHead.charCodeFormat = charCodeFormat
         self.archiveHead.flags = DXA_FLAG_NO_KEY if self.noKey else 0
-        self.archiveHead.huffmanEncodeKB = 0 if not use_huffman else 0x10  # 16KB
-
-        # Write placeholder header
-        self.output_fp.write(bytearray(len(DARC_HEAD())))
-
-        # Build file structure
-        file_list = []
-        dir_structure = {}
-
-        # Add root directory
-        root_dir = {
-            'name': '',
-            'files': [],
-            'dirs': {},
-            'parent': None,
-            'address': 0
-        }
-        dir_structure['/'] = root_dir
+        self.archiveHead.huffmanEncodeKB = huffmanEncodeKB
+        self.archiveHead.reserve = bytes(14)
 
-        # Process input files
-        for file_path in input_files:
-            # Convert to Path object if it's a string
-            if isinstance(file_path, str):
-                file_path = Path(file_path)
+    def collectMembers(self, input_files) -> list:
+        """ Members of a new archive (dicts with the path inside the archive, the file and its times) """
+        members = {}
+        for entry in input_files:
+            name, file_path = entry if isinstance(entry, tuple) else (entry, entry)
+            file_path = Path(file_path)
 
             # Skip if file doesn't exist
-            if not file_path.exists():
+            if not file_path.is_file():
                 print(f"Warning: {file_path} does not exist, skipping")
                 continue
 
-            # Get file stats
             stats = file_path.stat()
-
-            # Create file entry
-            file_entry = {
-                'path': file_path,
-                'name': file_path.name,
-                'size': stats.st_size,
-                'create_time': int(stats.st_ctime),
-                'access_time': int(stats.st_atime),
-                'modify_time': int(stats.st_mtime),
-                'is_dir': file_path.is_dir()
+            name = PurePosixPath(str(name).replace("\\", "/")).as_posix().lstrip("/")
+            members[name.lower()] = {
+                "name": name,
+                "path": file_path,
+                "time": (fileTime(stats.st_ctime), fileTime(stats.st_atime), fileTime(stats.st_mtime)),
             }
+        return list(members.values())
+
+    def nameEntries(self) -> dict:
+        """ The entries of the loaded name table by name, so rewritten tables keep them byte for byte """
+        entries = {}
+        address = 0
+        while address + 4 <= len(self.nameTable):
+            length = struct.unpack_from("H", self.nameTable, address)[0]
+            if length == 0:
+                break
+            entry = bytes(self.nameTable[address : address + 4 + length * 8])
+            entries.setdefault(str(self.getOriginalFileName(self.nameTable, address)), entry)
+            address += len(entry)
+        return entries
+
+    def nameEntry(self, name: str) -> bytes:
+        """ Name table entry: length / 4, parity, then the upper case name and the name, each padded to the length """
+        encoding = "utf-8" if self.archiveHead.charCodeFormat == DXA_CHARCODEFORMAT_UTF8 else "cp932"
+        raw = name.encode(encoding)
+        upper = "".join(c.upper() if "a" <= c <= "z" else c for c in name).encode(encoding)
+        length = (len(raw) + 1 + 3) // 4
+        return (
+            struct.pack("HH", length, sum(upper) & 0xFFFF)
+            + upper.ljust(length * 4, b"\0")
+            + raw.ljust(length * 4, b"\0")
+        )
 
-            # Determine directory path
-            dir_path = str(file_path.parent).replace('\\', '/')
-            if not dir_path.startswith('/'):
-                dir_path = '/' + dir_path
-
-            # Create directory structure if needed
-            current_dir = '/'
-            for part in dir_path.split('/'):
-                if not part:
-                    continue
-
-                next_dir = current_dir + part + '/'
-                if next_dir not in dir_structure:
-                    dir_structure[next_dir] = {
-                        'name': part,
-                        'files': [],
-                        'dirs': {},
-                        'parent': current_dir,
-                        'address': 0
-                    }
-                    dir_structure[current_dir]['dirs'][part] = next_dir
-
-                current_dir = next_dir
-
-            # Add file to directory
-            dir_structure[current_dir]['files'].append(file_entry)
-            file_list.append(file_entry)
-
-        # Build name table, file table, and directory table
-        name_table = bytearray()
-        file_table = bytearray()
-        directory_table = bytearray()
-
-        # Add names to name table and track their addresses
-        name_addresses = {}
-
-        def add_name(name):
-            if name in name_addresses:
-                return name_addresses[name]
-
-            # Store the name in UTF-8
-            encoded_name = name.encode('utf-8')
-            # Format: size (4 bytes) + string + null terminator
-            entry = struct.pack("I", len(encoded_name)) + encoded_name + b'\x00'
-            addr = len(name_table)
-            name_table.extend(entry)
-            name_addresses[name] = addr
-            return addr
-
-        # Process directories
-        dir_addresses = {}
-        file_head_addresses = {}
-
-        # First pass: assign addresses to directories
-        for dir_path, dir_info in dir_structure.items():
-            dir_addresses[dir_path] = len(directory_table)
-            # Placeholder for directory structure
-            directory_table.extend(bytearray(len(DARC_DIRECTORY())))
-
-        # Second pass: fill in directory structures
-        for dir_path, dir_info in dir_structure.items():
-            dir_addr = dir_addresses[dir_path]
-
-            # Create directory entry
-            directory_entry = DARC_DIRECTORY()
-
-            # Set name address
-            if dir_info['name']:
-                name_addr = add_name(dir_info['name'])
-                directory_entry.directoryAddress = name_addr
-            else:
-                directory_entry.directoryAddress = 0xFFFFFFFFFFFFFFFF
+    def buildTables(self, members: list, nameEntries: dict = None) -> list:
+        """
+        Lays out the name, file and directory tables of `members` (from collectMembers()) and returns them
+        in file table order, each with the address of its file head and of its directory. Data addresses
+        and sizes are filled in with setFileHead() once the data is written.
+        `nameEntries` are name table entries to reuse (see nameEntries()).
+        """
+        nameEntries = nameEntries or {}
+
+        # directory -> (subdirectories, members); parents always come before their subdirectories.
+        # Paths are matched ignoring case like the DX library does, the first spelling is kept.
+        tree = {"": ([], [])}
+        directoryNames = {"": ""}
+        for member in sorted(members, key=lambda member: member["name"].upper()):
+            directory = ""
+            for part in member["name"].split("/")[:-1]:
+                subdirectory = f"{directory}/{part.lower()}" if directory else part.lower()
+                if subdirectory not in tree:
+                    tree[subdirectory] = ([], [])
+                    tree[directory][0].append(subdirectory)
+                    directoryNames[subdirectory] = part
+                directory = subdirectory
+            tree[directory][1].append(member)
+
+        nameTable = bytearray()
+        nameAddresses = {}
+
+        def addName(name):
+            if name not in nameAddresses:
+                nameAddresses[name] = len(nameTable)
+                nameTable.extend(nameEntries.get(name) or self.nameEntry(name))
+            return nameAddresses[name]
+
+        directoryAddresses = {directory: i * len(DARC_DIRECTORY()) for i, directory in enumerate(tree)}
+        directoryTable = bytearray(len(tree) * len(DARC_DIRECTORY()))
+        # The file table starts with the file head of the root directory
+        fileTable = bytearray(struct.pack(
+            "QQQQQQQQQ", addName(""), FILE_ATTRIBUTE_DIRECTORY, 0, 0, 0, 0, 0, 0xFFFFFFFFFFFFFFFF, 0xFFFFFFFFFFFFFFFF
+        ))
+        headAddresses = {"": 0}
+        ordered = []
+
+        for directory, (subdirectories, files) in tree.items():
+            fileHeadAddress = len(fileTable)
+            for subdirectory in subdirectories:
+                headAddresses[subdirectory] = len(fileTable)
+                fileTable.extend(struct.pack(
+                    "QQQQQQQQQ",
+                    addName(directoryNames[subdirectory]),
+                    FILE_ATTRIBUTE_DIRECTORY,
+                    0, 0, 0,
+                    directoryAddresses[subdirectory],
+                    0,
+                    0xFFFFFFFFFFFFFFFF,
+                    0xFFFFFFFFFFFFFFFF,
+                ))
+            for member in files:
+                member["head"] = len(fileTable)
+                member["directory"] = directoryAddresses[directory]
+                fileTable.extend(struct.pack(
+                    "QQQQQQQQQ",
+                    addName(member["name"].rsplit("/", 1)[-1]),
+                    FILE_ATTRIBUTE_ARCHIVE,
+                    *member["time"],
+                    0,  # To be filled in later
+                    0,
+                    0xFFFFFFFFFFFFFFFF,
+                    0xFFFFFFFFFFFFFFFF,
+                ))
+                ordered.append(member)
 
-            # Set parent directory address
-            if dir_info['parent'] is not None:
-                directory_entry.parentDirectoryAddress = dir_addresses[dir_info['parent']]
-            else:
-                directory_entry.parentDirectoryAddress = 0xFFFFFFFFFFFFFFFF
+            parent = directory.rsplit("/", 1)[0] if "/" in directory else ""
+            struct.pack_into(
+                "QQQQ",
+                directoryTable,
+                directoryAddresses[directory],
+                headAddresses[directory],
+                0xFFFFFFFFFFFFFFFF if directory == "" else directoryAddresses[parent],
+                len(subdirectories) + len(files),
+                fileHeadAddress,
+            )
 
-            # Set file head info
-            file_head_addr = len(file_table)
-            file_head_addresses[dir_path] = file_head_addr
-            directory_entry.fileHeadNum = len(dir_info['files']) + len(dir_info['dirs'])
-            directory_entry.fileHeadAddress = file_head_addr
+        self.nameTable = nameTable
+        self.fileTable = fileTable
+        self.directoryTable = directoryTable
+        return ordered
+
+    def setFileHead(self, member: dict, dataAddress: int, sizes) -> None:
+        """ Fills in where the data of `member` is and its sizes (an ArchivedFile or dataSize, pressDataSize, huffPressDataSize) """
+        if isinstance(sizes, ArchivedFile):
+            sizes = (sizes.dataSize, sizes.pressDataSize, sizes.huffPressDataSize)
+        struct.pack_into("QQQQ", self.fileTable, member["head"] + 40, dataAddress, *sizes)
+
+    def memberKey(self, member: dict) -> bytearray:
+        """ Key of a member of the archive being written, None if it isn't keyed """
+        if self.noKey:
+            return None
+        keyStringBuffer = self.createKeyFileString(
+            self.keyString,
+            len(self.keyString),
+            DARC_DIRECTORY(self.directoryTable, member["directory"]),
+            DARC_FILEHEAD(self.fileTable, member["head"]),
+        )
+        return self.keyCreate(keyStringBuffer, len(keyStringBuffer), bytearray(DXA_KEY_BYTES))
 
-            # Update directory table
-            directory_bytes = struct.pack(
-                "QQQQ",
-                directory_entry.directoryAddress,
-                directory_entry.parentDirectoryAddress,
-                directory_entry.fileHeadNum,
-                directory_entry.fileHeadAddress
+    def storeMember(self, data, key: bytearray, use_compression=True, use_huffman=True, level='default') -> tuple:
+        """
+        How `data` is stored in the archive: (stored bytes, pressDataSize, huffPressDataSize).
+        Huffman compression covers the first and last huffmanEncodeKB of the (LZ compressed) data, or all
+        of it if huffmanEncodeKB is 0xFF; the middle part follows as is. All of it is keyed from position dataSize.
+        """
+        dataSize = len(data)
+        pressDataSize = 0xFFFFFFFFFFFFFFFF
+        huffPressDataSize = 0xFFFFFFFFFFFFFFFF
+        stored = data
+
+        # Apply compression if requested and file is large enough
+        if use_compression and dataSize > self.MIN_COMPRESS:
+            lzBuffer = bytearray(self.encode(data))
+            lzSize = self.encode(data, lzBuffer, level)
+            if lzSize < dataSize:
+                pressDataSize = lzSize
+                stored = lzBuffer[:lzSize]
+
+        huffmanEncodeKB = self.archiveHead.huffmanEncodeKB
+        if use_huffman and huffmanEncodeKB != 0 and len(stored) != 0:
+            huffmanSize = huffmanEncodeKB * 1024
+            if huffmanEncodeKB != 0xFF and len(stored) > huffmanSize * 2:
+                huffmanData = stored[:huffmanSize] + stored[-huffmanSize:]
+                middle = stored[huffmanSize:-huffmanSize]
+            else:
+                huffmanData = stored
+                middle = b""
+            (press, pressSize) = huffman_Encode(huffmanData, len(huffmanData), bytearray())
+            if pressSize < len(huffmanData):
+                huffPressDataSize = pressSize
+                stored = press + middle
+
+        stored = bytearray(stored)
+        if key is not None:
+            self.keyConv(stored, len(stored), dataSize, key)
+        return (stored, pressDataSize, huffPressDataSize)
+
+    def storeFile(self, path, name: str, key: bytearray, use_compression=True, use_huffman=True, level='default') -> tuple:
+        """ storeMember() of the file at `path`: (dataSize, stored bytes, pressDataSize, huffPressDataSize) """
+        with open(path, "rb") as f:
+            data = f.read()
+        # Media that is compressed already is stored as is instead of going through the encoders
+        compressible = (use_compression or use_huffman) and isCompressible(name, data)
+        return (len(data),) + self.storeMember(
+            data, key, use_compression and compressible, use_huffman and compressible, level
+        )
+
+    def streamMember(self, f, name: str, dataSize: int, key: bytearray, use_huffman=True) -> tuple:
+        """
+        Writes the open file `f` at the current position of output_fp in DXA_BUFFERSIZE pieces: (pressDataSize, huffPressDataSize).
+        Only the first and last huffmanEncodeKB can be compressed (by huffman), so memory use doesn't depend on the size of the file.
+        """
+        huffmanEncodeKB = self.archiveHead.huffmanEncodeKB
+        huffmanSize = huffmanEncodeKB * 1024
+        if use_huffman and huffmanEncodeKB not in (0, 0xFF) and dataSize > huffmanSize * 2:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                compressible = isCompressible(name, data)
+                huffmanData = data[:huffmanSize] + data[dataSize - huffmanSize : dataSize]
+            (press, pressSize) = huffman_Encode(huffmanData, len(huffmanData), bytearray()) if compressible else (None, 0)
+            if compressible and pressSize < len(huffmanData):
+                self.output_fp.write(self.keyConv(bytearray(press), pressSize, dataSize, key))
+                self.copyData(huffmanSize, dataSize - huffmanSize * 2, self.output_fp, key, dataSize + pressSize, f)
+                return (0xFFFFFFFFFFFFFFFF, pressSize)
+
+        self.copyData(0, dataSize, self.output_fp, key, dataSize, f)
+        return (0xFFFFFFFFFFFFFFFF, 0xFFFFFFFFFFFFFFFF)
+
+    def writeNewMember(self, member: dict, use_compression=True, use_huffman=True, level='default', future=None) -> None:
+        """
+        Compresses and keys the file of `member` and writes it at the current position of output_fp.
+        With storedContents (see create_archive) files already written are not compressed again.
+        `future` is storeFile() for the member run by writeMembers() in a worker process.
+        """
+        key = self.memberKey(member)
+        dataSize = member["path"].stat().st_size
+        digest = member.get("digest")
+        if digest is None and self.storedContents is not None:
+            digest = fileDigest(member["path"])
+        dataAddress = self.output_fp.tell() - self.archiveHead.dataStartAddress
+
+        if digest in (self.storedContents or ()):
+            (storedAddress, storedSize, pressDataSize, huffPressDataSize, storedKey) = self.storedContents[digest]
+            if storedKey == key:
+                # Not keyed: both file heads point at the same data
+                self.setFileHead(member, storedAddress, (dataSize, pressDataSize, huffPressDataSize))
+                return
+            # The same data under another key, at the same key position (dataSize): re-key the stored copy
+            self.output_fp.flush()
+            with open(self.output_fp.name, "rb") as srcP:
+                self.copyData(
+                    self.archiveHead.dataStartAddress + storedAddress,
+                    storedSize,
+                    self.output_fp,
+                    bytes(a ^ b for a, b in zip(storedKey, key)),
+                    dataSize,
+                    srcP,
+                )
+        elif future is not None or dataSize <= DXA_STREAM_SIZE:
+            (dataSize, stored, pressDataSize, huffPressDataSize) = (
+                self.storeFile(member["path"], member["name"], key, use_compression, use_huffman, level)
+                if future is None
+                else future.result()
             )
-            directory_table[dir_addr:dir_addr+len(directory_bytes)] = directory_bytes
-
-            # Add file entries to file table
-            for subdir_name, subdir_path in dir_info['dirs'].items():
-                # Create file head for subdirectory
-                file_head = DARC_FILEHEAD()
-                file_head.nameAddress = add_name(subdir_name)
-                file_head.attributes = FILE_ATTRIBUTE_DIRECTORY
-                file_head.time = DARC_FILETIME()
-                file_head.dataAddress = dir_addresses[subdir_path]
-                file_head.dataSize = 0xFFFFFFFFFFFFFFFF
-                file_head.pressDataSize = 0xFFFFFFFFFFFFFFFF
-                file_head.huffPressDataSize = 0xFFFFFFFFFFFFFFFF
-
-                # Add to file table
-                file_table.extend(struct.pack(
-                    "QQQQQQQQQ",
-                    file_head.nameAddress,
-                    file_head.attributes,
-                    0,  # time.create
-                    0,  # time.lastAccess
-                    0,  # time.lastWrite
-                    file_head.dataAddress,
-                    file_head.dataSize,
-                    file_head.pressDataSize,
-                    file_head.huffPressDataSize
-                ))
+            self.output_fp.write(stored)
+        else:
+            with open(member["path"], "rb") as f:
+                (pressDataSize, huffPressDataSize) = self.streamMember(f, member["name"], dataSize, key, use_huffman)
 
-        # Data section starts after the header
-        data_section_start = len(DARC_HEAD())
-        data_pos = data_section_start
-
-        # Process files and add their data
-        for dir_path, dir_info in dir_structure.items():
-            for file_entry in dir_info['files']:
-                if file_entry['is_dir']:
-                    continue
-
-                # Create file head
-                file_head = DARC_FILEHEAD()
-                file_head.nameAddress = add_name(file_entry['name'])
-                file_head.attributes = 0  # Regular file
-                file_head.time = DARC_FILETIME()
-                file_head.time.create = file_entry['create_time']
-                file_head.time.lastAccess = file_entry['access_time']
-                file_head.time.lastWrite = file_entry['modify_time']
-
-                # Read file data
-                with open(file_entry['path'], 'rb') as f:
-                    file_data = f.read()
-
-                # Store original data size
-                file_head.dataSize = len(file_data)
-                file_head.dataAddress = data_pos
-
-                # Apply compression if requested and file is large enough
-                if use_compression and len(file_data) > self.MIN_COMPRESS:
-                    # LZ compression
-                    lz_buffer_size = len(file_data) + (len(file_data) // 8) + 9
-                    lz_buffer = bytearray(lz_buffer_size)
-                    compressed_size = self.encode(file_data, lz_buffer)
-
-                    if compressed_size < len(file_data):
-                        file_head.pressDataSize = compressed_size
-                        compressed_data = lz_buffer[:compressed_size]
-
-                        # Apply Huffman compression if requested
-                        if use_huffman and hasattr(self, 'huffman_Encode'):
-                            huffman_buffer = bytearray(compressed_size * 2)  # Estimate
-                            huffman_size = huffman_Encode(compressed_data, huffman_buffer)
-
-                            if huffman_size < compressed_size:
-                                file_head.huffPressDataSize = huffman_size
-                                final_data = huffman_buffer[:huffman_size]
-                            else:
-                                file_head.huffPressDataSize = 0xFFFFFFFFFFFFFFFF
-                                final_data = compressed_data
-                        else:
-                            file_head.huffPressDataSize = 0xFFFFFFFFFFFFFFFF
-                            final_data = compressed_data
-                    else:
-                        file_head.pressDataSize = 0xFFFFFFFFFFFFFFFF
-                        file_head.huffPressDataSize = 0xFFFFFFFFFFFFFFFF
-                        final_data = file_data
-                else:
-                    file_head.pressDataSize = 0xFFFFFFFFFFFFFFFF
-                    file_head.huffPressDataSize = 0xFFFFFFFFFFFFFFFF
-                    final_data = file_data
+        self.setFileHead(member, dataAddress, (dataSize, pressDataSize, huffPressDataSize))
+        if digest is not None and digest not in self.storedContents:
+            storedSize = self.output_fp.tell() - self.archiveHead.dataStartAddress - dataAddress
+            self.storedContents[digest] = (dataAddress, storedSize, pressDataSize, huffPressDataSize, key)
 
-                # Encrypt data if key is provided
-                if not self.noKey:
-                    # Create file-specific key
-                    key_string_buffer = self.createKeyFileString(
-                        key_string, 
-                        len(key_string),
-                        DARC_DIRECTORY(directory_table[dir_addresses[dir_path]:]),
-                        file_head
-                    )
-                    file_key = self.keyCreate(
-                        key_string_buffer,
-                        len(key_string_buffer),
-                        bytearray([0] * DXA_KEY_BYTES)
-                    )
-                    final_data = self.keyConv(final_data, len(final_data), 0, file_key)
+    def writeMembers(self, members: list, use_compression=True, use_huffman=True, level='default', jobs=1) -> None:
+        """
+        writeNewMember() for each of `members`, in order.
 
-                # Write data to file
-                data_pos += len(final_data)
+        With `jobs` > 1 (0 = all CPUs) worker processes compress the files up to DXA_STREAM_SIZE, at most
+        two per worker ahead of the member being written, so the archive comes out the same as with one job.
+        """
+        if jobs == 0:
+            jobs = os.cpu_count() or 1
+        if jobs <= 1 or len(members) <= 1:
+            for member in members:
+                self.writeNewMember(member, use_compression, use_huffman, level)
+            return
 
-                # Add to file table
-                file_table.extend(struct.pack(
-                    "QQQQQQQQQ",
-                    file_head.nameAddress,
-                    file_head.attributes,
-                    file_head.time.create,
-                    file_head.time.lastAccess,
-                    file_head.time.lastWrite,
-                    file_head.dataAddress,
-                    file_head.dataSize,
-                    file_head.pressDataSize,
-                    file_head.huffPressDataSize
-                ))
+        from concurrent.futures import ProcessPoolExecutor
+        futures = {}
+        digests = set()
+        queued = 0
+        with ProcessPoolExecutor(max_workers=min(jobs, len(members))) as pool:
+            for index, member in enumerate(members):
+                while queued < len(members) and len(futures) < jobs * 2:
+                    ahead = members[queued]
+                    if self.storedContents is not None:
+                        # Only the first file with some contents is compressed
+                        ahead["digest"] = fileDigest(ahead["path"])
+                        if ahead["digest"] in digests:
+                            queued += 1
+                            continue
+                        digests.add(ahead["digest"])
+                    if ahead["path"].stat().st_size <= DXA_STREAM_SIZE:
+                        futures[queued] = pool.submit(
+                            storeFile,
+                            self.archiveHead.huffmanEncodeKB,
+                            ahead["path"],
+                            ahead["name"],
+                            self.memberKey(ahead),
+                            use_compression,
+                            use_huffman,
+                            level,
+                        )
+                    queued += 1
+                self.writeNewMember(member, use_compression, use_huffman, level, futures.pop(index, None))
 
-        # Update header with table addresses
-        self.archiveHead.fileNameTableStartAddress = len(DARC_HEAD())
-        self.archiveHead.fileTableStartAddress = self.archiveHead.fileNameTableStartAddress + len(name_table)
-        self.archiveHead.directoryTableStartAddress = self.archiveHead.fileTableStartAddress + len(file_table)
-        self.archiveHead.dataStartAddress = self.archiveHead.directoryTableStartAddress + len(directory_table)
+    def writeTables(self, level='default') -> None:
+        """ Writes the compressed tables at the current position of output_fp, then the archive header """
+        self.archiveHead.fileNameTableStartAddress = self.output_fp.tell()
+        self.archiveHead.fileTableStartAddress = len(self.nameTable)
+        self.archiveHead.directoryTableStartAddress = len(self.nameTable) + len(self.fileTable)
 
         # Combine all tables
-        header_data = name_table + file_table + directory_table
+        header_data = bytes(self.nameTable + self.fileTable + self.directoryTable)
         self.archiveHead.headSize = len(header_data)
 
-        # Compress header if needed
-        if not (self.archiveHead.flags & DXA_FLAG_NO_HEAD_PRESS):
-            # LZ compression
-            lz_buffer_size = len(header_data) + (len(header_data) // 8) + 9
-            lz_buffer = bytearray(lz_buffer_size)
-            lz_size = self.encode(header_data, lz_buffer)
-
-            # Huffman compression
-            huff_buffer = bytearray(lz_size * 2)  # Estimate
-            huff_size = huffman_Encode(lz_buffer[:lz_size], huff_buffer)
+        lz_buffer = bytearray(self.encode(header_data))
+        lz_size = self.encode(header_data, lz_buffer, level)
+        (compressed_header, huff_size) = huffman_Encode(lz_buffer, lz_size, bytearray())
 
-            # Use the compressed header
-            compressed_header = huff_buffer[:huff_size]
+        # Encrypt if needed
+        if not self.noKey:
+            compressed_header = self.keyConv(compressed_header, huff_size, 0, self.key)
 
-            # Encrypt if needed
-            if not self.noKey:
-                compressed_header = self.keyConv(compressed_header, len(compressed_header), 0, key)
-        else:
-            compressed_header = header_data
-            if not self.noKey:
-                compressed_header = self.keyConv(compressed_header, len(compressed_header), 0, key)
+        self.output_fp.write(compressed_header)
+        self.output_fp.truncate()
+        # Everything the new header points at is on disk before it is written
+        self.output_fp.flush()
+        os.fsync(self.output_fp.fileno())
 
         # Write the updated header
         self.output_fp.seek(0)
-        header_bytes = struct.pack(
+        self.output_fp.write(struct.pack(
             "HHIQQQQIIB14sB",
             self.archiveHead.head,
             self.archiveHead.version,
@@ -1269,119 +1559,108 @@ class DXArchive:
             self.archiveHead.charCodeFormat,
             self.archiveHead.flags,
             self.archiveHead.huffmanEncodeKB,
-            bytearray(14),  # reserve
+            bytes(14),  # reserve
             0  # padding
-        )
-        self.output_fp.write(header_bytes)
+        ))
 
-        # Write the compressed header
-        self.output_fp.write(compressed_header)
+    def __enter__(self):
+        return self
 
-        # Write file data for each file
-        for dir_path, dir_info in dir_structure.items():
-            for file_entry in dir_info['files']:
-                if file_entry['is_dir']:
-                    continue
-
-                # Read file data
-                with open(file_entry['path'], 'rb') as f:
-                    file_data = f.read()
-
-                # Apply compression if requested and file is large enough
-                if use_compression and len(file_data) > self.MIN_COMPRESS:
-                    # LZ compression
-                    lz_buffer_size = len(file_data) + (len(file_data) // 8) + 9
-                    lz_buffer = bytearray(lz_buffer_size)
-                    compressed_size = self.encode(file_data, lz_buffer)
-
-                    if compressed_size < len(file_data):
-                        compressed_data = lz_buffer[:compressed_size]
-
-                        # Apply Huffman compression if requested
-                        if use_huffman and hasattr(self, 'huffman_Encode'):
-                            huffman_buffer = bytearray(compressed_size * 2)  # Estimate
-                            huffman_size = huffman_Encode(compressed_data, huffman_buffer)
-                            if huffman_size < compressed_size:
-                                final_data = huffman_buffer[:huffman_size]
-                            else:
-                                final_data = compressed_data
-                        else:
-                            final_data = compressed_data
-                    else:
-                        final_data = file_data
-                else:
-                    final_data = file_data
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.unmapArchive()
+        if self.fp is not None and not self.fp.closed:
+            self.fp.close()
 
-                # Encrypt data if key is provided
-                if not self.noKey:
-                    # Create file-specific key
-                    key_string_buffer = self.createKeyFileString(
-                        key_string, 
-                        len(key_string),
-                        DARC_DIRECTORY(directory_table[dir_addresses[dir_path]:]),
-                        file_head
-                    )
-                    file_key = self.keyCreate(
-                        key_string_buffer,
-                        len(key_string_buffer),
-                        bytearray([0] * DXA_KEY_BYTES)
-                    )
-                    final_data = self.keyConv(final_data, len(final_data), 0, file_key)
+@lru_cache(maxsize=None)
+def openArchive(archivePath, keyString: bytes = wolfKeyString, useIndex: bool = False) -> DXArchive:
+    """ The loaded archive at `archivePath`, shared by every caller in this process """
+    archive = DXArchive()
+    if not archive.loadArchive(Path(archivePath), Path("."), None if keyString is None else bytearray(keyString), useIndex):
+        raise Exception(f"failed to load archive {archivePath}")
+    return archive
 
-                # Write data to file
-                self.output_fp.write(final_data)
+# forked workers would share the file position of the parent's handles
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=openArchive.cache_clear)
 
-        # Close the file
-        self.output_fp.close()
-        return True
 
-    def add_to_archive(self, archive_path, files_to_add, key_string=None, use_compression=True, use_huffman=True):
-        """
-        Add files to an existing archive
-        """
-        # First, extract the existing archive to a temporary location
-        temp_dir = Path("temp_extract")
-        if temp_dir.exists():
-            import shutil
-            shutil.rmtree(temp_dir)
-        temp_dir.mkdir()
-
-        # Load the archive
-        if not self.loadArchive(archive_path, temp_dir, key_string):
-            print(f"Failed to load archive {archive_path}")
-            return False
+def fileTime(timestamp: float) -> int:
+    """ FILETIME of a unix timestamp """
+    return int(timestamp * 10000000) + DXA_FILETIME_EPOCH
 
-        # Extract all files
-        self.extractAll()
-
-        # Get list of all extracted files
-        extracted_files = []
-        for root, dirs, files in os.walk(temp_dir):
-            for file in files:
-                file_path = Path(root) / file
-                relative_path = file_path.relative_to(temp_dir)
-                extracted_files.append(relative_path)
-
-        # Add new files to the extracted files
-        for file_to_add in files_to_add:
-            file_path = Path(file_to_add)
-            if file_path.exists():
-                # Copy the file to the temp directory
-                dest_path = temp_dir / file_path.name
-                with open(file_path, 'rb') as src, open(dest_path, 'wb') as dst:
-                    dst.write(src.read())
-                extracted_files.append(Path(file_path.name))
-
-        # Create a new archive with all files
-        all_files = [temp_dir / file for file in extracted_files]
-        return self.create_archive(archive_path, all_files, key_string, use_compression, use_huffman)
 
-    def __enter__(self):
-        return self
+def isCompressible(name: str, data) -> bool:
+    """ Whether compressing the file `name` with contents `data` is worth a try, see DXA_COMPRESS_POLICY """
+    policy = DXA_COMPRESS_POLICY.get(PurePosixPath(name).suffix.lower())
+    if policy is not None:
+        return policy
+    if len(data) <= DXA_SAMPLE_SIZE * DXA_SAMPLE_COUNT:
+        return True
+
+    # Byte entropy of samples spread over the file
+    step = (len(data) - DXA_SAMPLE_SIZE) // (DXA_SAMPLE_COUNT - 1)
+    for start in range(0, step * DXA_SAMPLE_COUNT, step):
+        counts = huffman_Histogram(data[start : start + DXA_SAMPLE_SIZE])
+        entropy = -sum(count * math.log2(count / DXA_SAMPLE_SIZE) for count in counts if count) / DXA_SAMPLE_SIZE
+        if entropy < DXA_ENTROPY_LIMIT:
+            return True
+    return False
+
+
+def fileDigest(path) -> bytes:
+    """ sha256 of the file at `path`, read in DXA_BUFFERSIZE pieces """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DXA_BUFFERSIZE), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def storeFile(huffmanEncodeKB: int, path, name: str, key: bytearray, use_compression=True, use_huffman=True, level='default') -> tuple:
+    """ DXArchive.storeFile() in a worker process of DXArchive.writeMembers() """
+    archive = DXArchive()
+    archive.archiveHead = DARC_HEAD()
+    archive.archiveHead.huffmanEncodeKB = huffmanEncodeKB
+    return archive.storeFile(path, name, key, use_compression, use_huffman, level)
+
+
+def storedSize(archivedFile: ArchivedFile, huffmanEncodeKB: int = 0xFF) -> int:
+    """ Number of bytes a member takes up inside an archive with DARC_HEAD.huffmanEncodeKB `huffmanEncodeKB` """
+    lzSize = archivedFile.pressDataSize if archivedFile.compressed else archivedFile.dataSize
+    if archivedFile.huffmanCompressed:
+        huffmanSize = huffmanEncodeKB * 1024
+        if huffmanEncodeKB != 0xFF and lzSize > huffmanSize * 2:
+            # the middle part is stored as is after the huffman data
+            return archivedFile.huffPressDataSize + lzSize - huffmanSize * 2
+        return archivedFile.huffPressDataSize
+    return lzSize
+
+
+def extractFiles(archivePath, archivedFiles) -> None:
+    """ Worker of DXArchive.extractAll(): extracts `archivedFiles` through its own handle on the archive """
+    archive = DXArchive()
+    with open(archivePath, mode="rb") as archive.fp:
+        archive.mapArchive()
+        archive.archiveHead = DARC_HEAD(archive.fp.read(len(DARC_HEAD())))
+        for archivedFile in archivedFiles:
+            archive.extractFile(archivedFile)
+        archive.unmapArchive()
+
+
+def inputFiles(inputs) -> list:
+    """ create_archive() entries for command line inputs: the files of a directory go in under their path inside it """
+    input_files = []
+    for input_path in inputs:
+        path = Path(input_path)
+        if path.is_dir():
+            for root, dirs, files in os.walk(path):
+                for file in files:
+                    file_path = Path(root) / file
+                    input_files.append((file_path.relative_to(path).as_posix(), file_path))
+        else:
+            input_files.append(path)
+    return input_files
 
-    def __exit__(self, exc_type, exc_value, exc_traceback):
-        if not self.fp.closed:
-            self.fp.close()
 
 def main():
     parser = argparse.ArgumentParser(description='DXArchive tool for extracting and creating DX archives')
@@ -1393,8 +1672,11 @@ def main():
     extract_parser = subparsers.add_parser('extract', help='Extract files from archive')
     extract_parser.add_argument('archive', help='Path to the archive file')
     extract_parser.add_argument('-o', '--output', default='output', help='Output directory')
-    extract_parser.add_argument('-k', '--key', default="WLFRPrO!p(;s5((8P@((UFWlu$#5(=", help='Key string for encrypted archives')
+    extract_parser.add_argument('-k', '--key', default=wolfKeyString.decode(), help='Key string for encrypted archives')
     extract_parser.add_argument('-f', '--file', help='Extract only this specific file')
+    extract_parser.add_argument('-p', '--pattern', nargs='+', help='Extract only files matching these globs (e.g. "*.mps" "*.dat" "*.project")')
+    extract_parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes (0 = all CPUs)')
+    extract_parser.add_argument('--index', action='store_true', help='Keep the member list in ARCHIVE.idx to open the archive faster next time')
 
     # Create command
     create_parser = subparsers.add_parser('create', help='Create a new archive')
@@ -1403,6 +1685,9 @@ def main():
     create_parser.add_argument('-k', '--key', help='Key string for encryption')
     create_parser.add_argument('--no-compression', action='store_true', help='Disable compression')
     create_parser.add_argument('--no-huffman', action='store_true', help='Disable Huffman compression')
+    create_parser.add_argument('--level', choices=DXArchive.ENCODE_LEVELS, default='default', help='LZ compression effort')
+    create_parser.add_argument('--dedup', action='store_true', help='Store files with the same contents once')
+    create_parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes compressing files (0 = all CPUs)')
 
     # Add command
     add_parser = subparsers.add_parser('add', help='Add files to an existing archive')
@@ -1411,11 +1696,14 @@ def main():
     add_parser.add_argument('-k', '--key', help='Key string for encryption')
     add_parser.add_argument('--no-compression', action='store_true', help='Disable compression')
     add_parser.add_argument('--no-huffman', action='store_true', help='Disable Huffman compression')
+    add_parser.add_argument('--level', choices=DXArchive.ENCODE_LEVELS, default='default', help='LZ compression effort')
+    add_parser.add_argument('--rebuild', action='store_true', help='Rewrite the archive without the space left by replaced files instead of appending')
 
     # List command
     list_parser = subparsers.add_parser('list', help='List files in the archive')
     list_parser.add_argument('archive', help='Path to the archive file')
     list_parser.add_argument('-k', '--key', help='Key string for encrypted archives')
+    list_parser.add_argument('--index', action='store_true', help='Keep the member list in ARCHIVE.idx to open the archive faster next time')
 
     # Parse arguments
     args = parser.parse_args()
@@ -1426,7 +1714,7 @@ def main():
         key_string = bytearray(args.key.encode('utf-8')) if args.key else None
 
         with DXArchive() as archive:
-            if archive.loadArchive(Path(args.archive), Path(args.output), key_string):
+            if archive.loadArchive(Path(args.archive), Path(args.output), key_string, args.index):
                 if args.file:
                     # Extract specific file
                     for file in archive.archivedFiles:
@@ -1436,9 +1724,11 @@ def main():
                             break
                     else:
                         print(f"File {args.file} not found in archive")
+                elif args.jobs != 1:
+                    archive.extractAll(args.pattern, args.jobs)
                 else:
                     # Extract all files
-                    for file in archive.archivedFiles:
+                    for file in archive.matchFiles(args.pattern):
                         print(f"Extracting {file.filePath}...")
                         archive.extractFile(file)
 
@@ -1450,17 +1740,7 @@ def main():
         # Convert key string to bytearray if provided
         key_string = bytearray(args.key.encode('utf-8')) if args.key else None
 
-        # Expand directories to file lists
-        input_files = []
-        for input_path in args.input:
-            path = Path(input_path)
-            if path.is_dir():
-                for root, dirs, files in os.walk(path):
-                    for file in files:
-                        file_path = Path(root) / file
-                        input_files.append(file_path)
-            else:
-                input_files.append(path)
+        input_files = inputFiles(args.input)
 
         with DXArchive() as archive:
             if archive.create_archive(
@@ -1468,7 +1748,10 @@ def main():
                 input_files,
                 key_string,
                 not args.no_compression,
-                not args.no_huffman
+                not args.no_huffman,
+                args.level,
+                args.dedup,
+                args.jobs
             ):
                 print(f"Archive {args.archive} created successfully with {len(input_files)} files")
             else:
@@ -1478,17 +1761,7 @@ def main():
         # Convert key string to bytearray if provided
         key_string = bytearray(args.key.encode('utf-8')) if args.key else None
 
-        # Expand directories to file lists
-        input_files = []
-        for input_path in args.input:
-            path = Path(input_path)
-            if path.is_dir():
-                for root, dirs, files in os.walk(path):
-                    for file in files:
-                        file_path = Path(root) / file
-                        input_files.append(file_path)
-            else:
-                input_files.append(path)
+        input_files = inputFiles(args.input)
 
         with DXArchive() as archive:
             if archive.add_to_archive(
@@ -1496,7 +1769,9 @@ def main():
                 input_files,
                 key_string,
                 not args.no_compression,
-                not args.no_huffman
+                not args.no_huffman,
+                args.level,
+                not args.rebuild
             ):
                 print(f"Added {len(input_files)} files to archive {args.archive}")
             else:
@@ -1507,7 +1782,7 @@ def main():
         key_string = bytearray(args.key.encode('utf-8')) if args.key else None
 
         with DXArchive() as archive:
-            if archive.loadArchive(Path(args.archive), Path("."), key_string):
+            if archive.loadArchive(Path(args.archive), Path("."), key_string, args.index):
                 print(f"Archive: {args.archive}")
                 print(f"Number of files: {len(archive.archivedFiles)}")
                 print("\nFiles:")
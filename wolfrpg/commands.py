@@ -122,7 +122,7 @@ class Command:
         # Read all data for this command from file
         args_len = coder.read_u1() - 1
         _cid = coder.read_u4()
-        _args = [coder.read_u4() for i in range(args_len)]
+        _args = coder.read_int_array(args_len)
 
         _indent = coder.read_u1()
         string_args_len = coder.read_u1()
@@ -143,12 +143,19 @@ class Command:
             pass
         return obj(_cid, _args, _string_args, _indent)
 
+    def byte_size(self, coder):
+        size = 1 + 4 + 4 * len(self.args) + 1 + 1
+        for arg in self.string_args:
+            size += coder.string_byte_size(arg)
+        return size + self.terminator_size()
+
+    def terminator_size(self):
+        return 1
+
     def write(self, coder):
         coder.write_u1(len(self.args) + 1)
         coder.write_u4(self.cid)
-
-        for arg in self.args:
-            coder.write_u4(arg)
+        coder.write_int_array(self.args, False)
         coder.write_u1(self.indent)
         coder.write_u1(len(self.string_args))
 
@@ -322,7 +329,7 @@ class Move(Command):
         super().__init__(cid, args, string_args, indent)
 
         # Read unknown data
-        self.unknown = [coder.read_u1() for i in range(5)]
+        self.unknown = coder.read_byte_array(5)
         # Read known data
         self.flags = coder.read_u1()
 
@@ -330,10 +337,12 @@ class Move(Command):
         route_len = coder.read_u4()
         self.route = [RouteCommand.create(coder) for i in range(route_len)]
 
+    def terminator_size(self):
+        return 1 + len(self.unknown) + 1 + 4 + sum(pt.byte_size() for pt in self.route)
+
     def terminate_stream(self, coder):
         coder.write_u1(1)
-        for b in self.unknown: # 5 bytes
-            coder.write_u1(b)
+        coder.write_byte_array(self.unknown, False) # 5 bytes
         coder.write_u1(self.flags)
         coder.write_u4(len(self.route))
         for pt in self.route:
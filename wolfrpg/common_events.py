@@ -6,10 +6,11 @@ class CommonEvents():
     COMMON_MAGIC2 = b'\x00W\x00\x00OL\x00FC\x00\x8f'
     COMMON_MAGIC3 = b'\x00W\x00\x00OLUFC\x00\x90'
 
-    def __init__(self, filename):
+    def __init__(self, filename, context=None):
         self.events = []
         self.wolfversion = 2
-        with FileCoder.open(filename, 'r') as coder:
+        self.context = context
+        with FileCoder.open(filename, 'r', context=context) as coder:
             try:
                 coder.verify(self.COMMON_MAGIC2)
                 self.COMMON_MAGIC = self.COMMON_MAGIC2
@@ -18,6 +19,7 @@ class CommonEvents():
                 self.COMMON_MAGIC = self.COMMON_MAGIC3
                 self.wolfversion = 3
                 coder.is_utf8 = True
+            self._raw_strings = coder.raw_string_table()
 
             events_len = coder.read_u4()
             print('events:', events_len)
@@ -32,14 +34,28 @@ class CommonEvents():
             if self.last_terminator != 0x8F and self.last_terminator != 0x90:
                 raise Exception(f"CommonEvents terminator not 0x8F|0x90 (got {hex(terminator)})")
 
+    def byte_size(self, coder):
+        size = len(self.COMMON_MAGIC) + 4
+        for event in self.events:
+            size += event.byte_size(coder)
+        return size + 1
+
     def write(self, filename):
-        with FileCoder.open(filename, 'w') as coder:
+        with FileCoder.open(filename, 'w', context=getattr(self, 'context', None)) as coder:
+            coder.restore_raw_strings(getattr(self, '_raw_strings', None))
+            coder.reserve(self.byte_size(coder))
             coder.write(self.COMMON_MAGIC)
             coder.write_u4(len(self.events))
             for event in self.events:
                 event.write(coder)
             coder.write_u1(self.last_terminator)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_raw_strings', None)
+        state.pop('context', None)
+        return state
+
     def grep(self, needle):
         pass
 
@@ -94,10 +110,10 @@ class CommonEvents():
 
             self.unknown9 = coder.read_string()
             indicator = coder.read_u1()
+            self._is_0x92 = False
             if indicator == 0x91: # 145
                 return
 
-            self._is_0x92 = False
             if indicator != 0x92: # 146
                 raise Exception(f"expected 0x92, got {hex(indicator)}")
             else:
@@ -110,6 +126,31 @@ class CommonEvents():
                 raise Exception(f"expected 0x92, got {hex(indicator)}")
 
 
+        def byte_size(self, coder):
+            size = 1 + 4 + 4 + len(self.blank1) + coder.string_byte_size(self.name)
+            size += 4
+            for cmd in self.commands:
+                size += cmd.byte_size(coder)
+            size += coder.string_byte_size(self.unknown11) + coder.string_byte_size(self.description)
+
+            size += 1 + len(self.EVENT_MAGIC)
+            size += sum(coder.string_byte_size(s) for s in self.unknown3)
+            if self.unknown31 is not None:
+                size += 4 + 1
+            size += len(self.EVENT_MAGIC) + len(self.unknown4)
+            size += len(self.EVENT_MAGIC)
+            for sa in self.unknown5:
+                size += 4 + sum(coder.string_byte_size(s) for s in sa)
+            size += len(self.EVENT_MAGIC)
+            for ia in self.unknown6:
+                size += 4 + 4 * len(ia)
+            size += len(self.unknown7) + sum(coder.string_byte_size(s) for s in self.unknown8)
+
+            size += 1 + coder.string_byte_size(self.unknown9)
+            if self._is_0x92:
+                size += 1 + coder.string_byte_size(self.unknown10) + 4
+            return size + 1
+
         def write(self, coder):
             coder.write_u1(0x8E)
             coder.write_u4(self.id)
@@ -136,8 +177,7 @@ class CommonEvents():
                 coder.write_u1(self.unknown32)
 
             coder.write(self.EVENT_MAGIC)
-            for i in self.unknown4:
-                coder.write_u1(i)
+            coder.write_byte_array(self.unknown4, False)
 
             coder.write(self.EVENT_MAGIC)
             for sa in self.unknown5:
@@ -147,9 +187,7 @@ class CommonEvents():
 
             coder.write(self.EVENT_MAGIC)
             for ia in self.unknown6:
-                coder.write_u4(len(ia))
-                for i in ia:
-                    coder.write_u4(i)
+                coder.write_int_array(ia)
 
             coder.write(self.unknown7)
             for s in self.unknown8:
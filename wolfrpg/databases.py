@@ -8,12 +8,15 @@ class Database():
     DATABASE_MAGIC = b'W\0\0OL'
     DATABASE_MAGIC_NEXT = b'FM\0'
 
-    def __init__(self, project_filename, dat_filename):
-        with FileCoder.open(project_filename, 'r') as coder:
+    def __init__(self, project_filename, dat_filename, context=None):
+        self.context = context
+        with FileCoder.open(project_filename, 'r', context=context) as coder:
             types_count = coder.read_u4()
             self.types = [self.Type(coder) for _ in range(types_count)]
+            self._raw_project_strings = coder.raw_string_table()
+            self.proj_key = coder.proj_key # only set if the .project was encrypted
 
-        with FileCoder.open(dat_filename, 'r', Database.DAT_SEED_INDICES, is_db=True) as coder:
+        with FileCoder.open(dat_filename, 'r', Database.DAT_SEED_INDICES, is_db=True, context=context) as coder:
             if coder.encrypted:
                 self.crypt_header = coder.crypt_header
                 self.unknown_encrypted_1 = coder.read_u1()
@@ -25,6 +28,7 @@ class Database():
                 coder.is_utf8 = EncodingType(self.encoding_type) == EncodingType.UNICODE
                 coder.verify(self.DATABASE_MAGIC_NEXT)
                 self.engine_version = coder.read_u1()
+            self._raw_dat_strings = coder.raw_string_table()
 
             num_types = coder.read_u4()
             if num_types != len(self.types):
@@ -42,12 +46,32 @@ class Database():
     def encrypted(self):
         return self.crypt_header != None
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_raw_project_strings', None)
+        state.pop('_raw_dat_strings', None)
+        state.pop('context', None)
+        return state
+
+    def project_byte_size(self, coder):
+        return 4 + sum(t.project_byte_size(coder) for t in self.types)
+
+    def dat_byte_size(self, coder):
+        # without the crypt header/indicator, which the coder writes on open
+        size = 1 if coder.encrypted else len(self.DATABASE_MAGIC) + 1 + len(self.DATABASE_MAGIC_NEXT) + 1
+        size += 4 + sum(t.dat_byte_size(coder) for t in self.types)
+        return size + 1
+
     def write(self, project_filename, dat_filename):
-        with FileCoder.open(project_filename, 'w') as coder:
+        with FileCoder.open(project_filename, 'w', context=getattr(self, 'context', None), proj_key=getattr(self, 'proj_key', None)) as coder:
+            coder.restore_raw_strings(getattr(self, '_raw_project_strings', None))
+            coder.reserve(self.project_byte_size(coder))
             coder.write_u4(len(self.types))
             [t.write_project(coder) for t in self.types]
 
-        with FileCoder.open(dat_filename, 'w', Database.DAT_SEED_INDICES, self.crypt_header, is_db=True) as coder:
+        with FileCoder.open(dat_filename, 'w', Database.DAT_SEED_INDICES, self.crypt_header, is_db=True, context=getattr(self, 'context', None)) as coder:
+            coder.restore_raw_strings(getattr(self, '_raw_dat_strings', None))
+            coder.reserve(self.dat_byte_size(coder))
             if coder.encrypted:
                 coder.write_u1(self.unknown_encrypted_1)
             else:
@@ -106,13 +130,27 @@ class Database():
             args_alen = coder.read_u4()
             for i in range(args_alen):
                 ints_count = coder.read_u4()
-                self.fields[i].args = [coder.read_u4() for _ in range(ints_count)]
+                self.fields[i].args = coder.read_int_array(ints_count)
 
             dafaults_alen = coder.read_u4()
             for i in range(dafaults_alen):
                 self.fields[i].default_value = coder.read_u4()
 
 
+        def project_byte_size(self, coder):
+            size = coder.string_byte_size(self.name)
+            size += 4 + sum(field.project_byte_size(coder) for field in self.fields)
+            size += 4 + sum(datum.project_byte_size(coder) for datum in self.data)
+            size += coder.string_byte_size(self.description)
+            size += 4 + max(self.field_type_list_size, len(self.fields))
+            size += 4 + sum(coder.string_byte_size(field.unknown1) for field in self.fields)
+            size += 4
+            for field in self.fields:
+                size += 4 + sum(coder.string_byte_size(arg) for arg in field.string_args)
+            size += 4 + sum(4 + 4 * len(field.args) for field in self.fields)
+            size += 4 + 4 * len(self.fields)
+            return size
+
         def write_project(self, coder):
             coder.write_string(self.name)
             coder.write_u4(len(self.fields))
@@ -148,9 +186,7 @@ class Database():
 
             coder.write_u4(len(self.fields))
             for field in self.fields:
-                coder.write_u4(len(field.args))
-                for arg in field.args:
-                    coder.write_u4(arg)
+                coder.write_int_array(field.args)
 
             coder.write_u4(len(self.fields))
             for field in self.fields:
@@ -173,6 +209,12 @@ class Database():
                 datum.read_dat(coder, self.fields)
 
 
+        def dat_byte_size(self, coder):
+            size = len(self.D_TYPE_SEPARATOR) + 4
+            size += 4 + 4 * len(self.fields)
+            size += 4 + sum(datum.dat_byte_size(coder) for datum in self.data)
+            return size
+
         def write_dat(self, coder):
             coder.write(self.D_TYPE_SEPARATOR)
             coder.write_u4(self.unknown1)
@@ -192,6 +234,9 @@ class Database():
         def __init__(self, coder):
             self.name = coder.read_string()
 
+        def project_byte_size(self, coder):
+            return coder.string_byte_size(self.name)
+
         def write_project(self, coder):
             coder.write_string(self.name)
 
@@ -221,23 +266,25 @@ class Database():
         def __init__(self, coder):
             self.name = coder.read_string()
 
+        def project_byte_size(self, coder):
+            return coder.string_byte_size(self.name)
+
         def write_project(self, coder):
             coder.write_string(self.name)
 
+        def dat_byte_size(self, coder):
+            return 4 * len(self.int_values) + sum(coder.string_byte_size(s) for s in self.string_values)
+
         def read_dat(self, coder, fields):
             self.fields = fields
-            self.int_values = []
+            self.int_values = coder.read_int_array(sum(1 for x in fields if x.is_int))
             self.string_values = []
 
-            for i in filter(lambda x: x.is_int, fields):
-                self.int_values.append(coder.read_u4())
-
             for i in filter(lambda x: x.is_string, fields):
                 self.string_values.append(coder.read_string())
 
         def write_dat(self, coder):
-            for i in self.int_values:
-                coder.write_u4(i)
+            coder.write_int_array(self.int_values, False)
 
             for i in self.string_values:
                 coder.write_string(i)
@@ -2,7 +2,7 @@
 import sys, os, glob, re
 if sys.version_info < (3, 9): print("This app must run using Python 3.9+"), sys.exit(2)
 from wolfrpg import commands, maps, databases, gamedats, common_events, filecoder
-from wolfrpg.service_fn import write_csv_list, read_csv_dict, normalize_n, is_translatable
+from wolfrpg.service_fn import write_csv_list, read_csv_dict, normalize_n, is_translatable, run_tasks, search_archive, open_resource, resource_size
 from wolfrpg.wenums import EncodingType
 from wolfrpg import  yaml_dump
 import hashlib
@@ -10,18 +10,6 @@ import hashlib
 ENABLE_YAML_DUMPING = True
 MODE_BREAK_ON_EXCEPTIONS = False
 
-MODE_SETSTRING_AS_STRING = False
-MODE_CEARG_AS_STRING = False
-MODE_EXTRACT_COMMENTS = False
-MODE_EXTRACT_DB_NAMES = True
-MODE_EXTRACT_CE = False
-MODE_EXTRACT_CE_BY_NAME = False
-MODE_EXTRACT_DATABASE_REFS = False
-MODE_EXTRACT_CE_ARG_N = list()
-MODE_EXTRACT_CEBN_ARG_N = list()
-MODE_EXTRACT_CE_EVID = list()
-MODE_EXTRACT_CEBN_EVID = list()
-
 STRINGS_NAME = "strings"
 ATTRIBUTES_NAME = "attributes"
 STRINGS_DB_POSTFIX = "_" + STRINGS_NAME + ".csv"
@@ -30,6 +18,42 @@ REPLACEMENT_TAGS_RE = r'(?:「|」|[@]\d+\n|(?:(?:\\[-\+_\.\{\}%A-Za-z\d]+\[[\d:
 MEDIA_EXTENSION_RE = re.compile(r'\.(?:png|wave?|aac|jpe?g|ogg|mp3|flac|webp)$')
 
 
+class ExtractOptions(object):
+    """ Extraction switches and codec context of one game, passed around instead of globals """
+    def __init__(self, context=None):
+        self.context = context if context is not None else filecoder.CodecContext()
+        self.setstring_as_string = False
+        self.cearg_as_string = False
+        self.extract_comments = False
+        self.extract_db_names = True
+        self.extract_ce = False
+        self.extract_ce_by_name = False
+        self.extract_database_refs = False
+        self.extract_ce_arg_n = list()
+        self.extract_cebn_arg_n = list()
+        self.extract_ce_evid = list()
+        self.extract_cebn_evid = list()
+        self.archive = None # resources are read from this .wolf archive instead of the game folder
+        self.archive_key = None
+
+    def open(self, path):
+        """ What the structure readers should open for the resource at `path` """
+        return open_resource(path, self.archive, self.archive_key)
+
+    @classmethod
+    def from_args(cls, args):
+        opts = cls(filecoder.CodecContext(args.u))
+        opts.setstring_as_string = args.s
+        opts.cearg_as_string = args.a
+        opts.extract_db_names = args.n
+        opts.extract_ce = args.c
+        opts.extract_ce_by_name = args.b
+        opts.extract_database_refs = args.d
+        opts.archive = args.w
+        opts.archive_key = args.k.encode() if args.k else None
+        return opts
+
+
 def tag_hash(string, str_enc="utf-8", hash_len=7):
     """ Generates short English tags for MTL from any kind of string. """
     if len(string) < 1: return ''
@@ -69,17 +93,17 @@ def normalize_and_filter(text):
         return [normalize_n(i, True) for i in text if is_translatable(i)]
     return []
 
-def attributes_of_command(command):
+def attributes_of_command(command, opts):
     if isinstance(command, commands.Choices):
         return normalize_and_filter(command.text)
     elif isinstance(command, commands.CommonEvent):
-        if not MODE_CEARG_AS_STRING and MODE_EXTRACT_CE:
+        if not opts.cearg_as_string and opts.extract_ce:
             return normalize_and_filter(command.text)
     elif isinstance(command, commands.CommonEventByName):
-        if not MODE_CEARG_AS_STRING and MODE_EXTRACT_CE_BY_NAME:
+        if not opts.cearg_as_string and opts.extract_ce_by_name:
             return normalize_and_filter(command.text)
     elif isinstance(command, commands.Database):
-        if MODE_EXTRACT_DATABASE_REFS:
+        if opts.extract_database_refs:
             return normalize_and_filter(command.text)
     elif isinstance(command, commands.StringCondition):
         return normalize_and_filter(command.text)
@@ -87,24 +111,24 @@ def attributes_of_command(command):
         if command.ptype == 'text':
             return normalize_and_filter(command.text)
     elif isinstance(command, commands.SetString):
-        if not MODE_SETSTRING_AS_STRING:
+        if not opts.setstring_as_string:
             return normalize_and_filter(command.text)
     return []
 
-def strings_of_command(command):
+def strings_of_command(command, opts):
     if isinstance(command, commands.Message):
         return normalize_and_filter(command.text)
     elif isinstance(command, commands.Comment):
-        if MODE_EXTRACT_COMMENTS:
+        if opts.extract_comments:
             return normalize_and_filter(command.text)
     elif isinstance(command, commands.SetString):
-        if MODE_SETSTRING_AS_STRING:
+        if opts.setstring_as_string:
             return normalize_and_filter(command.text)
     elif isinstance(command, commands.CommonEvent):
-        if MODE_CEARG_AS_STRING and MODE_EXTRACT_CE:
+        if opts.cearg_as_string and opts.extract_ce:
             return normalize_and_filter(command.text)
     elif isinstance(command, commands.CommonEventByName):
-        if MODE_CEARG_AS_STRING and MODE_EXTRACT_CE_BY_NAME:
+        if opts.cearg_as_string and opts.extract_ce_by_name:
             return normalize_and_filter(command.text)
     return []
 
@@ -140,20 +164,113 @@ def search_tags(arr, re_tags=REPLACEMENT_TAGS_RE):
     return list(tags)
 
 
-def main():
-    global MODE_SETSTRING_AS_STRING
-    global MODE_CEARG_AS_STRING
-    global MODE_EXTRACT_DB_NAMES
-    global MODE_EXTRACT_CE
-    global MODE_EXTRACT_CE_BY_NAME
-    global MODE_EXTRACT_DATABASE_REFS
-    global MODE_EXTRACT_COMMENTS
-
-    global MODE_EXTRACT_CE_ARG_N
-    global MODE_EXTRACT_CEBN_ARG_N
-    global MODE_EXTRACT_CE_EVID
-    global MODE_EXTRACT_CEBN_EVID
+def extract_map(map_name, opts):
+    """ Writes the translation files of one map and returns the replacement tags found """
+    if os.path.isfile(
+        make_postfixed_name(map_name, ATTRIBUTES_DB_POSTFIX, ".mps")) or os.path.isfile(
+        make_postfixed_name(map_name, STRINGS_DB_POSTFIX, ".mps")):
+        return []
+    print("Extracting",os.path.basename(map_name) +"...")
+    translatable_attrs = dict()
+    translatable_strings = []
+    if MODE_BREAK_ON_EXCEPTIONS:
+        mp = maps.Map(opts.open(map_name), opts.context)
+    else:
+        try:
+            mp = maps.Map(opts.open(map_name), opts.context)
+        except Exception as e:
+            print(f"FAILED: {e}")
+            return []
+    for event in mp.events:
+        for page in event.pages:
+            for i, command in enumerate(page.commands):
+                a = dict.fromkeys(attributes_of_command(command, opts))
+                if len(a):
+                    translatable_attrs = translatable_attrs | a
+                s = strings_of_command(command, opts)
+                if not s: continue
+                translatable_strings += [make_csv_field(
+                    strn, command) for strn in s if not MEDIA_EXTENSION_RE.search(strn)]
+    translatable_attrs = [make_csv_field(attr, command) for attr in translatable_attrs]
+    write_translations(map_name, translatable_attrs, translatable_strings, ".mps")
+    if ENABLE_YAML_DUMPING:
+        yaml_dump.dump(mp, remove_ext(map_name))
+    return search_tags(translatable_attrs) + search_tags(translatable_strings)
+
+def extract_common_events(commonevents_name, opts):
+    """ Writes the translation files of CommonEvent.dat and returns the replacement tags found """
+    if os.path.isfile(make_postfixed_name(commonevents_name, ATTRIBUTES_DB_POSTFIX, ".dat")) or (
+            os.path.isfile(make_postfixed_name(commonevents_name, STRINGS_DB_POSTFIX, ".dat"))):
+        return []
+    print("Extracting",os.path.basename(commonevents_name) +"...")
+    if MODE_BREAK_ON_EXCEPTIONS:
+        ce = common_events.CommonEvents(opts.open(commonevents_name), opts.context)
+    else:
+        try:
+            ce = common_events.CommonEvents(opts.open(commonevents_name), opts.context)
+        except Exception as e:
+            print(e)
+            sys.exit(2)
+    translatable_attrs = dict()
+    translatable_strings = []
+    for event in ce.events:
+        for i, command in enumerate(event.commands):
+            a = dict.fromkeys(attributes_of_command(command, opts))
+            if len(a):
+                translatable_attrs = translatable_attrs | a
+            s = strings_of_command(command, opts)
+            if not s: continue
+            translatable_strings += [make_csv_field(
+                strn, command) for strn in s if not MEDIA_EXTENSION_RE.search(strn)]
+    translatable_attrs = [make_csv_field(attr, command) for attr in translatable_attrs]
+    write_translations(commonevents_name, translatable_attrs, translatable_strings, ".dat")
+    if ENABLE_YAML_DUMPING:
+        yaml_dump.dump(ce, remove_ext(commonevents_name))
+    return search_tags(translatable_attrs) + search_tags(translatable_strings)
+
+def extract_database(db_name, opts):
+    """ Writes the translation file of one .project/.dat database and returns the replacement tags found """
+    if os.path.isfile(make_postfixed_name(db_name, ATTRIBUTES_DB_POSTFIX, ".dat")):
+        return []
+    base_name = os.path.basename(db_name)
+    print("Extracting", base_name + "...")
+    db_name_only = remove_ext(os.path.basename(db_name))
+    if MODE_BREAK_ON_EXCEPTIONS:
+        db = databases.Database(opts.open(db_name), opts.open(os.path.join(os.path.dirname(db_name),  db_name_only + ".dat")), opts.context)
+    else:
+        try:
+            db = databases.Database(opts.open(db_name), opts.open(os.path.join(os.path.dirname(db_name),  db_name_only + ".dat")), opts.context)
+        except Exception as e:
+            print(e)
+            return []
+    translatable = []
+    test_a = set()
+    for t in db.types:
+        for i, d in enumerate(t.data):
+            if opts.extract_db_names and d.name and d.name not in test_a:
+                item = d.name.replace('\r', '')
+                if item.replace('\r','').replace('\n','').strip():
+                    translatable.append([item, ''])
+                    test_a.add(d.name)
+            for l in d.each_translatable():
+                if len(l) and len(l[0]):
+                    item = l[0].replace('\r', '')
+                    if item not in test_a:
+                        translatable.append([item, ''])#, f"DATABASE@{t.data.index}"])
+                        test_a.add(item)
+
+    extract_previous(os.path.join(
+        os.path.dirname(db_name),
+        db_name_only + ".dat" + ATTRIBUTES_DB_POSTFIX), translatable)
+    write_csv_list(os.path.join(
+        os.path.dirname(db_name),
+        db_name_only + ".dat" + ATTRIBUTES_DB_POSTFIX), translatable)
+    if ENABLE_YAML_DUMPING:
+        yaml_dump.dump(db, remove_ext(db_name))
+    return search_tags(translatable)
 
+
+def main():
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", default="maps,common,game,dbs", help="Type of files to extract (maps,common,game,dbs)")
@@ -164,6 +281,9 @@ def main():
     parser.add_argument("-b", help="Don't extract CommonEventByName args", action="store_false")
     parser.add_argument("-d", help="Don't extract Database refs", action="store_false")
     parser.add_argument("-u", help="Extract strings as UTF-8", action="store_true")
+    parser.add_argument("-j", type=int, default=1, metavar="N", help="Number of parallel worker processes (0 = all CPUs)")
+    parser.add_argument("-w", default=None, metavar="archive", help="Read resources straight from this .wolf archive (Data.wolf -> Data/...)")
+    parser.add_argument("-k", default=None, metavar="key", help="Key string of the -w archive (default: the WolfRPG one)")
     #parser.add_argument("-ea", type="str", default='0', metavar="ce_types", nargs='?',
     #                    help="List of allowed CommonEvent args (#|id; ex: 3|12345,5|12345,3|67890); default: all")
     #parser.add_argument("-na", type="str", default='0', metavar="cebn_types", nargs='?',
@@ -171,29 +291,29 @@ def main():
     args = parser.parse_args()
     print(args)
 
-    MODE_SETSTRING_AS_STRING = args.s
-    MODE_CEARG_AS_STRING = args.a
-    MODE_EXTRACT_DB_NAMES =  args.n
-    MODE_EXTRACT_CE = args.c
-    MODE_EXTRACT_CE_BY_NAME =  args.b
-    MODE_EXTRACT_DATABASE_REFS = args.d
+    opts = ExtractOptions.from_args(args)
+    context = opts.context
 
     """
-    MODE_EXTRACT_CE_ARG_N = [] if not args.ea or args.ea == "0" else args.ea.split(',')
-    MODE_EXTRACT_CE_EVID = [int(i.split('|')[1]) if len(i.split('|'))>1 else -1 for i in MODE_EXTRACT_CE_ARG_N if len(i.split('|'))>1]
-    MODE_EXTRACT_CE_ARG_N = [int(i.split('|')[0]) for i in MODE_EXTRACT_CE_ARG_N]
-    MODE_EXTRACT_CEBN_ARG_N = [] if not args.na or args.na == "0" else args.na.split(',')
-    MODE_EXTRACT_CEBN_EVID = [int(i.split('|')[1]) if len(i.split('|'))>1 else -1 for i in MODE_EXTRACT_CEBN_ARG_N if len(i.split('|'))>1]
-    MODE_EXTRACT_CEBN_ARG_N = [int(i.split('|')[0]) for i in MODE_EXTRACT_CEBN_ARG_N]
+    opts.extract_ce_arg_n = [] if not args.ea or args.ea == "0" else args.ea.split(',')
+    opts.extract_ce_evid = [int(i.split('|')[1]) if len(i.split('|'))>1 else -1 for i in opts.extract_ce_arg_n if len(i.split('|'))>1]
+    opts.extract_ce_arg_n = [int(i.split('|')[0]) for i in opts.extract_ce_arg_n]
+    opts.extract_cebn_arg_n = [] if not args.na or args.na == "0" else args.na.split(',')
+    opts.extract_cebn_evid = [int(i.split('|')[1]) if len(i.split('|'))>1 else -1 for i in opts.extract_cebn_arg_n if len(i.split('|'))>1]
+    opts.extract_cebn_arg_n = [int(i.split('|')[0]) for i in opts.extract_cebn_arg_n]
     """
 
-    #filecoder.initialize(args.u) # since we may detect version 3 at later stages of decoding we need to specify it beforehand
-
-    map_names = search_resource(os.getcwd(), "*.mps") if "maps" in args.f else [] # map data
-    commonevents_name = search_resource(os.getcwd(), "CommonEvent.dat") if "common" in args.f else [] # common events
-    dat_name = search_resource(os.getcwd(), "Game.dat") if "game" in args.f else []  # basic data
-    db_names = list(filter(lambda x: "wolfrpg" not in x and "SysDataBaseBasic" not in x, search_resource(
-        os.getcwd(), "*.project"))) if "dbs" in args.f else [] # projects
+    search = (lambda name: search_archive(opts.archive, name, opts.archive_key)) if opts.archive else (
+        lambda name: search_resource(os.getcwd(), name))
+    map_names = search("*.mps") if "maps" in args.f else [] # map data
+    commonevents_name = search("CommonEvent.dat") if "common" in args.f else [] # common events
+    dat_name = search("Game.dat") if "game" in args.f else []  # basic data
+    db_names = list(filter(lambda x: "wolfrpg" not in x and "SysDataBaseBasic" not in x, search(
+        "*.project"))) if "dbs" in args.f else [] # projects
+    if opts.archive:
+        # translation files are written next to where the members would be extracted
+        for name in map_names + commonevents_name + dat_name + db_names:
+            os.makedirs(os.path.dirname(name), exist_ok=True)
 
     tags = []
 
@@ -201,14 +321,16 @@ def main():
         dat_name = dat_name[0]
         gamedat_failed = None
         if MODE_BREAK_ON_EXCEPTIONS:
-            gd = gamedats.GameDat(dat_name)
+            gd = gamedats.GameDat(opts.open(dat_name), context)
         else:
             try:
-                gd = gamedats.GameDat(dat_name)
+                gd = gamedats.GameDat(opts.open(dat_name), context)
             except Exception as e:
                 gamedat_failed = e
         if gamedat_failed is None:
-            filecoder.initialize(gd.encoding_type == EncodingType.UNICODE)
+            # since we may detect version 3 at later stages of decoding we need to specify it beforehand
+            context.use_utf8 = gd.encoding_type == EncodingType.UNICODE
+            print(f"UTF-8 strings: {context.use_utf8}")
             if not os.path.isfile(make_postfixed_name(dat_name, STRINGS_DB_POSTFIX, ".dat")):
                 print("Extracting",os.path.basename(dat_name) +"...")
                 translatable = []
@@ -227,119 +349,23 @@ def main():
                     dat_name_only + ".dat" + ATTRIBUTES_DB_POSTFIX), translatable)
         if gamedat_failed:
             print(f"FAILED: {gamedat_failed}")
-    else:
-        filecoder.initialize(args.u)
-
-    #maps_cache = dict()
-    #map_names = []
-    for map_name in map_names:
-        if os.path.isfile(
-            make_postfixed_name(map_name, ATTRIBUTES_DB_POSTFIX, ".mps")) or os.path.isfile(
-            make_postfixed_name(map_name, STRINGS_DB_POSTFIX, ".mps")):
-            continue
-        print("Extracting",os.path.basename(map_name) +"...")
-        translatable_attrs = dict()
-        translatable_strings = []
-        if MODE_BREAK_ON_EXCEPTIONS:
-            mp = maps.Map(map_name)
-        else:
-            try:
-                mp = maps.Map(map_name)
-            except Exception as e:
-                print(f"FAILED: {e}")
-                continue
-        #maps_cache[map_name] = mp
-        for event in mp.events:
-            for page in event.pages:
-                for i, command in enumerate(page.commands):
-                    a = dict.fromkeys(attributes_of_command(command))
-                    if len(a):
-                        translatable_attrs = translatable_attrs | a
-                    s = strings_of_command(command)
-                    if not s: continue
-                    translatable_strings += [make_csv_field(
-                        strn, command) for strn in s if not MEDIA_EXTENSION_RE.search(strn)]
-        translatable_attrs = [make_csv_field(attr, command) for attr in translatable_attrs]
-        write_translations(map_name, translatable_attrs, translatable_strings, ".mps")
-        tags += search_tags(translatable_attrs)
-        tags += search_tags(translatable_strings)
-        if ENABLE_YAML_DUMPING:
-            yaml_dump.dump(mp, remove_ext(map_name))
-
-    if len(commonevents_name): commonevents_name = commonevents_name[0]
-    if len(commonevents_name) and not (
-            os.path.isfile(make_postfixed_name(commonevents_name, ATTRIBUTES_DB_POSTFIX, ".dat")) or (
-                os.path.isfile(make_postfixed_name(commonevents_name, STRINGS_DB_POSTFIX, ".dat")))):
-        print("Extracting",os.path.basename(commonevents_name) +"...")
-        if MODE_BREAK_ON_EXCEPTIONS:
-            ce = common_events.CommonEvents(commonevents_name)
-        else:
-            try:
-                ce = common_events.CommonEvents(commonevents_name)
-            except Exception as e:
-                print(e)
-                sys.exit(2)
-        translatable_attrs = dict()
-        translatable_strings = []
-        for event in ce.events:
-            for i, command in enumerate(event.commands):
-                a = dict.fromkeys(attributes_of_command(command))
-                if len(a):
-                    translatable_attrs = translatable_attrs | a
-                s = strings_of_command(command)
-                if not s: continue
-                translatable_strings += [make_csv_field(
-                    strn, command) for strn in s if not MEDIA_EXTENSION_RE.search(strn)]
-        translatable_attrs = [make_csv_field(attr, command) for attr in translatable_attrs]
-        write_translations(commonevents_name, translatable_attrs, translatable_strings, ".dat")
-        tags += search_tags(translatable_attrs)
-        tags += search_tags(translatable_strings)
-        if ENABLE_YAML_DUMPING:
-            yaml_dump.dump(ce, remove_ext(commonevents_name))
-
-    for db_name in db_names:
-        if os.path.isfile(make_postfixed_name(db_name, ATTRIBUTES_DB_POSTFIX, ".dat")):
-            continue
-        base_name = os.path.basename(db_name)
-        print("Extracting", base_name + "...")
-        db_name_only = remove_ext(os.path.basename(db_name))
-        if MODE_BREAK_ON_EXCEPTIONS:
-            db = databases.Database(db_name, os.path.join(os.path.dirname(db_name),  db_name_only + ".dat"))
-        else:
-            try:
-                db = databases.Database(db_name, os.path.join(os.path.dirname(db_name),  db_name_only + ".dat"))
-            except Exception as e:
-                print(e)
-                continue
-        translatable = []
-        test_a = set()
-        for t in db.types:
-            for i, d in enumerate(t.data):
-                if MODE_EXTRACT_DB_NAMES and d.name and d.name not in test_a:
-                    item = d.name.replace('\r', '')
-                    if item.replace('\r','').replace('\n','').strip():
-                        translatable.append([item, ''])
-                        test_a.add(d.name)
-                for l in d.each_translatable():
-                    if len(l) and len(l[0]):
-                        item = l[0].replace('\r', '')
-                        if item not in test_a:
-                            translatable.append([item, ''])#, f"DATABASE@{t.data.index}"])
-                            test_a.add(item)
-
-        extract_previous(os.path.join(
-            os.path.dirname(db_name),
-            db_name_only + ".dat" + ATTRIBUTES_DB_POSTFIX), translatable)
-        write_csv_list(os.path.join(
-            os.path.dirname(db_name),
-            db_name_only + ".dat" + ATTRIBUTES_DB_POSTFIX), translatable)
-        tags += search_tags(translatable)
-        if ENABLE_YAML_DUMPING:
-            yaml_dump.dump(db, remove_ext(db_name))
-
-    tags = [[t, f"{tag_hash(t)};"] for i, t in enumerate(set(tags))]
+
+    # the project key of encrypted games is learned from the first database read and
+    # workers get a copy of the context, so read that one here before handing out the rest
+    if args.j != 1 and db_names and context.proj_key is None:
+        tags += extract_database(db_names.pop(0), opts)
+
+    tasks = [(extract_map, map_name, opts) for map_name in map_names]
+    tasks += [(extract_common_events, name, opts) for name in commonevents_name[:1]]
+    tasks += [(extract_database, db_name, opts) for db_name in db_names]
+    # databases by their .dat, which holds the data
+    sizes = [resource_size(task[1].replace(".project", ".dat"), opts.archive, opts.archive_key) for task in tasks]
+    for task_tags in run_tasks(tasks, args.j, sizes):
+        tags += task_tags
+
+    tags = [[t, f"{tag_hash(t)};"] for t in sorted(set(tags))]
     tags = sorted(tags, reverse=True, key=lambda x: len(x[0]))
     write_csv_list(os.path.join(os.getcwd(), "replacement_tags.csv"), tags)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
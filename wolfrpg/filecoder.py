@@ -1,17 +1,24 @@
-﻿import struct, sys
-from io import BytesIO, SEEK_CUR
+﻿import struct, sys, mmap
 
 DEBUG = True
 this = sys.modules[__name__]
-this.USE_UTF8_STRINGS = None
-this.s_proj_key = None
+
+class CodecContext(object):
+    """ Per-game codec settings shared by every file of one game """
+    def __init__(self, use_utf8: bool = False, proj_key: int = None):
+        self.use_utf8 = use_utf8
+        self.proj_key = proj_key # .project key, learned from the first encrypted .dat read
+
+    def __repr__(self):
+        return f"CodecContext(use_utf8={self.use_utf8}, proj_key={self.proj_key})"
+
+this.DEFAULT_CONTEXT = CodecContext()
 
 def initialize(use_utf8: bool = False):
-    if this.USE_UTF8_STRINGS is None:
-        this.USE_UTF8_STRINGS = use_utf8
-        print(f"UTF-8 strings: {this.USE_UTF8_STRINGS}")
-    else:
-        raise RuntimeError(f"UTF-8 usage already set to {this.USE_UTF8_STRINGS}.")
+    """ Resets the context used by coders that aren't given one and returns it """
+    this.DEFAULT_CONTEXT = CodecContext(use_utf8)
+    print(f"UTF-8 strings: {use_utf8}")
+    return this.DEFAULT_CONTEXT
 
 packer_u1 = struct.Struct('B')
 packer_u4le = struct.Struct('<I') # Little-Endian
@@ -28,7 +35,7 @@ class FileCoder(object):
 
     ##############
     # Attributes #
-    def __init__(self, io, mode, filename=None, seed_indices=None, crypt_header=None, is_db=False, self_io=False):
+    def __init__(self, io, mode, filename=None, seed_indices=None, crypt_header=None, is_db=False, self_io=False, context=None, proj_key=None):
         self.io = io
         self.self_opened_io = self_io
         self.mode = mode
@@ -38,40 +45,79 @@ class FileCoder(object):
         self.seed_indices = seed_indices
         self.crypt_header = crypt_header
         self.is_db = is_db
-        self.is_utf8 = this.USE_UTF8_STRINGS
+        self.context = context if context is not None else this.DEFAULT_CONTEXT
+        self.is_utf8 = self.context.use_utf8
+        self.proj_key = proj_key # key a .project was decrypted with when read, or is encrypted with when written
+
+        # In read mode the whole (decrypted/decompressed) file is kept in `buf`
+        # and parsed through a memoryview with an integer cursor
+        self.buf = None
+        self.view = None
+        self.pos = 0
+        self.size = 0
+
+        # Original bytes of every string read (decoded -> raw) and the reverse
+        # decode cache, so repeated and unchanged strings cost nothing to re-encode
+        self.raw_strings = {}
+        self._decoded = {}
+
+        # In write mode everything is packed into `out` and flushed on close
+        self.out = bytearray()
+        self._str_cache = {}
 
         if mode == 'r':
+            self._set_buffer(self._map_io())
             self._handle_read_mode()
         elif mode == 'w':
             self._handle_write_mode()
 
+    def _map_io(self):
+        try:
+            return mmap.mmap(self.io.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # in-memory streams and empty files can't be mapped
+            return self.io.read()
+
+    def _set_buffer(self, data):
+        self._release_buffer()
+        self.buf = data
+        self.view = memoryview(data)
+        self.pos = 0
+        self.size = len(data)
+
+    def _release_buffer(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if isinstance(self.buf, mmap.mmap):
+            try:
+                self.buf.close()
+            except BufferError:
+                pass # a slice is still referenced (e.g. by a traceback); unmapped on collection
+        self.buf = None
 
     def _handle_read_mode(self):
         is_project = self.filename.endswith('.project')
         is_map = self.filename.endswith('.mps')
-        is_game_dat = self.filename.endswith('Game.dat')
 
         if is_project:
-            if this.s_proj_key is not None:
+            if self.context.proj_key is not None:
                 from .wcrypto import decrypt_proj
-                data = decrypt_proj(self.read(), this.s_proj_key)
-                self.io.close()
-                self.io = BytesIO(data)
-                self.self_opened_io = False
+                data = decrypt_proj(self.read(), self.context.proj_key)
+                self._set_buffer(data)
+                self.proj_key = self.context.proj_key
         else:
             if not self.seed_indices and not is_map:
                 return
             initial_byte = self.byte_at(1)
             if initial_byte == 0x50:
                 from .wcrypto import decrypt_dat_v2
-                data = self.read()
+                data = bytearray(self.read())
                 data = decrypt_dat_v2(data)
                 self.crypt_header = data[:143]
-                self.io.close()
-                self.io = BytesIO(data)
-                self.self_opened_io = False
+                self._set_buffer(data)
                 self.skip(143)
-                this.s_proj_key = self.crypt_header[0x14]
+                self.context.proj_key = self.crypt_header[0x14]
             elif is_map:
                 packed = self.byte_at(20)
                 if packed != 0x65:
@@ -82,35 +128,32 @@ class FileCoder(object):
                 enc_data_size = self.read_u4()
 
                 from lz4.block import decompress
-                dec_data = decompress(self.read(enc_data_size), uncompressed_size=dec_data_size)
+                dec_data = decompress(self.view[self.pos:self.pos + enc_data_size], uncompressed_size=dec_data_size)
                 assert dec_data_size == len(dec_data), "lz4 unpacked wrong size"
 
-                self.io.close()
-                self.io = BytesIO(header + dec_data)
-                self.self_opened_io = False
+                self._set_buffer(header + dec_data)
             else:
                 indicator = self.read_u1()
-                if self.is_db:
-                    if self.byte_at(1) != 0x50 or self.byte_at(5) != 0x54 or self.byte_at(7) != 0x4B:
-                        return
-                elif indicator == 0:
+                is_ptk = self.is_db and self.byte_at(1) == 0x50 and self.byte_at(5) == 0x54 and self.byte_at(7) == 0x4B
+                if indicator == 0 and not is_ptk:
                     return
                 from .wcrypto import decrypt_dat_v1
                 header = indicator.to_bytes(1) + self.read(self.CRYPT_HEADER_SIZE - 1)
                 seeds = [header[i] for i in self.seed_indices]
-                dec_data = decrypt_dat_v1(self.read(), seeds, self.DECRYPT_INTERVALS)
-                self.io.close()
-                self.io = BytesIO(header + dec_data)
-                self.self_opened_io = False
-                if is_game_dat:
+                dec_data = decrypt_dat_v1(bytearray(self.read()), seeds, self.DECRYPT_INTERVALS)
+                self._set_buffer(header + dec_data)
+                if not is_ptk:
+                    # v1 Game.dat and DataBase.dat: the plain header stays in front, written back as is
+                    self.crypt_header = header
+                    self.skip(self.CRYPT_HEADER_SIZE)
                     return
 
                 self.skip(5)
                 key_size = self.read_u4()
                 proj_key = self.read_u1()
 
-                if this.s_proj_key is None:
-                    this.s_proj_key = proj_key
+                if self.context.proj_key is None:
+                    self.context.proj_key = proj_key
 
                 self.skip(key_size - 1)
 
@@ -128,18 +171,25 @@ class FileCoder(object):
         self.close()
 
     def close(self):
+        self._release_buffer()
+        if self.mode == 'w':
+            self.flush()
         if self.self_opened_io:
             self.io.close()
 
     ##################
     #  Class/static  #
     @classmethod
-    def open(cls, source, mode, seed_indices=None, crypt_header=None, is_db=False):
+    def open(cls, source, mode, seed_indices=None, crypt_header=None, is_db=False, context=None, proj_key=None):
         filename = ''
         if isinstance(source, str):
             stream = open(source, mode + 'b')
             filename = source
-        return cls(stream, mode, filename, seed_indices, crypt_header, is_db=is_db, self_io=True)
+        else:
+            # already open file objects, e.g. DXArchive.open_member()
+            stream = source
+            filename = getattr(source, 'name', '')
+        return cls(stream, mode, filename, seed_indices, crypt_header, is_db=is_db, self_io=True, context=context, proj_key=proj_key)
 
     @staticmethod
     def print_stack():
@@ -155,25 +205,32 @@ class FileCoder(object):
         if size and size > 1024 * 1024 * 1024:
             self.print_stack()
             raise Exception(f"data of size = {size} is too big to read")
+        pos = self.pos
         if size:
-            data = self.io.read(size)
+            data = bytes(self.view[pos:pos + size])
+            self.pos = pos + len(data)
             if len(data) != size:
                 print(f"couldn't read required data of size {size} at\n")
                 self.print_stack()
             return data
         else:
-            return self.io.read()
+            self.pos = self.size
+            return bytes(self.view[pos:])
 
     def read_u1(self):
-        return packer_u1.unpack(self.io.read(1))[0]
+        pos = self.pos
+        self.pos = pos + 1
+        return self.view[pos]
 
     def read_u2(self):
-        packer = packer_u2be if self.is_be else packer_u2le
-        return packer.unpack(self.io.read(2))[0]
+        pos = self.pos
+        self.pos = pos + 2
+        return (packer_u2be if self.is_be else packer_u2le).unpack_from(self.view, pos)[0]
 
     def read_u4(self):
-        packer = packer_u4be if self.is_be else packer_u4le
-        return packer.unpack(self.io.read(4))[0]
+        pos = self.pos
+        self.pos = pos + 4
+        return (packer_u4be if self.is_be else packer_u4le).unpack_from(self.view, pos)[0]
 
     def read_string(self):
         size = self.read_u4()
@@ -183,38 +240,57 @@ class FileCoder(object):
             self.print_stack()
             raise Exception(f"string of size {hex(size & 0xFFFFFFFF)} is improbable")
 
-        _bstr = b''
-        if size > 1:
-            _bstr = self.read(size - 1)
-        _last = self.read_u1()
-        if _last != 0:
+        start = self.pos
+        end = start + size - 1
+        if end >= self.size:
+            print(f"couldn't read required data of size {size} at\n")
+            self.print_stack()
+            raise Exception("read string is out of file bounds")
+        self.pos = end + 1
+        if self.view[end] != 0:
             self.print_stack()
             raise Exception("read string is not zero-terminated")
+        if size == 1:
+            return ''
+
+        _bstr = bytes(self.view[start:end])
+        _str = self._decoded.get(_bstr)
+        if _str is not None:
+            return _str
 
-        _str = None
         encoding = 'utf-8' if self.is_utf8 else 'cp932'
         try:
             _str = _bstr.decode(encoding)
         except:
             self.print_stack()
             print(f"bad string encoding ({encoding}): {_bstr} (try -u switch if all strings err)")
-            return _bstr.decode(encoding, errors='ignore')
+            _str = _bstr.decode(encoding, errors='ignore')
+        self._decoded[_bstr] = _str
+        self.raw_strings.setdefault(_str, _bstr)
         return _str
 
     def read_byte_array(self, arr_len = None):
         if arr_len is None:
             arr_len = self.read_u4()
-        return [self.read_u1() for _ in range(arr_len)]
+        pos = self.pos
+        self.pos = pos + arr_len
+        return self.view[pos:pos + arr_len].tolist()
 
     def read_word_array(self, arr_len = None):
         if arr_len is None:
             arr_len = self.read_u4()
-        return [self.read_u2() for _ in range(arr_len)]
+        return self._read_array('H', 2, arr_len)
 
     def read_int_array(self, arr_len = None):
         if arr_len is None:
             arr_len = self.read_u4()
-        return [self.read_u4() for _ in range(arr_len)]
+        return self._read_array('I', 4, arr_len)
+
+    def _read_array(self, code, item_size, arr_len):
+        # one unpack_from for the whole run; struct caches the compiled formats
+        pos = self.pos
+        self.pos = pos + arr_len * item_size
+        return list(struct.unpack_from(f"{'>' if self.is_be else '<'}{arr_len}{code}", self.view, pos))
 
     def read_string_array(self, arr_len = None):
         if arr_len is None:
@@ -222,24 +298,23 @@ class FileCoder(object):
         return [self.read_string() for _ in range(arr_len)]
 
     def verify(self, expected, final=False):
-        have = self.read(len(expected))
+        pos = self.pos
+        have = self.view[pos:pos + len(expected)]
         if have != expected:
-            self.io.seek(-len(expected), SEEK_CUR)
+            have = bytes(have)
             #self.print_stack()
             if DEBUG and final:
                 from .debuging import underline_differences
                 underline_differences(expected, have)
             raise Exception(f"Verification failed: expected {expected}, got {have}")
+        self.pos = pos + len(expected)
         return True
 
     def skip(self, size):
-        self.io.seek(size, SEEK_CUR)
+        self.pos += size
 
     def peek(self, n_bytes=1):
-        pos = self.io.tell()
-        data = self.read(n_bytes)
-        self.io.seek(pos)
-        return data
+        return bytes(self.view[self.pos:self.pos + n_bytes])
 
     def delimit(self, i):
         if i % 16 == 0:
@@ -252,64 +327,114 @@ class FileCoder(object):
         print("\n")
 
     def dump_until(self, pattern):
-        _str = b''
-        while not _str.ends_with(pattern):
-            _str = self.io.read(1)
+        end = self.buf.find(pattern, self.pos)
+        end = self.size if end < 0 else end + len(pattern)
+        _str = self.read(end - self.pos)
         for i in range(0, len(_str) - len(pattern)):
             print(" %02x" % _str[i], end='')
             self.delimit(i)
         print("\n")
 
     def filesize(self):
-        pos = self.io.tell()
-        size = self.io.seek(-1, 2)
-        self.io.seek(pos)
-        return size
+        if self.view is None:
+            pos = self.io.tell()
+            size = self.io.seek(-1, 2)
+            self.io.seek(pos)
+            return size
+        return self.size - 1
 
     def byte_at(self, pos):
-        pos_old = self.io.tell()
-        self.io.seek(pos)
-        ret = self.read_u1()
-        self.io.seek(pos_old)
-        return ret
+        return self.view[pos]
+
+    def raw_string_table(self):
+        """ Returns the original bytes of the strings read so far, to be handed to restore_raw_strings() """
+        return (bool(self.is_utf8), self.raw_strings)
 
     #########
     # Write #
+    def restore_raw_strings(self, table):
+        """ Makes strings that weren't changed since reading be written back byte-for-byte """
+        if table is None: return
+        is_utf8, raw_strings = table
+        if is_utf8 == bool(self.is_utf8):
+            self._str_cache.update(raw_strings)
+
+    def reserve(self, size):
+        """ Preallocates room for `size` more bytes so the writes below pack in place """
+        missing = self.pos + size - len(self.out)
+        if missing > 0:
+            self.out.extend(bytes(missing))
+
+    def flush(self):
+        if self.pos == 0: return
+        data = memoryview(self.out)[:self.pos]
+        if self.seed_indices and self.crypt_header and self.crypt_header[1] == 0x50:
+            from .wcrypto import encrypt_dat_v2
+            encrypt_dat_v2(data)
+            nb = self.io.write(data)
+        elif self.seed_indices and self.crypt_header:
+            # v1: the header stays plain, the rest gets the same rand() streams it was read with
+            from .wcrypto import decrypt_dat_v1_range
+            seeds = [self.crypt_header[i] for i in self.seed_indices]
+            nb = self.io.write(data[:self.CRYPT_HEADER_SIZE])
+            nb += self._write_encrypted(data[self.CRYPT_HEADER_SIZE:], decrypt_dat_v1_range,
+                                        seeds, self.DECRYPT_INTERVALS)
+        elif self.proj_key is not None:
+            from .wcrypto import decrypt_proj_range
+            nb = self._write_encrypted(data, decrypt_proj_range, self.proj_key)
+        else:
+            nb = self.io.write(data)
+        data.release()
+        if nb != self.pos:
+            raise Exception("not all of %d bytes written" %(self.pos,))
+        self.out = bytearray()
+        self.pos = 0
+
+    def _write_encrypted(self, data, xor_range, *key):
+        """ XORs `data` with its keystream one chunk at a time, writing each chunk out as soon as it's done """
+        from .wcrypto import DECRYPT_CHUNK_SIZE
+        nb = 0
+        for offset in range(0, len(data), DECRYPT_CHUNK_SIZE):
+            with data[offset:offset + DECRYPT_CHUNK_SIZE] as chunk:
+                xor_range(chunk, offset, *key)
+                nb += self.io.write(chunk)
+        return nb
+
+    def _grow(self, size):
+        # used only when the structure didn't reserve its byte_size()
+        self.out.extend(bytes(max(size, len(self.out))))
+
     def write(self, data):
         if data is None: return 0
         nb = len(data)
-        if nb > 0 and self.io.write(data) != nb:
-            raise Exception("not all of %d bytes written" %(nb,))
+        pos = self.pos
+        self.out[pos:pos + nb] = data
+        self.pos = pos + nb
         return nb
 
     def write_terminator(self, _byte = 0):
         self.write_u1(_byte)
 
     def write_u1(self, data):
-        self.io.write(packer_u1.pack(data))
+        pos = self.pos
+        if pos >= len(self.out): self._grow(1)
+        self.out[pos] = data
+        self.pos = pos + 1
 
     def write_u2(self, data):
-        packer = packer_u2be if self.is_be else packer_u2le
-        self.io.write(packer.pack(data))
+        pos = self.pos
+        if pos + 2 > len(self.out): self._grow(2)
+        (packer_u2be if self.is_be else packer_u2le).pack_into(self.out, pos, data)
+        self.pos = pos + 2
 
     def write_u4(self, data):
-        packer = packer_u4be if self.is_be else packer_u4le
-        self.io.write(packer.pack(data))
+        pos = self.pos
+        if pos + 4 > len(self.out): self._grow(4)
+        (packer_u4be if self.is_be else packer_u4le).pack_into(self.out, pos, data)
+        self.pos = pos + 4
 
     def write_string(self, data):
-        _str = None
-        try:
-            if not self.is_utf8:
-                _str = data.encode('cp932')
-            else:
-                _str = data.encode('utf-8')
-        except:
-            try:
-                _str = data.encode('utf-8')
-            except:
-                pass
-        if _str is None:
-            raise Exception(f'Failed to save string {data}')
+        _str = self.encode_string(data)
         self.write_u4(len(_str) + 1)
         self.write(_str)
         self.write_terminator()
@@ -317,20 +442,24 @@ class FileCoder(object):
     def write_byte_array(self, data, with_length=True):
         if with_length:
             self.write_u4(len(data))
-        for b in data:
-            self.write_u1(b)
+        self.write(bytes(data))
 
     def write_word_array(self, data, with_length=True):
         if with_length:
             self.write_u4(len(data))
-        for b in data:
-            self.write_u2(b)
+        self._write_array('H', 2, data)
 
     def write_int_array(self, data, with_length=True):
         if with_length:
             self.write_u4(len(data))
-        for i in data:
-            self.write_u4(i)
+        self._write_array('I', 4, data)
+
+    def _write_array(self, code, item_size, data):
+        pos = self.pos
+        size = len(data) * item_size
+        if pos + size > len(self.out): self._grow(size)
+        struct.pack_into(f"{'>' if self.is_be else '<'}{len(data)}{code}", self.out, pos, *data)
+        self.pos = pos + size
 
     def write_string_array(self, data, with_length=True):
         if with_length:
@@ -340,19 +469,29 @@ class FileCoder(object):
 
     #########
     #   Other  #
-    def calc_string_size(self, data):
-        size = -1
+    def encode_string(self, data):
+        _str = self._str_cache.get(data)
+        if _str is not None:
+            return _str
         try:
             if not self.is_utf8:
                 _str = data.encode('cp932')
-                size = len(_str)
             else:
                 _str = data.encode('utf-8')
-                size = len(_str)
         except:
-            _str = data.encode('utf-8')
-            size = len(_str)
-        return size + 1
+            try:
+                _str = data.encode('utf-8')
+            except:
+                raise Exception(f'Failed to save string {data}')
+        self._str_cache[data] = _str
+        return _str
+
+    def calc_string_size(self, data):
+        return len(self.encode_string(data)) + 1
+
+    def string_byte_size(self, data):
+        """ Size of a length-prefixed, zero-terminated string as written by write_string """
+        return len(self.encode_string(data)) + 5
 
     @property
     def encrypted(self):
@@ -360,14 +499,9 @@ class FileCoder(object):
 
     @property
     def eof(self):
-        io = self.io
-        if io.read(1) == b'':
-            return True
-        else:
-            io.seek(-1, SEEK_CUR)
-        return False
+        return self.pos >= self.size
 
     @property
     def tell(self):
-        pos = self.io.tell()
-        return (pos + self.CRYPT_HEADER_SIZE) if self.encrypted else pos
+        # any crypt header is part of the buffer, so this is the offset in the file
+        return self.pos
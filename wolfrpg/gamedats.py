@@ -170,8 +170,7 @@ class ByteSettings():
             coder.write_u1(self.pro_loading_fadein)
             coder.write_u1(self.pro_loading_fadeout)
         if self._u1_count > 35:
-            for setting in self.settings_new:
-                coder.write_u1(setting)
+            coder.write_byte_array(self.settings_new, False)
 
     def byte_size(self):
         return 4 + self._u1_count
@@ -241,8 +240,7 @@ class WordSettings():
         if self._u2_count > 22:
             coder.write_u2(self.pro_default_screen_scale)
         if self._u2_count > 23:
-            for setting in self.settings_new:
-                coder.write_u2(setting)
+            coder.write_word_array(self.settings_new, False)
 
     def byte_size(self):
         return 4 + self._u2_count * 2
@@ -258,8 +256,9 @@ class GameDat():
     def encrypted(self):
         return self.crypt_header != None
 
-    def __init__(self, filename):
-        with FileCoder.open(filename, 'r', self.SEED_INDICES) as coder:
+    def __init__(self, filename, context=None):
+        self.context = context
+        with FileCoder.open(filename, 'r', self.SEED_INDICES, context=context) as coder:
             if coder.encrypted:
                 self.crypt_header = coder.crypt_header
             else:
@@ -268,6 +267,7 @@ class GameDat():
 
             self.encoding_type = coder.read_u1()
             coder.is_utf8 = EncodingType(self.encoding_type) == EncodingType.UNICODE
+            self._raw_strings = coder.raw_string_table()
 
             self.byte_settings = ByteSettings(coder)
             self.string_settings = StringSettings(coder)
@@ -292,7 +292,8 @@ class GameDat():
     def write(self, filename):
         global HAS_SOLVER
         stream = BytesIO()
-        with FileCoder(stream, 'w', filename, self.SEED_INDICES, self.crypt_header) as coder:
+        with FileCoder(stream, 'w', filename, self.SEED_INDICES, self.crypt_header, context=getattr(self, 'context', None)) as coder:
+            coder.restore_raw_strings(getattr(self, '_raw_strings', None))
             if not self.encrypted:
                 coder.write(self.GAMEDAT_MAGIC)
             coder.write_u1(self.encoding_type)
@@ -333,7 +334,8 @@ class GameDat():
 
     def byte_size(self, coder):
         size = 0
-        size += len(self.GAMEDAT_MAGIC)
+        # file_size is the length of the file minus one: the 0 indicator, or a byte of the crypt header
+        size += (len(self.crypt_header) - 1) if self.encrypted else len(self.GAMEDAT_MAGIC)
         size += 1 # for encoding_type
         size += self.byte_settings.byte_size()
         size += self.string_settings.byte_size(coder)
@@ -13,9 +13,10 @@ class Map():
     MAP_EVENT_MARKER = 0x6F
     MAP_TERMINATOR = 0x66
 
-    def __init__(self, filename):
-        self.filename = filename
-        with FileCoder.open(filename, 'r') as coder:
+    def __init__(self, filename, context=None):
+        self.filename = getattr(filename, 'name', filename)
+        self.context = context
+        with FileCoder.open(filename, 'r', context=context) as coder:
             try:
                 coder.verify(self.MAP_MAGIC)
             except:
@@ -23,6 +24,7 @@ class Map():
 
             self.encoding_type = coder.read_u4()
             coder.is_utf8 = EncodingType(self.encoding_type) == EncodingType.UNICODE
+            self._raw_strings = coder.raw_string_table()
 
             self.attributes = coder.read_u4() # 100
             self.version = coder.read_u1() # 100, 101, 102 etc
@@ -69,8 +71,23 @@ class Map():
             if not coder.eof:
                 raise Exception(f"file is not fully parsed")
 
+    def byte_size(self, coder):
+        size = len(self.MAP_MAGIC) + 4 + 4 + 1
+        size += coder.string_byte_size(self.unknown_str)
+        size += 4 + 4 + 4 + 4
+        if self.encoding_type and self.no_tiles:
+            size += 4
+        if not self.no_tiles:
+            size += len(self.tiles)
+        for event in self.events:
+            if not event: continue
+            size += 1 + event.byte_size(coder)
+        return size + 1
+
     def write(self, filename):
-        with FileCoder.open(filename, 'w') as coder:
+        with FileCoder.open(filename, 'w', context=getattr(self, 'context', None)) as coder:
+            coder.restore_raw_strings(getattr(self, '_raw_strings', None))
+            coder.reserve(self.byte_size(coder))
             coder.write(self.MAP_MAGIC)
             coder.write_u4(self.encoding_type)
             coder.write_u4(self.attributes)
@@ -100,6 +117,8 @@ class Map():
     def __getstate__(self):
         state = self.__dict__.copy()
         del state['filename']
+        state.pop('_raw_strings', None)
+        state.pop('context', None)
         return state
 
     #--------DEBUG method that searches for a string somewhere in the map ----------
@@ -154,6 +173,13 @@ class Map():
             if indicator != self.EVENT_TERMINATOR: # 112
                 raise Exception(f"unexpected event terminator: {hex(indicator)}")
 
+        def byte_size(self, coder):
+            size = len(self.EVENT_MAGIC1) + 4 + coder.string_byte_size(self.name) + 4 + 4 + 4
+            size += len(self.EVENT_MAGIC2)
+            for page in self.pages:
+                size += 1 + page.byte_size(coder)
+            return size + 1
+
         def write(self, coder):
             coder.write(self.EVENT_MAGIC1)
             coder.write_u4(self.id)
@@ -218,6 +244,18 @@ class Map():
                 if p_terminator != self.PAGE_TERMINATOR:
                     raise Exception(f"unexpected page terminator: {hex(p_terminator)}")
 
+            def byte_size(self, coder):
+                size = 4 + coder.string_byte_size(self.graphic_name) + 4
+                size += len(self.conditions) + len(self.movement) + 1 + 1
+                size += 4 + sum(pt.byte_size() for pt in self.route)
+                size += 4
+                for cmd in self.commands:
+                    size += cmd.byte_size(coder)
+                size += 4 + 1 + 1 + 1
+                if self.features > 3:
+                    size += 1
+                return size + 1
+
             def write(self, coder):
                 coder.write_u4(self.unknown1)
 
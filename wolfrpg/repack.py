@@ -9,17 +9,7 @@ from wolfrpg.simple_trie import *
 
 DROP_EMTPY = False
 ENABLE_YAML_DUMPING = False
-
-MODE_ALLOW_COMMENTS = False
-MODE_REPACK_CE_PARAMS = False
-MODE_REPACK_CEBN_PARAMS = False
-MODE_REPACK_DB_NAMES = False
-MODE_SETSTRING_AS_STRING = True
-MODE_CEARG_AS_STRING = True
-MODE_REPACK_CE_ARG_N = []
-MODE_REPACK_CEBN_ARG_N = []
-MODE_REPACK_CE_EVID = []
-MODE_REPACK_CEBN_EVID = []
+MODE_BREAK_ON_EXCEPTIONS = False
 
 STRINGS_NAME = "strings"
 ATTRIBUTES_NAME = "attributes"
@@ -28,17 +18,62 @@ ATTRIBUTES_DB_POSTFIX = "_" + ATTRIBUTES_NAME + ".csv"
 DEFAULT_OUT_DIR = "translation_out"
 COMMENT_TAG = "//"
 
-def is_string_command(command):
+class RepackOptions(object):
+    """ Repacking switches and codec context of one game, passed around instead of globals """
+    def __init__(self, context=None):
+        self.context = context if context is not None else filecoder.CodecContext()
+        self.allow_comments = False
+        self.repack_ce_params = False
+        self.repack_cebn_params = False
+        self.repack_db_names = False
+        self.setstring_as_string = True
+        self.cearg_as_string = True
+        self.repack_ce_arg_n = []
+        self.repack_cebn_arg_n = []
+        self.repack_ce_evid = []
+        self.repack_cebn_evid = []
+        self.out_dir = DEFAULT_OUT_DIR
+        self.archive = None # resources are read from this .wolf archive instead of the game folder
+        self.archive_key = None
+
+    def open(self, path):
+        """ What the structure readers should open for the resource at `path` """
+        return open_resource(path, self.archive, self.archive_key)
+
+    @classmethod
+    def from_args(cls, args):
+        # since we detect version == 3 at later stages of decoding we need to specify it beforehand
+        opts = cls(filecoder.CodecContext(args.u))
+        opts.setstring_as_string = args.s
+        opts.cearg_as_string = args.a
+        opts.repack_db_names = args.n
+        opts.repack_ce_params = args.c
+        opts.repack_cebn_params = args.b
+
+        ce_arg_n = [] if not args.ea or args.ea == "0" else args.ea.split(',')
+        opts.repack_ce_evid = [int(i.split('|')[1]) if len(i.split('|'))>1 else -1 for i in ce_arg_n if len(i.split('|'))>1]
+        opts.repack_ce_arg_n = [int(i.split('|')[0]) for i in ce_arg_n]
+        cebn_arg_n = [] if not args.na or args.na == "0" else args.na.split(',')
+        opts.repack_cebn_evid = [int(i.split('|')[1]) if len(i.split('|'))>1 else -1 for i in cebn_arg_n if len(i.split('|'))>1]
+        opts.repack_cebn_arg_n = [int(i.split('|')[0]) for i in cebn_arg_n]
+
+        if os.path.isdir(args.out):
+            opts.out_dir = args.out
+        opts.archive = args.w
+        opts.archive_key = args.k.encode() if args.k else None
+        return opts
+
+def is_string_command(command, opts):
     return isinstance(command, (commands.Message, commands.SetString)) or \
-           (isinstance(command, commands.CommonEvent) and MODE_REPACK_CE_PARAMS and MODE_CEARG_AS_STRING) or \
-           (isinstance(command, commands.CommonEventByName) and MODE_REPACK_CEBN_PARAMS and MODE_CEARG_AS_STRING)
+           (isinstance(command, commands.CommonEvent) and opts.repack_ce_params and opts.cearg_as_string) or \
+           (isinstance(command, commands.CommonEventByName) and opts.repack_cebn_params and opts.cearg_as_string)
 
-def is_attribute_command(command):
+def is_attribute_command(command, opts):
     return isinstance(command, (commands.Choices, commands.StringCondition, commands.Picture,
                                 commands.Database)) or \
-           (isinstance(command, commands.CommonEvent) and MODE_REPACK_CE_PARAMS and not MODE_CEARG_AS_STRING) or \
-           (isinstance(command, commands.CommonEventByName) and MODE_REPACK_CEBN_PARAMS and not MODE_CEARG_AS_STRING) or \
-           (isinstance(command, commands.SetString) and not MODE_SETSTRING_AS_STRING)
+           (isinstance(command, commands.CommonEvent) and opts.repack_ce_params and not opts.cearg_as_string) or \
+           (isinstance(command, commands.CommonEventByName) and opts.repack_cebn_params and not opts.cearg_as_string) or \
+           (isinstance(command, commands.SetString) and not opts.setstring_as_string)
 
 def build_ce_trie(ce):
     trie = Trie()
@@ -62,7 +97,7 @@ def build_map_trie(mp):
                             trie.insert(line, type(command).__name__, (event_index, page_index, command_index), line_index)
     return trie
 
-def apply_translations(target, strs, attrs, trie):
+def apply_translations(target, strs, attrs, trie, opts):
     ret_translated = False
     len_strs = len(strs)
     len_attrs = len(attrs)
@@ -74,9 +109,9 @@ def apply_translations(target, strs, attrs, trie):
         is_translated = False
         if not DROP_EMTPY and not translated: return False
         if is_string:
-            if not is_string_command(command): return False
+            if not is_string_command(command, opts): return False
         else:
-            if not is_attribute_command(command): return False
+            if not is_attribute_command(command, opts): return False
 
         if isinstance(command, (
                 commands.Message, commands.Picture,
@@ -95,10 +130,10 @@ def apply_translations(target, strs, attrs, trie):
                     is_translated = True
         elif isinstance(command, commands.CommonEvent):
             for i, line in enumerate(command.string_args):
-                if len(MODE_REPACK_CE_ARG_N):
-                    for j, evid in enumerate(MODE_REPACK_CE_EVID):
+                if len(opts.repack_ce_arg_n):
+                    for j, evid in enumerate(opts.repack_ce_evid):
                         if command.args[1] == evid or evid == -1:
-                            if i + 1 == MODE_REPACK_CE_ARG_N[j] and normalize_n(line, True) == original:
+                            if i + 1 == opts.repack_ce_arg_n[j] and normalize_n(line, True) == original:
                                 command.string_args[i] = normalize_n(translated)
                                 is_translated = True
                                 break
@@ -107,10 +142,10 @@ def apply_translations(target, strs, attrs, trie):
                     is_translated = True
         elif isinstance(command, commands.CommonEventByName):
             for i, line in enumerate(command.string_args):
-                if len(MODE_REPACK_CEBN_ARG_N):
-                    for j, nevid in enumerate(MODE_REPACK_CEBN_EVID):
+                if len(opts.repack_cebn_arg_n):
+                    for j, nevid in enumerate(opts.repack_cebn_evid):
                         if command.args[1] == nevid or nevid == -1:
-                            if i + 1 == MODE_REPACK_CEBN_ARG_N[j] and normalize_n(line, True) == original:
+                            if i + 1 == opts.repack_cebn_arg_n[j] and normalize_n(line, True) == original:
                                 command.string_args[i] = normalize_n(translated)
                                 is_translated = True
                                 break
@@ -210,27 +245,92 @@ def make_dirs(path):
     if d != '' and not os.path.exists(d):
         os.makedirs(d, exist_ok=True)
 
-def make_out_name(name, work_dir):
-    new_name = name.replace(work_dir, os.path.join(work_dir, DEFAULT_OUT_DIR))
+def make_out_name(name, work_dir, out_dir=DEFAULT_OUT_DIR, archive=None):
+    """ `name` moved into `out_dir`, keeping its path below the game folder (or the folder of the -w archive) """
+    base = os.path.dirname(archive_dir(archive)) if archive else work_dir
+    new_name = os.path.join(work_dir, out_dir, os.path.relpath(name, base))
     make_dirs(new_name)
     return new_name
 
 
-def main():
-    global MODE_SETSTRING_AS_STRING
-    global MODE_CEARG_AS_STRING
-    global MODE_REPACK_DB_NAMES
-    global MODE_REPACK_CE_PARAMS
-    global MODE_REPACK_CEBN_PARAMS
-    global MODE_ALLOW_COMMENTS
-
-    global MODE_REPACK_CE_ARG_N
-    global MODE_REPACK_CEBN_ARG_N
-    global MODE_REPACK_CE_EVID
-    global MODE_REPACK_CEBN_EVID
+def repack_map(map_name, work_dir, opts):
+    """ Applies the translations of one map and writes it to the output directory """
+    strs = read_string_translations(map_name, ".mps")
+    attrs = read_attribute_translations(map_name, ".mps")
+    if not strs and not attrs: return
+    print(f"Translating map {os.path.relpath(map_name)}...")
+    if MODE_BREAK_ON_EXCEPTIONS:
+        mp = maps.Map(opts.open(map_name), opts.context)
+    else:
+        try:
+            mp = maps.Map(opts.open(map_name), opts.context)
+        except Exception as e:
+            print(f"FAILED: {e}")
+            return
+    map_trie = build_map_trie(mp)
+    is_translated = apply_translations(mp, strs, attrs, map_trie, opts)
+    if is_translated:
+        mp.write(make_out_name(map_name, work_dir, opts.out_dir, opts.archive))
+    if ENABLE_YAML_DUMPING:
+        yaml_dump.dump(mp, remove_ext(map_name))
+
+def repack_common_events(commonevents_name, work_dir, opts):
+    """ Applies the translations of CommonEvent.dat and writes it to the output directory """
+    strs = read_string_translations(commonevents_name, ".dat")
+    attrs = read_attribute_translations(commonevents_name, ".dat")
+    if not strs and not attrs: return
+    print(f"Translating common events {os.path.relpath(commonevents_name)}...")
+    if MODE_BREAK_ON_EXCEPTIONS:
+        ce = common_events.CommonEvents(opts.open(commonevents_name), opts.context)
+    else:
+        try:
+            ce = common_events.CommonEvents(opts.open(commonevents_name), opts.context)
+        except Exception as e:
+            print(f"FAILED: {e}")
+            sys.exit(1)
+    print_progress(0, 100)
+    ce_trie = build_ce_trie(ce)
+    is_translated = apply_translations(ce, strs, attrs, ce_trie, opts)
+    print_progress(100, 100)
+    if is_translated:
+        ce.write(make_out_name(commonevents_name, work_dir, opts.out_dir, opts.archive))
+    if ENABLE_YAML_DUMPING:
+        yaml_dump.dump(ce, remove_ext(commonevents_name))
+
+def repack_database(db_name, work_dir, opts):
+    """ Applies the translations of one .project/.dat database and writes both to the output directory """
+    attrs = read_attribute_translations(db_name, ".dat")
+    if not attrs: return
+    print(f"Translating database {os.path.relpath(db_name)}...")
+    db_name_only = remove_ext(os.path.basename(db_name))
+    if not resource_exists(db_name.replace(".project", ".dat"), opts.archive, opts.archive_key):
+        print("No .dat file for", db_name)
+        return
+    if MODE_BREAK_ON_EXCEPTIONS:
+        db = databases.Database(opts.open(db_name), opts.open(os.path.join(os.path.dirname(db_name),  db_name_only + ".dat")), opts.context)
+    else:
+        try:
+            db = databases.Database(opts.open(db_name), opts.open(os.path.join(os.path.dirname(db_name),  db_name_only + ".dat")), opts.context)
+        except Exception as e:
+            print("Skipping", db_name, "due to error:\n", e,"\n")
+            return
+    for t in db.types:
+        for i, d in enumerate(t.data):
+            if opts.repack_db_names and hasattr(d, "name"):
+                if d.name in attrs and attrs[d.name]:
+                    #print(t.data[i], d.name, at[1])
+                    t.data[i].name =  attrs[d.name].replace('\r', '').replace('\n', '\r\n')
+            for j, l in enumerate(d.each_translatable()):
+                if l[0] in attrs and attrs[l[0]]:
+                    #print(t.data[i], l[0], at[1])
+                    t.data[i].set_field(l[1],  attrs[l[0]].replace('\r', '').replace('\n', '\r\n'))
+    out_name = make_out_name(db_name, work_dir, opts.out_dir, opts.archive)
+    db.write(out_name, remove_ext(out_name) + '.dat')
+    if ENABLE_YAML_DUMPING:
+        yaml_dump.dump(db, remove_ext(db_name))
 
-    global DEFAULT_OUT_DIR
 
+def main():
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", default="maps,common,game,dbs", help="Types of files to repack (maps,common,game,dbs)")
@@ -245,120 +345,42 @@ def main():
                         help="Comma separated list of allowed CommonEventByName args (#|id; ex: 3|12345,5|12345,3|67890)")
     parser.add_argument("-u", help="Repack strings as UTF-8", action="store_true")
     parser.add_argument("-out", default=DEFAULT_OUT_DIR, help="Output directory")
+    parser.add_argument("-j", type=int, default=1, metavar="N", help="Number of parallel worker processes (0 = all CPUs)")
+    parser.add_argument("-w", default=None, metavar="archive", help="Read resources straight from this .wolf archive (Data.wolf -> Data/...)")
+    parser.add_argument("-k", default=None, metavar="key", help="Key string of the -w archive (default: the WolfRPG one)")
     args = parser.parse_args()
     print(args)
 
-    if os.path.isdir(args.out):
-        DEFAULT_OUT_DIR = args.out
+    opts = RepackOptions.from_args(args)
+    context = opts.context
     print(f"Output directory: {os.path.abspath(args.out)}")
-
-    MODE_SETSTRING_AS_STRING = args.s
-    MODE_CEARG_AS_STRING = args.a
-    MODE_REPACK_DB_NAMES =  args.n
-    MODE_REPACK_CE_PARAMS = args.c
-    MODE_REPACK_CEBN_PARAMS = args.b
-
-    MODE_REPACK_CE_ARG_N = [] if not args.ea or args.ea == "0" else args.ea.split(',')
-    MODE_REPACK_CE_EVID = [int(i.split('|')[1]) if len(i.split('|'))>1 else -1 for i in MODE_REPACK_CE_ARG_N if len(i.split('|'))>1]
-    MODE_REPACK_CE_ARG_N = [int(i.split('|')[0]) for i in MODE_REPACK_CE_ARG_N]
-    MODE_REPACK_CEBN_ARG_N = [] if not args.na or args.na == "0" else args.na.split(',')
-    MODE_REPACK_CEBN_EVID = [int(i.split('|')[1]) if len(i.split('|'))>1 else -1 for i in MODE_REPACK_CEBN_ARG_N if len(i.split('|'))>1]
-    MODE_REPACK_CEBN_ARG_N = [int(i.split('|')[0]) for i in MODE_REPACK_CEBN_ARG_N]
-
-    MODE_BREAK_ON_EXCEPTIONS = False
-
-    filecoder.initialize(args.u) # since we detect version == 3 at later stages of decoding we need to specify it beforehand
+    print(f"UTF-8 strings: {context.use_utf8}")
 
     work_dir = os.getcwd()
 
-    map_names = list(filter(lambda x: "translation_out" not in x, search_resource(os.getcwd(), "*.mps"))) if "maps" in args.f else []  # map data
-    commonevents_name = list(filter(lambda x: "translation_out" not in x, search_resource(os.getcwd(), "CommonEvent.dat"))) if "common" in args.f else []  # common events
-    dat_name = list(filter(lambda x: "translation_out" not in x, search_resource(os.getcwd(), "Game.dat"))) if "game" in args.f else []  # basicdata
-    db_names = list(filter(lambda x: "wolfrpg" not in x and "SysDataBaseBasic" not in x and "translation_out" not in x, search_resource(
-        os.getcwd(), "*.project"))) if "dbs" in args.f else []  # projects
+    search = (lambda name: search_archive(opts.archive, name, opts.archive_key)) if opts.archive else (
+        lambda name: search_resource(os.getcwd(), name))
+    map_names = list(filter(lambda x: "translation_out" not in x, search("*.mps"))) if "maps" in args.f else []  # map data
+    commonevents_name = list(filter(lambda x: "translation_out" not in x, search("CommonEvent.dat"))) if "common" in args.f else []  # common events
+    dat_name = list(filter(lambda x: "translation_out" not in x, search("Game.dat"))) if "game" in args.f else []  # basicdata
+    db_names = list(filter(lambda x: "wolfrpg" not in x and "SysDataBaseBasic" not in x and "translation_out" not in x, search(
+        "*.project"))) if "dbs" in args.f else []  # projects
 
 
-    #maps_cache = dict()
     if map_names:
         print("Translating maps...")
-    for map_name in map_names:
-        strs = read_string_translations(map_name, ".mps")
-        attrs = read_attribute_translations(map_name, ".mps")
-        if not strs and not attrs: continue
-        print(f"Translating map {os.path.relpath(map_name)}...")
-        if MODE_BREAK_ON_EXCEPTIONS:
-            mp = maps.Map(map_name)
-        else:
-            try:
-                mp = maps.Map(map_name)
-            except Exception as e:
-                print(f"FAILED: {e}")
-                continue
-        #maps_cache[map_name] = mp
-        if strs or attrs:
-            map_trie = build_map_trie(mp)
-            is_translated = apply_translations(mp, strs, attrs, map_trie)
-            if is_translated:
-                mp.write(make_out_name(map_name, work_dir))
-            if ENABLE_YAML_DUMPING:
-                yaml_dump.dump(mp, remove_ext(map_name))
-
-
-    if commonevents_name:
-        commonevents_name = commonevents_name[0]
-        strs = read_string_translations(commonevents_name, ".dat")
-        attrs = read_attribute_translations(commonevents_name, ".dat")
-        if strs or attrs:
-            print(f"Translating common events {os.path.relpath(commonevents_name)}...")
-            if MODE_BREAK_ON_EXCEPTIONS:
-                ce = common_events.CommonEvents(commonevents_name)
-            else:
-                try:
-                    ce = common_events.CommonEvents(commonevents_name)
-                except Exception as e:
-                    print(f"FAILED: {e}")
-                    sys.exit(1)
-            print_progress(0, 100)
-            ce_trie = build_ce_trie(ce)
-            is_translated = apply_translations(ce, strs, attrs, ce_trie)
-            print_progress(100, 100)
-            if is_translated:
-                ce.write(make_out_name(commonevents_name, work_dir))
-            if ENABLE_YAML_DUMPING:
-                yaml_dump.dump(ce, remove_ext(commonevents_name))
-
     if db_names:
         print("Translating project databases...")
-    for db_name in db_names:
-        attrs = read_attribute_translations(db_name, ".dat")
-        if not attrs: continue
-        print(f"Translating database {os.path.relpath(db_name)}...")
-        db_name_only = remove_ext(os.path.basename(db_name))
-        if not os.path.isfile(db_name.replace(".project", ".dat")):
-            print("No .dat file for", db_name)
-            continue
-        if MODE_BREAK_ON_EXCEPTIONS:
-            db = databases.Database(db_name, os.path.join(os.path.dirname(db_name),  db_name_only + ".dat"))
-        else:
-            try:
-                db = databases.Database(db_name, os.path.join(os.path.dirname(db_name),  db_name_only + ".dat"))
-            except Exception as e:
-                print("Skipping", db_name, "due to error:\n", e,"\n")
-                continue
-        for t in db.types:
-            for i, d in enumerate(t.data):
-                if MODE_REPACK_DB_NAMES and hasattr(d, "name"):
-                    if d.name in attrs and attrs[d.name]:
-                        #print(t.data[i], d.name, at[1])
-                        t.data[i].name =  attrs[d.name].replace('\r', '').replace('\n', '\r\n')
-                for j, l in enumerate(d.each_translatable()):
-                    if l[0] in attrs and attrs[l[0]]:
-                        #print(t.data[i], l[0], at[1])
-                        t.data[i].set_field(l[1],  attrs[l[0]].replace('\r', '').replace('\n', '\r\n'))
-        out_name = make_out_name(db_name, work_dir)
-        db.write(out_name, remove_ext(out_name) + '.dat')
-        if ENABLE_YAML_DUMPING:
-            yaml_dump.dump(db, remove_ext(db_name))
+    tasks = [(repack_map, map_name, work_dir, opts) for map_name in map_names]
+    tasks += [(repack_common_events, name, work_dir, opts) for name in commonevents_name[:1]]
+    # the project key of encrypted games is learned from the first database read and
+    # workers get a copy of the context, so read that one here before handing out the rest
+    if args.j != 1 and db_names and context.proj_key is None:
+        repack_database(db_names.pop(0), work_dir, opts)
+    tasks += [(repack_database, db_name, work_dir, opts) for db_name in db_names]
+    # databases by their .dat, which holds the data
+    sizes = [resource_size(task[1].replace(".project", ".dat"), opts.archive, opts.archive_key) for task in tasks]
+    run_tasks(tasks, args.j, sizes)
 
     if dat_name:
         dat_name = dat_name[0]
@@ -366,12 +388,12 @@ def main():
         if strs:
             print(f"Translating game database {os.path.relpath(dat_name)}...")
             if MODE_BREAK_ON_EXCEPTIONS:
-                gd = gamedats.GameDat(dat_name)
+                gd = gamedats.GameDat(opts.open(dat_name), context)
             else:
                 try:
-                    gd = gamedats.GameDat(dat_name)
+                    gd = gamedats.GameDat(opts.open(dat_name), context)
                 except Exception as e:
-                    print("Skipping", db_name, "due to error:\n", e,"\n")
+                    print("Skipping", dat_name, "due to error:\n", e,"\n")
                     sys.exit(1)
 
             # NOTE: since we are translating set system language as English
@@ -393,7 +415,7 @@ def main():
                         if line[2] == f"SUBFONT{i}":
                             gds.subfonts[i] = line[1]
                             break
-            gd.write(make_out_name(dat_name, work_dir))
+            gd.write(make_out_name(dat_name, work_dir, opts.out_dir, opts.archive))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -13,16 +13,18 @@ class RouteCommand():
         # Read all data for this movement command from file
         _id = coder.read_u1()
         args_len = coder.read_u1()
-        _args = [coder.read_u4() for _ in range(args_len)]
+        _args = coder.read_int_array(args_len)
         coder.verify(RouteCommand.TERMINATOR)
 
         #TODO Create proper route command
         return RouteCommand(_id, _args)
 
+    def byte_size(self):
+        return 1 + 1 + 4 * len(self.args) + len(RouteCommand.TERMINATOR)
+
     def write(self, coder):
         coder.write_u1(self._id)
         coder.write_u1(len(self.args))
-        for arg in self.args:
-            coder.write_u4(arg)
+        coder.write_int_array(self.args, False)
         coder.write(RouteCommand.TERMINATOR)
 
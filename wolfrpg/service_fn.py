@@ -173,6 +173,64 @@ def search_resource(path: str, name: str) -> list:
     files = glob.glob(os.path.join(path, "**", name), recursive = True)
     return files if len(files) else []
 
+def _open_archive(archive: str, key: bytes = None):
+    from .DXArchive import openArchive
+    return openArchive(archive) if key is None else openArchive(archive, key)
+
+def archive_dir(archive: str) -> str:
+    """ Folder the members of a .wolf archive are named after, as if it was extracted in place (Data.wolf -> Data) """
+    return os.path.splitext(os.path.abspath(archive))[0]
+
+def search_archive(archive: str, name: str, key: bytes = None) -> list:
+    """ search_resource() over the members of a .wolf archive, named under archive_dir() """
+    members = _open_archive(archive, key).matchFiles([name])
+    return [os.path.join(archive_dir(archive), str(member.filePath)) for member in members]
+
+def open_resource(path: str, archive: str = None, key: bytes = None):
+    """ `path` itself, or an in-memory file object over the archive member it names """
+    if not archive:
+        return path
+    return _open_archive(archive, key).open_member(os.path.relpath(path, archive_dir(archive)))
+
+def resource_exists(path: str, archive: str = None, key: bytes = None) -> bool:
+    if not archive:
+        return os.path.isfile(path)
+    return _open_archive(archive, key).getMember(os.path.relpath(path, archive_dir(archive))) is not None
+
+def resource_size(path: str, archive: str = None, key: bytes = None) -> int:
+    """ Size of `path` or of the archive member it names, 0 if there's no such file """
+    if not archive:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    member = _open_archive(archive, key).getMember(os.path.relpath(path, archive_dir(archive)))
+    return 0 if member is None else member.dataSize
+
+def run_tasks(tasks: list, jobs: int = 1, sizes: list = None) -> list:
+    """
+    Runs `(func, path, *args)` tasks and returns their results in task order.
+
+    With `jobs` > 1 (0 = all CPUs) the tasks are spread over a process pool, largest
+    first, so that one huge file doesn't leave the other workers idle at the end.
+    `sizes` are what each task has to work through, by default the size of its `path`.
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or len(tasks) <= 1:
+        return [task[0](*task[1:]) for task in tasks]
+
+    from concurrent.futures import ProcessPoolExecutor
+    if sizes is None:
+        sizes = [resource_size(task[1]) for task in tasks]
+    order = sorted(range(len(tasks)), key=sizes.__getitem__, reverse=True)
+    results = [None] * len(tasks)
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+        futures = [(i, pool.submit(*tasks[i])) for i in order]
+        for i, future in futures:
+            results[i] = future.result()
+    return results
+
 def is_translatable(text: str) -> bool:
     return isinstance(text, str) and len(text.replace('\r','').replace('\n','').strip()) > 0 and '\u25A0' != text
 
@@ -0,0 +1,512 @@
+import os, random, sys, tempfile
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+from wolfrpg.DXArchive import DXArchive
+from wolfrpg.huffman import (huffman_Encode, huffman_Decode, huffman_Histogram, huffman_BuildTree,
+                             huffman_GetCodes, HUFFMAN_TABLE_BITS)
+from wolfrpg import wcrypto
+from wolfrpg.filecoder import FileCoder, CodecContext
+from wolfrpg.gamedats import GameDat
+from wolfrpg.maps import Map
+from wolfrpg.common_events import CommonEvents
+from wolfrpg.databases import Database
+from wolfrpg import repack
+
+import unittest
+
+
+def sample_payloads():
+    rng = random.Random(1)
+    text = b"Lorem ipsum dolor sit amet, consectetur adipisicing elit. " * 40
+    return {
+        "empty": b"",
+        "tiny": b"abc",
+        "run": b"\0" * 70000,
+        "overlap": b"ab" * 5000 + b"abcabcabd" * 700, # copies longer than their distance
+        "text": text,
+        "every byte": bytes(range(256)) * 40, # whatever the keycode is, it is in the data
+        "random": rng.randbytes(20000),
+        "hex digits": bytes(rng.choice(b"0123456789abcdef") for _ in range(50000)), # huffman, hardly LZ
+        "mixed": rng.randbytes(3000) + text + b"\xff" * 5000 + rng.randbytes(3000) + text,
+    }
+
+
+class TestLZ(unittest.TestCase):
+    def test_round_trip(self):
+        archive = DXArchive()
+        for level in DXArchive.ENCODE_LEVELS:
+            for name, data in sample_payloads().items():
+                if len(data) <= DXArchive.MIN_COMPRESS:
+                    continue
+                with self.subTest(level=level, payload=name):
+                    press = bytearray(archive.encode(data))
+                    size = archive.encode(data, press, level)
+                    self.assertEqual(archive.decode(press[:size], None), len(data))
+                    (decoded, _) = archive.decode(press[:size], bytearray(len(data)))
+                    self.assertEqual(bytes(decoded), data)
+
+
+class TestHuffman(unittest.TestCase):
+    def round_trip(self, data):
+        (press, size) = huffman_Encode(data, len(data), bytearray())
+        self.assertEqual(huffman_Decode(press, None), len(data))
+        (decoded, _) = huffman_Decode(press, bytearray(len(data)))
+        self.assertEqual(bytes(decoded[:len(data)]), data)
+
+    def test_round_trip(self):
+        for name, data in sample_payloads().items():
+            if data:
+                with self.subTest(payload=name):
+                    self.round_trip(data)
+
+    def test_long_codes(self):
+        # geometric byte counts: the rare bytes get codes longer than the lookup table
+        data = bytearray(b"".join(bytes([i]) * (int(1.6 ** i) + 1) for i in range(24)))
+        random.Random(3).shuffle(data)
+        data = bytes(data)
+        weight = [int(count * 0xFFFF / len(data)) for count in huffman_Histogram(data)]
+        (_, bitNum) = huffman_GetCodes(huffman_BuildTree(weight))
+        self.assertGreater(max(bitNum[i] for i in set(data)), HUFFMAN_TABLE_BITS)
+        self.round_trip(data)
+
+
+class TestCrypto(unittest.TestCase):
+    def standard_round_keys(self, key):
+        """ The plain FIPS-197 key schedule (wcrypto.keyExpansion is the modified one of the Pro protection) """
+        words = [int.from_bytes(key[i:i + 4], "big") for i in range(0, 16, 4)]
+        for i in range(4, 44):
+            temp = words[i - 1]
+            if i % 4 == 0:
+                temp = ((temp << 8) | (temp >> 24)) & 0xFFFFFFFF
+                temp = int.from_bytes(bytes(wcrypto.sbox[b] for b in temp.to_bytes(4, "big")), "big")
+                temp ^= wcrypto.Rcon[i // 4] << 24
+            words.append(words[i - 4] ^ temp)
+        return words
+
+    def test_aes_fips197(self):
+        # FIPS-197 appendix C.1
+        key = bytes(range(16))
+        block = bytes.fromhex("00112233445566778899aabbccddeeff")
+        cipher = wcrypto.cipherBlocks(block, self.standard_round_keys(key))
+        self.assertEqual(cipher.hex(), "69c4e0d86a7b0430d8cdb78070b4c55a")
+
+    def test_dat_v2_round_trip(self):
+        data = bytearray(random.Random(2).randbytes(1000))
+        data[1] = 0x50 # Pro v2 indicator
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as temp:
+            os.chdir(temp) # the derived keys are cached in the working directory
+            try:
+                decrypted = wcrypto.decrypt_dat_v2(bytearray(data))
+                self.assertNotEqual(bytes(decrypted), bytes(data))
+                self.assertEqual(bytes(wcrypto.encrypt_dat_v2(bytearray(decrypted))), bytes(data))
+            finally:
+                os.chdir(cwd)
+
+
+class TestArchive(unittest.TestCase):
+    KEYS = (None, b"k3y")
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.temp.name)
+        payloads = sample_payloads()
+        self.files = {
+            "Game.dat": payloads["text"],
+            "BasicData/DataBase.dat": payloads["mixed"],
+            "BasicData/empty.dat": payloads["empty"],
+            "MapData/Map000.mps": payloads["run"],
+            "MapData/Map002.mps": payloads["hex digits"], # larger than twice huffmanEncodeKB after LZ too
+            "MapData/sub/Map001.mps": payloads["random"],
+            "MapData/sub/Copy.mps": payloads["random"],
+            "BGM/title.ogg": payloads["every byte"],
+        }
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def entries(self, files, prefix="src"):
+        entries = []
+        for name, data in files.items():
+            path = self.dir / prefix / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            entries.append((name, path))
+        return entries
+
+    def check(self, archive_path, key, files):
+        archive = DXArchive()
+        self.assertTrue(archive.loadArchive(archive_path, self.dir, None if key is None else bytearray(key)))
+        try:
+            self.assertEqual(sorted(archive.memberName(member) for member in archive.archivedFiles),
+                             sorted(name.lower() for name in files))
+            for name, data in files.items():
+                self.assertEqual(archive.read_member(name), data, name)
+        finally:
+            archive.fp.close()
+
+    def create(self, key, **options):
+        archive_path = self.dir / "Data.wolf"
+        with DXArchive() as archive:
+            self.assertTrue(archive.create_archive(archive_path, self.entries(self.files),
+                                                   None if key is None else bytearray(key), level="fast", **options))
+        return archive_path
+
+    def test_create(self):
+        for key in self.KEYS:
+            for compression, huffman in ((True, True), (True, False), (False, True), (False, False)):
+                with self.subTest(key=key, compression=compression, huffman=huffman):
+                    self.check(self.create(key, use_compression=compression, use_huffman=huffman), key, self.files)
+
+    def test_create_dedup(self):
+        for key in self.KEYS:
+            with self.subTest(key=key):
+                self.check(self.create(key, dedup=True), key, self.files)
+
+    def test_add(self):
+        added = {"MapData/sub/Map001.mps": b"replaced" * 100, "New/dir/z.txt": b"zzz" * 1000}
+        expected = dict(self.files, **added)
+        for key in self.KEYS:
+            for in_place in (True, False):
+                with self.subTest(key=key, in_place=in_place):
+                    archive_path = self.create(key)
+                    with DXArchive() as archive:
+                        self.assertTrue(archive.add_to_archive(archive_path, self.entries(added, "add"),
+                                                               None if key is None else bytearray(key),
+                                                               level="fast", in_place=in_place))
+                    self.check(archive_path, key, expected)
+
+
+def pack(build):
+    """ The bytes `build(coder)` writes through a plain FileCoder """
+    stream = BytesIO()
+    with FileCoder(stream, 'w') as coder:
+        build(coder)
+    return stream.getvalue()
+
+
+def game_dat(title, header=None, hid_pos_len=4):
+    """ A Game.dat with a table of hid_pos_len u2 offsets inside its randoms, v1 encrypted if given a header """
+    def settings(coder):
+        coder.write_u1(0) # encoding_type
+        coder.write_u4(21)
+        coder.write(bytes([16, 4, 4, 0, 60, 1, 0, 3, 0, 0, 2, 4, 4, 0, 0, 4, 4, 0, 0, 0, 0]))
+        coder.write_u4(9)
+        for string in (title, "0000-0000"):
+            coder.write_string(string)
+        coder.write_byte_array(b"\x01\x02\x03\x04") # encryption_key
+        for string in ("MS Gothic", "", "", "", "hero.png", "3.0"):
+            coder.write_string(string)
+    start = len(header) if header else 1 + len(GameDat.GAMEDAT_MAGIC)
+    body = pack(settings)
+    pos1 = start + len(body)
+    pos2 = pos1 + 4 + 4 + 4 + 16 * 2 + 8
+    randoms = bytearray(random.Random(4).randbytes(29000 - (pos2 - pos1)))
+    table = [pos2 + 1000 + i * 7 for i in range(hid_pos_len)]
+    randoms[100:100 + hid_pos_len * 2] = b"".join(i.to_bytes(2, "little") for i in table)
+    def tail(coder):
+        coder.write_u4(pos1 + 29000) # file_size: the length of the file minus one
+        coder.write_u4(hid_pos_len)
+        coder.write_u4(16)
+        coder.write_word_array([0] * 16, False)
+        coder.write_u4(pos2 + 200) # pos_random_bases
+        coder.write_u4(pos2 + 100) # pos_obfuscations
+        coder.write(bytes(randoms))
+        coder.write_u1(196)
+    body += pack(tail)
+    if header is None:
+        return b"\0" + GameDat.GAMEDAT_MAGIC + body # the zero indicator of unencrypted files
+    seeds = [header[i] for i in GameDat.SEED_INDICES]
+    return header + bytes(wcrypto.decrypt_dat_v1(bytearray(body), seeds, FileCoder.DECRYPT_INTERVALS))
+
+
+def write_raw_string(coder, data):
+    """ A string as its bytes, e.g. cp932 that doesn't come back the same from str.encode() """
+    coder.write_u4(len(data) + 1)
+    coder.write(data + b"\0")
+
+
+def write_route(coder):
+    coder.write_u4(2)
+    for (_id, args) in ((1, []), (9, [3, 4])):
+        coder.write_u1(_id)
+        coder.write_u1(len(args))
+        coder.write_int_array(args, False)
+        coder.write(b"\x01\0")
+
+
+def write_commands(coder):
+    """ A message, a choice, a comment with raw bytes and a move command """
+    coder.write_u4(4)
+    for (cid, args, strings) in ((101, [], ["Hello"]), (102, [2, 0], ["Yes", "No"]), (103, [7], [b"\x87\x90"])):
+        coder.write_u1(len(args) + 1)
+        coder.write_u4(cid)
+        coder.write_int_array(args, False)
+        coder.write_u1(1) # indent
+        coder.write_u1(len(strings))
+        for string in strings:
+            (write_raw_string if isinstance(string, bytes) else FileCoder.write_string)(coder, string)
+        coder.write_u1(0)
+    coder.write_u1(3)
+    coder.write_u4(201) # Move
+    coder.write_int_array([0xFFFFFFFF, 5], False)
+    coder.write_u1(0)
+    coder.write_u1(0)
+    coder.write_u1(1)
+    coder.write(bytes(5))
+    coder.write_u1(2) # flags
+    write_route(coder)
+
+
+def map_mps():
+    def build(coder):
+        coder.write(Map.MAP_MAGIC)
+        coder.write_u4(0) # encoding_type
+        coder.write_u4(100)
+        coder.write_u1(101)
+        coder.write_string("None")
+        coder.write_u4(1) # tileset_id
+        coder.write_u4(2)
+        coder.write_u4(2)
+        coder.write_u4(1) # event_count
+        coder.write(bytes(range(2 * 2 * 3 * 4)))
+        coder.write_u1(Map.MAP_EVENT_MARKER)
+        coder.write(Map.Event.EVENT_MAGIC1)
+        coder.write_u4(0)
+        coder.write_string("EV000")
+        coder.write_u4(1)
+        coder.write_u4(1)
+        coder.write_u4(1) # page_count
+        coder.write(Map.Event.EVENT_MAGIC2)
+        coder.write_u1(Map.Event.EVENT_MARKER)
+        coder.write_u4(0)
+        coder.write_string("hero.png")
+        coder.write(bytes([2, 1, 255, 0]))
+        coder.write(bytes(range(1 + 4 + 4 * 4 + 4 * 4))) # conditions
+        coder.write(bytes([1, 2, 3, 4])) # movement
+        coder.write_u1(0)
+        coder.write_u1(0)
+        write_route(coder)
+        write_commands(coder)
+        coder.write_u4(4) # features: with page_transfer
+        coder.write(bytes([0, 1, 1, 0]))
+        coder.write_u1(Map.Event.Page.PAGE_TERMINATOR)
+        coder.write_u1(Map.Event.EVENT_TERMINATOR)
+        coder.write_u1(Map.MAP_TERMINATOR)
+    return pack(build)
+
+
+def common_event_dat():
+    def build(coder):
+        coder.write(CommonEvents.COMMON_MAGIC2)
+        coder.write_u4(2)
+        for (_id, name) in ((0, "First"), (1, "Second")):
+            coder.write_u1(0x8E)
+            coder.write_u4(_id)
+            coder.write_u4(7)
+            coder.write(bytes(7))
+            coder.write_string(name)
+            write_commands(coder)
+            coder.write_string("")
+            coder.write_string("description")
+            coder.write_u1(0x8F)
+            coder.write(CommonEvents.Event.EVENT_MAGIC)
+            coder.write_string_array([f"arg{i}" for i in range(10)], False)
+            coder.write(CommonEvents.Event.EVENT_MAGIC)
+            coder.write_byte_array(range(10), False)
+            coder.write(CommonEvents.Event.EVENT_MAGIC)
+            for i in range(10):
+                coder.write_string_array(["a", "b"][:i % 3])
+            coder.write(CommonEvents.Event.EVENT_MAGIC)
+            for i in range(10):
+                coder.write_int_array(list(range(i % 4)))
+            coder.write(bytes(range(0x1D)))
+            coder.write_string_array([str(i) for i in range(100)], False)
+            coder.write_u1(0x91)
+            coder.write_string("")
+            if _id:
+                coder.write_u1(0x92)
+                coder.write_string("color")
+                coder.write_u4(3)
+            coder.write_u1(0x92 if _id else 0x91)
+        coder.write_u1(0x8F)
+    return pack(build)
+
+
+def database(crypt_header=None, proj_key=None):
+    """ The .project and .dat of a database with one type, v1 encrypted if given a header and key """
+    fields = [("HP", 0x3E8), ("Name", 0x7D0), ("MP", 0x3E9), ("Note", 0x7D1)]
+    def project(coder):
+        coder.write_u4(1)
+        coder.write_string("Actors")
+        coder.write_string_array([name for (name, _) in fields])
+        coder.write_string_array(["Hero", "Mage"])
+        coder.write_string("The party")
+        coder.write_u4(0x64)
+        coder.write(bytes([0, 0, 1, 0]) + bytes(0x64 - len(fields)))
+        coder.write_string_array(["" for _ in fields])
+        coder.write_u4(len(fields))
+        for i in range(len(fields)):
+            coder.write_string_array(["x"] * i)
+        coder.write_u4(len(fields))
+        for i in range(len(fields)):
+            coder.write_int_array([i] * i)
+        coder.write_u4(len(fields))
+        coder.write_int_array([0, 1, 2, 3], False)
+    def dat(coder):
+        if crypt_header:
+            coder.write_u1(1) # unknown_encrypted_1
+        else:
+            coder.write(Database.DATABASE_MAGIC)
+            coder.write_u1(0) # encoding_type
+            coder.write(Database.DATABASE_MAGIC_NEXT)
+            coder.write_u1(0x55) # engine_version
+        coder.write_u4(1)
+        coder.write(Database.Type.D_TYPE_SEPARATOR)
+        coder.write_u4(0)
+        coder.write_int_array([indexinfo for (_, indexinfo) in fields])
+        coder.write_u4(2)
+        for (hp, mp, name) in ((10, 2, "Hero"), (4, 12, b"\x87\x90")):
+            coder.write_int_array([hp, mp], False)
+            (write_raw_string if isinstance(name, bytes) else FileCoder.write_string)(coder, name)
+            coder.write_string("note")
+        coder.write_u1(0xC4) # last_terminator
+    (project, dat) = (pack(project), pack(dat))
+    if crypt_header is None:
+        return (project, b"\0" + dat)
+    seeds = [crypt_header[i] for i in Database.DAT_SEED_INDICES]
+    return (bytes(wcrypto.decrypt_proj(project, proj_key)),
+            crypt_header + bytes(wcrypto.decrypt_dat_v1(bytearray(dat), seeds, FileCoder.DECRYPT_INTERVALS)))
+
+
+class TestStructures(unittest.TestCase):
+    """ Synthetic files through read -> write, which must give back the same bytes """
+    HEADER = bytes([0x11, 0x22, 0x33, 0x44, 0x55, 0x66, 0x77, 0x88, 0x99, 0xAA])
+    PROJ_KEY = 0x5A
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.temp.name)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def round_trip(self, cls, name, data, *args):
+        path = self.dir / "in" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(data)
+        read = cls(str(path), *args)
+        out = self.dir / "out" / name
+        out.parent.mkdir(exist_ok=True)
+        read.write(str(out))
+        self.assertEqual(out.read_bytes(), data)
+        return read
+
+    def sizing_coder(self, read):
+        coder = FileCoder(BytesIO(), 'w')
+        coder.restore_raw_strings(read._raw_strings)
+        return coder
+
+    def test_map(self):
+        data = map_mps()
+        read = self.round_trip(Map, "Map000.mps", data)
+        self.assertEqual(read.events[0].pages[0].commands[2].string_args, ["≒"])
+        self.assertEqual(len(data), read.byte_size(self.sizing_coder(read)))
+
+    def test_common_events(self):
+        data = common_event_dat()
+        read = self.round_trip(CommonEvents, "CommonEvent.dat", data)
+        self.assertEqual(len(data), read.byte_size(self.sizing_coder(read)))
+
+    def test_game_dat(self):
+        data = game_dat("Title")
+        read = self.round_trip(GameDat, "Game.dat", data)
+        # the file_size field, which leaves out the 0 indicator
+        self.assertEqual(len(data), read.byte_size(self.sizing_coder(read)) + 1)
+
+    def round_trip_database(self, crypt_header=None, proj_key=None):
+        (project, dat) = database(crypt_header, proj_key)
+        paths = []
+        for (name, data) in (("DataBase.project", project), ("DataBase.dat", dat)):
+            paths.append(self.dir / name)
+            paths[-1].write_bytes(data)
+        db = Database(*(str(path) for path in paths), CodecContext(proj_key=proj_key))
+        self.assertEqual(db.encrypted, crypt_header is not None)
+        self.assertEqual(db.types[0].data[1].string_values, ["≒", "note"])
+        out = [self.dir / ("out_" + path.name) for path in paths]
+        db.write(*(str(path) for path in out))
+        self.assertEqual(out[0].read_bytes(), project)
+        self.assertEqual(out[1].read_bytes(), dat)
+
+        coder = FileCoder(BytesIO(), 'w', crypt_header=crypt_header)
+        coder.restore_raw_strings(db._raw_project_strings)
+        self.assertEqual(len(project), db.project_byte_size(coder))
+        coder.restore_raw_strings(db._raw_dat_strings)
+        self.assertEqual(len(dat), db.dat_byte_size(coder) + (len(crypt_header) if crypt_header else 1))
+
+    def test_database(self):
+        self.round_trip_database()
+
+    def test_database_encrypted_v1(self):
+        self.round_trip_database(self.HEADER, self.PROJ_KEY)
+
+
+class TestGameDat(unittest.TestCase):
+    HEADER = bytes([0x11, 0x22, 0x33, 0x44, 0x55, 0x66, 0x77, 0x88, 0x99, 0xAA]) # v1: nonzero, no 0x50 at 1
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.temp.name)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def test_grow_encrypted_v1(self):
+        path = self.dir / "Game.dat"
+        path.write_bytes(game_dat("Title", self.HEADER))
+        game = GameDat(str(path))
+        self.assertTrue(game.encrypted)
+        (r1, r2) = (game.pos_random_bases, game.pos_obfuscations)
+        table = [int.from_bytes(game.randoms[i:i + 2], "little") for i in range(100, 108, 2)]
+
+        game.string_settings.title = "A longer title"
+        game.write(str(path))
+        # everything behind the title moved, the offsets pointing there too
+        self.assertEqual(path.read_bytes(), game_dat("A longer title", self.HEADER))
+        grown = len("A longer title") - len("Title")
+        game = GameDat(str(path))
+        self.assertEqual(game.string_settings.title, "A longer title")
+        self.assertEqual((game.pos_random_bases, game.pos_obfuscations), (r1 + grown, r2 + grown))
+        self.assertEqual([int.from_bytes(game.randoms[i:i + 2], "little") for i in range(100, 108, 2)],
+                         [offset + grown for offset in table])
+
+
+class TestRepack(unittest.TestCase):
+    def test_archive_outside_cwd(self):
+        with tempfile.TemporaryDirectory() as game, tempfile.TemporaryDirectory() as work:
+            game = Path(game)
+            (game / "src").mkdir()
+            (game / "src" / "Game.dat").write_bytes(game_dat("Title"))
+            with DXArchive() as archive:
+                self.assertTrue(archive.create_archive(game / "Data.wolf", [("Game.dat", game / "src" / "Game.dat")]))
+            (game / "Data").mkdir()
+            repack.write_csv_list(str(game / "Data" / "Game.dat_strings.csv"), [["Title", "Translated", "TITLE"]])
+            before = sorted(game.rglob("*"))
+
+            cwd = os.getcwd()
+            os.chdir(work)
+            try:
+                with mock.patch.object(sys, "argv", ["repack", "-f", "game", "-w", str(game / "Data.wolf")]):
+                    repack.main()
+            finally:
+                os.chdir(cwd)
+
+            self.assertEqual(sorted(game.rglob("*")), before) # nothing written next to the archive
+            out = Path(work) / repack.DEFAULT_OUT_DIR / "Data" / "Game.dat"
+            self.assertEqual(out.read_bytes(), game_dat("Translated"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,7 +9,12 @@ KC1 = 20000
 KC2 = 200
 
 HAS_LIB = False
-import ctypes, os
+import ctypes, os, struct
+HAS_NUMPY = True
+try:
+    import numpy as np
+except ImportError:
+    HAS_NUMPY = False
 try:
     if os.name == "nt":
         libc = ctypes.CDLL("MSVCRT")
@@ -35,6 +40,50 @@ def rand_my(mask: int = RAND_MAX):
 srand = libc.srand if HAS_LIB else srand_my
 rand = libc.rand if HAS_LIB else rand_my
 
+MASK_U32 = 0xFFFFFFFF
+
+def lcg_jump(steps: int):
+    """ Returns (mul, inc) such that `steps` msvcrt rand() calls turn seed s into (s * mul + inc) mod 2^32 """
+    mul, inc = 1, 0
+    step_mul, step_inc = RAND_MULTIPLIER, RAND_INCREMENT
+    while steps:
+        if steps & 1:
+            mul, inc = (mul * step_mul) & MASK_U32, (inc * step_mul + step_inc) & MASK_U32
+        step_mul, step_inc = (step_mul * step_mul) & MASK_U32, (step_inc * step_mul + step_inc) & MASK_U32
+        steps >>= 1
+    return mul, inc
+
+def lcg_states(s: int, count: int, skip: int = 0):
+    """ The `count` msvcrt LCG states following srand(s) and `skip` rand() calls, as a uint32 array (or a list without NumPy) """
+    s &= MASK_U32
+    if skip:
+        mul, inc = lcg_jump(skip)
+        s = (s * mul + inc) & MASK_U32
+    if not HAS_NUMPY:
+        states = [0] * count
+        for i in range(count):
+            s = (s * RAND_MULTIPLIER + RAND_INCREMENT) & MASK_U32
+            states[i] = s
+        return states
+    if count <= 0:
+        return np.empty(0, dtype=np.uint32)
+
+    # states are laid out as a (blocks x block) grid: one jump-ahead table for the columns
+    # and one row start per block, both O(sqrt(count)), then a single vectorised pass
+    block = max(1, int(count ** 0.5))
+    muls, incs = [0] * block, [0] * block
+    mul, inc = 1, 0
+    for k in range(block):
+        mul, inc = (mul * RAND_MULTIPLIER) & MASK_U32, (inc * RAND_MULTIPLIER + RAND_INCREMENT) & MASK_U32
+        muls[k], incs[k] = mul, inc
+    n_blocks = -(-count // block)
+    starts = [0] * n_blocks
+    for m in range(n_blocks):
+        starts[m] = s
+        s = (s * mul + inc) & MASK_U32
+    states = np.array(starts, dtype=np.uint32)[:, None] * np.array(muls, dtype=np.uint32) + np.array(incs, dtype=np.uint32)
+    return states.ravel()[:count]
+
 
 # Constants
 Nk = 4
@@ -96,10 +145,11 @@ def keyExpansion(pRoundKey, pKey):
             tempa[2] = tempa[3]
             tempa[3] = u8tmp
 
+            # NOTE: modified schedule of the Pro protection; tempa is uint8
             tempa[0] = sbox[tempa[0]] ^ Rcon[i // Nk]
             tempa[1] = sbox[tempa[1]] >> 4
-            tempa[2] = ~sbox[tempa[2]]
-            tempa[3] = (sbox[tempa[3]] >> 7) | (sbox[tempa[3]] << 1)
+            tempa[2] = ~sbox[tempa[2]] & 0xFF
+            tempa[3] = ((sbox[tempa[3]] >> 7) | (sbox[tempa[3]] << 1)) & 0xFF
 
         j = i * 4
         k = (i - Nk) * 4
@@ -110,92 +160,70 @@ def keyExpansion(pRoundKey, pKey):
         pRoundKey[j + 3] = pRoundKey[k + 3] ^ tempa[3]
 
 
-def addRoundKey(pState, round, pRoundKey):
-    for i in range(AES_KEY_SIZE):
-        pState[i] ^= pRoundKey[round * AES_KEY_SIZE + i]
-
-
-def subBytes(pState):
-    for i in range(AES_KEY_SIZE):
-        pState[i] = sbox[pState[i]]
-
-
-def shiftRows(pState):
-    temp = pState[1]
-    pState[1] = pState[5]
-    pState[5] = pState[9]
-    pState[9] = pState[13]
-    pState[13] = temp
-
-    temp = pState[2]
-    pState[2] = pState[10]
-    pState[10] = temp
-
-    temp = pState[6]
-    pState[6] = pState[14]
-    pState[14] = temp
-
-    temp = pState[3]
-    pState[3] = pState[15]
-    pState[15] = pState[11]
-    pState[11] = pState[7]
-    pState[7] = temp
-
 def xtime(x):
-    return ((x << 1) ^ (((x >> 7) & 1) * 0x1b))
-
-def mixColumns(pState):
-    tmp = 0
-    t = 0
-
-    for i in range(4):
-        t = pState[0]
-        tmp = pState[1] ^ pState[0] ^ pState[2] ^ pState[3]
-
-        pState[0] ^= tmp ^ xtime(pState[1] ^ pState[0])
-        pState[1] ^= tmp ^ xtime(pState[2] ^ pState[1])
-        pState[2] ^= tmp ^ xtime(pState[2] ^ pState[3])
-        pState[3] ^= tmp ^ xtime(pState[3] ^ t)
-
-        pState = pState[4:]
+    return ((x << 1) ^ (((x >> 7) & 1) * 0x1b)) & 0xFF
+
+def _make_t_tables():
+    # Te0[x] is the MixColumns column of SubBytes(x) in row 0: (2s, s, s, 3s);
+    # Te1..Te3 are the same word rotated for rows 1..3
+    te = [[0] * 256 for _ in range(4)]
+    for x in range(256):
+        s = sbox[x]
+        s2 = xtime(s)
+        w = (s2 << 24) | (s << 16) | (s << 8) | (s2 ^ s)
+        for t in range(4):
+            te[t][x] = ((w >> (8 * t)) | (w << (32 - 8 * t))) & MASK_U32
+    return te
+
+Te0, Te1, Te2, Te3 = _make_t_tables()
+
+def roundKeyWords(pRoundKey):
+    """ The expanded key as 44 big-endian column words """
+    return list(struct.unpack('>44I', bytes(pRoundKey[:AES_KEY_EXP_SIZE])))
+
+def cipherBlocks(blocks, rkw):
+    """ AES-128 encrypts every 16-byte block of `blocks` with the T-tables; `rkw` are roundKeyWords() """
+    n_words = len(blocks) // 4
+    words = struct.unpack(f'>{n_words}I', blocks)
+    out = [0] * n_words
+    k0, k1, k2, k3 = rkw[0:4]
+    for b in range(0, n_words, 4):
+        s0 = words[b] ^ k0
+        s1 = words[b + 1] ^ k1
+        s2 = words[b + 2] ^ k2
+        s3 = words[b + 3] ^ k3
+        for r in range(4, 4 * Nr, 4):
+            t0 = Te0[s0 >> 24] ^ Te1[(s1 >> 16) & 0xFF] ^ Te2[(s2 >> 8) & 0xFF] ^ Te3[s3 & 0xFF] ^ rkw[r]
+            t1 = Te0[s1 >> 24] ^ Te1[(s2 >> 16) & 0xFF] ^ Te2[(s3 >> 8) & 0xFF] ^ Te3[s0 & 0xFF] ^ rkw[r + 1]
+            t2 = Te0[s2 >> 24] ^ Te1[(s3 >> 16) & 0xFF] ^ Te2[(s0 >> 8) & 0xFF] ^ Te3[s1 & 0xFF] ^ rkw[r + 2]
+            t3 = Te0[s3 >> 24] ^ Te1[(s0 >> 16) & 0xFF] ^ Te2[(s1 >> 8) & 0xFF] ^ Te3[s2 & 0xFF] ^ rkw[r + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+        # last round: SubBytes + ShiftRows only
+        r = 4 * Nr
+        out[b] = ((sbox[s0 >> 24] << 24) | (sbox[(s1 >> 16) & 0xFF] << 16) | (sbox[(s2 >> 8) & 0xFF] << 8) | sbox[s3 & 0xFF]) ^ rkw[r]
+        out[b + 1] = ((sbox[s1 >> 24] << 24) | (sbox[(s2 >> 16) & 0xFF] << 16) | (sbox[(s3 >> 8) & 0xFF] << 8) | sbox[s0 & 0xFF]) ^ rkw[r + 1]
+        out[b + 2] = ((sbox[s2 >> 24] << 24) | (sbox[(s3 >> 16) & 0xFF] << 16) | (sbox[(s0 >> 8) & 0xFF] << 8) | sbox[s1 & 0xFF]) ^ rkw[r + 2]
+        out[b + 3] = ((sbox[s3 >> 24] << 24) | (sbox[(s0 >> 16) & 0xFF] << 16) | (sbox[(s1 >> 8) & 0xFF] << 8) | sbox[s2 & 0xFF]) ^ rkw[r + 3]
+    return struct.pack(f'>{n_words}I', *out)
 
 
 # AES Cipher
 def cipher(pState, pRoundKey):
-    addRoundKey(pState, 0, pRoundKey)
-
-    for round in range(1, Nr):
-        subBytes(pState)
-        shiftRows(pState)
-        mixColumns(pState)
-        addRoundKey(pState, round, pRoundKey)
-
-    subBytes(pState)
-    shiftRows(pState)
-    addRoundKey(pState, Nr, pRoundKey)
+    pState[:] = cipherBlocks(bytes(pState), roundKeyWords(pRoundKey))
 
 
 # AES_CTR_xcrypt
 def aesCtrXCrypt(pData, pKey, size):
-    state = [0] * AES_BLOCKLEN
-    pIv = pKey[AES_KEY_EXP_SIZE:]
-    bi = AES_BLOCKLEN
-
-    for i in range(size):
-        bi += 1
-        if bi == AES_BLOCKLEN:
-            state[:] = pIv[:]
-            cipher(state, pKey)
-
-            for j in range(AES_BLOCKLEN - 1, -1, -1):
-                if pIv[j] == 0xFF:
-                    pIv[j] = 0
-                    continue
-                pIv[j] += 1
-                break
-            bi = 0
+    """ XORs the first `size` bytes of the writable buffer `pData` in place with the AES-CTR keystream (same both ways) """
+    if size <= 0: return
+    n_blocks = (size + AES_BLOCKLEN - 1) // AES_BLOCKLEN
+    iv = int.from_bytes(bytes(pKey[AES_KEY_EXP_SIZE:AES_ROUND_KEY_SIZE]), 'big')
+    counters = b''.join(((iv + i) & ((1 << 128) - 1)).to_bytes(AES_BLOCKLEN, 'big') for i in range(n_blocks))
+    keystream = cipherBlocks(counters, roundKeyWords(pKey))[:size]
 
-        pData[i] ^= state[bi]
+    with memoryview(pData) as view:
+        target = view[:size]
+        target[:] = (int.from_bytes(target, 'little') ^ int.from_bytes(keystream, 'little')).to_bytes(size, 'little')
 
 
 class CryptData:
@@ -214,10 +242,7 @@ class RngData:
     DATA_VEC_LEN = 0x30
 
     def __init__(self):
-        self.seed1 = 0
-        self.seed2 = 0
-        self.counter = 0
-        self.data = [[0] * INNER_VEC_LEN for _ in range(OUTER_VEC_LEN)]
+        self.Reset()
 
     def Reset(self):
         self.seed1 = 0
@@ -226,54 +251,51 @@ class RngData:
         self.data = [[0] * RngData.INNER_VEC_LEN for _ in range(RngData.OUTER_VEC_LEN)]
 
 
+# NOTE: the v2 key schedule is uint32 arithmetic; every intermediate value
+# that is shifted right, compared or taken modulo is masked to 32 bits first
 def customRng1(rd):
-    state = 0
-    stateMod = 0
+    seed1 = rd.seed1
+    seedP1 = seed1 ^ ((((seed1 << 11) & MASK_U32) ^ seed1) >> 8)
+    seed = ((seed1 << 11) ^ seedP1) & MASK_U32
 
-    seedP1 = (rd.seed1 ^ (((rd.seed1 << 11) ^ rd.seed1) >> 8))
-    seed = (rd.seed1 << 11) ^ seedP1
-
-    state = 1664525 * seed + 1013904223
+    state = (1664525 * seed + 1013904223) & MASK_U32
 
     if ((13 * seedP1 + 95) & 1) == 0:
-        stateMod = state // 8
+        stateMod = state >> 3
     else:
-        stateMod = state * 4
+        stateMod = (state << 2) & MASK_U32
 
     state ^= stateMod
 
     if (state & 0x400) != 0:
-        state ^= state << 21
+        state ^= (state << 21) & MASK_U32
         stateMod = state >> 9
     else:
-        state ^= state * 4
+        state ^= (state << 2) & MASK_U32
         stateMod = state >> 22
 
     state ^= stateMod
 
     if (state & 0xFFFFF) == 0:
-        state += 256
+        state = (state + 256) & MASK_U32
 
     rd.seed1 = state
     return state
 
 
 def customRng2(rd):
-    stateMod = 0
-    state = 0
-
     seed = rd.seed1
 
-    state = 1664525 * seed + 1013904223
+    state = (1664525 * seed + 1013904223) & MASK_U32
     stateMod = (seed & 7) + 1
 
     if state % 3:
         if state % 3 == 1:
-            state ^= (state >> stateMod)
+            state ^= state >> stateMod
         else:
-            state = ~state + (state << stateMod)
+            state = (~state + (state << stateMod)) & MASK_U32
     else:
-        state ^= (state << stateMod)
+        state ^= (state << stateMod) & MASK_U32
 
     if state:
         if not state & 0xFFFF:
@@ -286,12 +308,11 @@ def customRng2(rd):
 
 
 def customRng3(rd):
-    state = 0
-    seed = rd.seed2
+    seed2 = rd.seed2
 
-    state = (1566083941 * rd.seed2) ^ (292331520 * rd.seed2)
-    state ^= (state >> 17) ^ (32 * (state ^ (state >> 17)))
-    state = 69069 * (state ^ (state ^ (state >> 11)) & 0x3FFFFFFF)
+    state = ((1566083941 * seed2) ^ (292331520 * seed2)) & MASK_U32
+    state ^= (state >> 17) ^ ((32 * (state ^ (state >> 17))) & MASK_U32)
+    state = (69069 * (state ^ (state ^ (state >> 11)) & 0x3FFFFFFF)) & MASK_U32
 
     if state:
         if not state & 0xFFFF:
@@ -307,67 +328,70 @@ def customRng3(rd):
 
 
 def rngChain(rd, data):
-    for i, d in enumerate(data):
+    for i in range(len(data)):
+        counter = rd.counter
         rn = customRng2(rd)
 
         d = rn ^ customRng3(rd)
 
-        if (rd.counter + 1) & 1 == 0:
+        if (counter + 1) & 1 == 0:
             d += customRng3(rd)
 
-        if not (rd.counter % 3):
-            d ^= customRng1(rd) + 3
+        if not (counter % 3):
+            d ^= (customRng1(rd) + 3) & MASK_U32
 
-        if not (rd.counter % 7):
+        if not (counter % 7):
             d += customRng3(rd) + 1
 
-        if (rd.counter & 7) == 0:
-            d *= customRng1(rd)
+        if (counter & 7) == 0:
+            d = (d * customRng1(rd)) & MASK_U32
 
-        if not ((i + rd.seed1) % 5):
-            d ^= customRng1(rd)
+        if not (((i + rd.seed1) & MASK_U32) % 5):
+            d = (d & MASK_U32) ^ customRng1(rd)
 
-        if not (rd.counter % 9):
+        if not (counter % 9):
             d += customRng2(rd) + 4
 
-        if not (rd.counter % 0x18):
+        if not (counter % 0x18):
             d += customRng2(rd) + 7
 
-        if not (rd.counter % 0x1F):
+        if not (counter % 0x1F):
             d += 3 * customRng3(rd)
 
-        if not (rd.counter % 0x3D):
+        if not (counter % 0x3D):
             d += customRng3(rd) + 1
 
-        if not (rd.counter % 0xA1):
+        if not (counter % 0xA1):
             d += customRng2(rd)
 
         if rn & 0xFFFF == 256:
             d += 3 * customRng3(rd)
 
-        rd.counter += 1
+        data[i] = d & MASK_U32
+        rd.counter = (counter + 1) & MASK_U32
 
 
 def runCrypt(rd, seed1, seed2):
-    rd.seed1 = seed1
-    rd.seed2 = seed2
+    rd.seed1 = seed1 & MASK_U32
+    rd.seed2 = seed2 & MASK_U32
     rd.counter = 0
 
-    srand(seed1)
-
-    for i in range(rd.data.size()):
-        rngChain(rd, rd.data[i])
+    for row in rd.data:
+        rngChain(rd, row)
 
 
 def aLotOfRngStuff(rd, a2, a3, idx, cryptData):
+    a2 &= MASK_U32
+    a3 &= MASK_U32
     itrs = 20
 
-    for i in range(itrs):
+    i = 0
+    while i < itrs: # itrs can grow inside the loop
         idx1 = (a2 ^ customRng1(rd)) & 0x1F
         idx2 = (a3 ^ customRng2(rd)) & 0xFF
         a3 = rd.data[idx1][idx2]
 
-        switch_val = (a2 + rd.counter) % 0x14
+        switch_val = ((a2 + rd.counter) & MASK_U32) % 0x14
         if switch_val == 1:
             rngChain(rd, rd.data[(a2 + 5) & 0x1F])
         elif switch_val == 2:
@@ -376,7 +400,8 @@ def aLotOfRngStuff(rd, a2, a3, idx, cryptData):
             if a2 & 0xFFFFF == 0:
                 cryptData[idx] ^= customRng3(rd)
         elif switch_val == 9 or switch_val == 0xE:
-            cryptData[customRng2(rd) % 0x30] += a3
+            j = customRng2(rd) % 0x30
+            cryptData[j] = (cryptData[j] + a3) & MASK_U32
         elif switch_val == 0xB:
             cryptData[idx] ^= customRng1(rd)
         elif switch_val == 0x11:
@@ -385,12 +410,13 @@ def aLotOfRngStuff(rd, a2, a3, idx, cryptData):
             if a2 & 0xFFFF == 0:
                 cryptData[idx] ^= customRng2(rd)
 
-        a2 += customRng3(rd)
+        a2 = (a2 + customRng3(rd)) & MASK_U32
 
         if itrs > 50:
             itrs = 50
+        i += 1
 
-    cryptData[idx] += a3
+    cryptData[idx] = (cryptData[idx] + a3) & MASK_U32
 
 
 def aesKeyGen(cd, rd, aesKey, aesIv):
@@ -403,19 +429,18 @@ def aesKeyGen(cd, rd, aesKey, aesIv):
 
     seed = cd.seedBytes[1] ^ cd.seedBytes[2]
 
-    srand(seed)
-
     indexes = list(range(RngData.DATA_VEC_LEN))
     resData = [0] * RngData.DATA_VEC_LEN
 
-    for i in range(RngData.DATA_VEC_LEN):
-        rn = rand(0xFFFF) % RngData.DATA_VEC_LEN
+    # msvcrt srand(seed); rand() % 0x30
+    for i, state in enumerate(lcg_states(seed, RngData.DATA_VEC_LEN)):
+        rn = ((int(state) >> 16) & RAND_MAX) % RngData.DATA_VEC_LEN
         old = indexes[i]
         indexes[i] = indexes[rn]
         indexes[rn] = old
 
     for i in range(RngData.DATA_VEC_LEN):
-        resData[i] = cryptData[indexes[i]]
+        resData[i] = cryptData[indexes[i]] & 0xFF # stored into the uint8 key
 
     aesKey[:] = resData[:AES_KEY_SIZE]
     aesIv[:] = resData[AES_KEY_SIZE:AES_KEY_SIZE + AES_IV_SIZE]
@@ -483,16 +508,47 @@ def untemper(y):
         y ^= y >> mt19937.u & mt19937.d
     return y
 
+def mt19937_pad(seed, size):
+    """ The low bytes of the first `size` MT19937 outputs for `seed` """
+    if not HAS_NUMPY:
+        myrng = mt19937(seed)
+        return bytes(myrng.rand(0xFF) for _ in range(size))
+
+    # only the 624-word seeding is sequential; NumPy's generator takes that
+    # state as is (pos = n forces the first twist) and does the rest
+    key = [0] * mt19937.n
+    key[0] = x = seed & MASK_U32
+    for i in range(1, mt19937.n):
+        x = (1812433253 * (x ^ (x >> 30)) + i) & MASK_U32
+        key[i] = x
+    bit_gen = np.random.MT19937()
+    bit_gen.state = {'bit_generator': 'MT19937', 'state': {'key': np.array(key, dtype=np.uint32), 'pos': mt19937.n}}
+    return bit_gen.random_raw(size).astype(np.uint8).tobytes()
+
 def decrpytProV2P1(data, seed):
     NUM_RNDS = 128
-    myrng = mt19937(seed)
-    rnds = [myrng.rand(0xFF) for _ in range(NUM_RNDS)]
+    rnds = mt19937_pad(seed, NUM_RNDS)
+
+    size = len(data)
+    if size <= 0xA: return
+    pad = (rnds * (size // NUM_RNDS + 1))[0xA:size] # pad[i - 0xA] == rnds[i % NUM_RNDS]
+    if HAS_NUMPY:
+        np.frombuffer(data, dtype=np.uint8)[0xA:] ^= np.frombuffer(pad, dtype=np.uint8)
+    else:
+        with memoryview(data) as view:
+            tail = view[0xA:]
+            tail[:] = (int.from_bytes(tail, 'little') ^ int.from_bytes(pad, 'little')).to_bytes(len(pad), 'little')
 
-    for i in range(0xA, len(data)):
-        data[i] ^= rnds[i % NUM_RNDS]
 
+def proV2MTSeed(data):
+    return genMTSeed([data[0], data[3], data[9]])
 
 def initCryptProt(cd):
+    decrpytProV2P1(cd.gameDatBytes, proV2MTSeed(cd.gameDatBytes))
+    initCryptSeeds(cd)
+
+def initCryptSeeds(cd):
+    """ Derives the key schedule seeds from the header with the MT layer already removed """
     fileSize = len(cd.gameDatBytes)
 
     if fileSize - 20 < 326:
@@ -500,47 +556,131 @@ def initCryptProt(cd):
     else:
         cd.dataSize = 326
 
-    decrpytProV2P1(cd.gameDatBytes, genMTSeed([cd.gameDatBytes[0], cd.gameDatBytes[3], cd.gameDatBytes[9]]))
-
     cd.keyBytes[:] = cd.gameDatBytes[0xB:0xF]
 
-    cd.seedBytes[0] = cd.gameDatBytes[7] + 3 * cd.keyBytes[0]
+    # seed bytes are uint8 like the key bytes they are derived from
+    cd.seedBytes[0] = (cd.gameDatBytes[7] + 3 * cd.keyBytes[0]) & 0xFF
     cd.seedBytes[1] = cd.keyBytes[1] ^ cd.keyBytes[2]
     cd.seedBytes[2] = cd.keyBytes[3] ^ cd.gameDatBytes[7]
-    cd.seedBytes[3] = cd.keyBytes[2] + cd.gameDatBytes[7] - cd.keyBytes[0]
+    cd.seedBytes[3] = (cd.keyBytes[2] + cd.gameDatBytes[7] - cd.keyBytes[0]) & 0xFF
 
     cd.seed1 = cd.keyBytes[1] ^ cd.keyBytes[2]
     cd.seed2 = cd.keyBytes[1] ^ cd.keyBytes[2]
 
 
+KEY_CACHE = "keys_found.dat"
+KEY_CACHE_SEED_SIZE = 20
+
+def load_key_cache(filename=KEY_CACHE) -> dict:
+    """ Derived v2 keys by header seed bytes: {seed.hex(): [aes_key, aes_iv, proj_key]} """
+    import json
+    try:
+        with open(filename, 'r') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_key_cache(cache, filename=KEY_CACHE):
+    import json
+    tmp_name = f"{filename}.{os.getpid()}.tmp" # several workers may save at once
+    try:
+        with open(tmp_name, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_name, filename)
+    except OSError:
+        pass
+
+def proV2CtrXCrypt(cd, seed_key, proj_key=None):
+    """ Applies the AES-CTR layer of a Pro v2 file in place, deriving (or reusing cached) keys for `seed_key` """
+    cache = load_key_cache()
+    cached = cache.get(seed_key)
+    if cached:
+        aesKey, aesIv = list(cached[0]), list(cached[1])
+    else:
+        # aesKeyGen reruns runCrypt from its own seeds, so no separate
+        # runCrypt(rd, cd.seed1, cd.seed2) pass is needed beforehand
+        aesKey = [0] * AES_KEY_SIZE
+        aesIv = [0] * AES_IV_SIZE
+        aesKeyGen(cd, RngData(), aesKey, aesIv)
+
+    roundKey = [0] * AES_ROUND_KEY_SIZE
+    keyExpansion(roundKey, aesKey)
+    roundKey[AES_KEY_EXP_SIZE:] = aesIv[:]
+
+    with memoryview(cd.gameDatBytes) as view:
+        aesCtrXCrypt(view[20:], roundKey, cd.dataSize)
+
+    if not cached:
+        cache[seed_key] = [aesKey, aesIv, cd.gameDatBytes[0x14] if proj_key is None else proj_key]
+        save_key_cache(cache)
+
 def decrypt_dat_v2(data):
+    """ Decrypts a Pro v2 file in place (`data` must be writable) """
     cd = CryptData()
-    rd = RngData()
 
+    seed_key = bytes(data[:KEY_CACHE_SEED_SIZE]).hex()
     cd.gameDatBytes = data
     initCryptProt(cd)
+    proV2CtrXCrypt(cd, seed_key)
+    return cd.gameDatBytes
 
-    runCrypt(rd, cd.seed1, cd.seed2)
+def encrypt_dat_v2(data):
+    """ Inverse of decrypt_dat_v2: re-protects a decrypted Pro v2 file in place """
+    cd = CryptData()
 
-    aesKey = [0] * AES_KEY_SIZE
-    aesIv = [0] * AES_IV_SIZE
-    aesKeyGen(cd, rd, aesKey, aesIv)
+    cd.gameDatBytes = data
+    initCryptSeeds(cd)
+    mt_seed = proV2MTSeed(data)
+    header = bytearray(data[:KEY_CACHE_SEED_SIZE])
+    decrpytProV2P1(header, mt_seed) # the MT layer is an XOR, so this gives the encrypted header
+    proV2CtrXCrypt(cd, bytes(header).hex(), data[0x14])
+    decrpytProV2P1(data, mt_seed)
+    return data
 
-    roundKey = [0] * AES_ROUND_KEY_SIZE
-    keyExpansion(roundKey, aesKey)
-    roundKey[AES_KEY_EXP_SIZE:] = aesIv[:]
+DECRYPT_CHUNK_SIZE = 1 << 20
 
-    aesCtrXCrypt(cd.gameDatBytes[20:], roundKey, cd.dataSize)
-    return cd.gameDatBytes
+def decrypt_dat_v1_range(data, offset, seeds, intervals):
+    """
+    XORs in place a chunk that starts `offset` bytes into v1 encrypted data,
+    jumping each seed's rand() stream straight to the chunk instead of running it from 0
+    """
+    end = offset + len(data)
+    for i, seed in enumerate(seeds):
+        step = intervals[i]
+        first = -(-offset // step) # index of the first rand() call that lands in the chunk
+        count = -(-end // step) - first
+        if count <= 0: continue
+        states = lcg_states(seed, count, first)
+        start = first * step - offset
+        if HAS_NUMPY:
+            buf = np.frombuffer(data, dtype=np.uint8)
+            buf[start::step] ^= (states >> 28).astype(np.uint8) & 7 # (rand() >> 12) & 0xFF
+        else:
+            for j, state in zip(range(start, len(data), step), states):
+                data[j] ^= (state >> 28) & 7
+    return data
 
 def decrypt_dat_v1(data, seeds, intervals):
-    for i, seed in enumerate(seeds):
-        srand(seed)
-        for j in range(0, len(data), intervals[i]):
-            data[j] ^= (rand(0xFFFF) >> 12) & 0xFF
+    """ XORs `data` in place with one msvcrt rand() stream per seed, each applied every `interval` bytes """
+    with memoryview(data) as view:
+        for offset in range(0, len(data), DECRYPT_CHUNK_SIZE):
+            decrypt_dat_v1_range(view[offset:offset + DECRYPT_CHUNK_SIZE], offset, seeds, intervals)
+    return data
 
+def decrypt_proj_range(data, offset, s_proj_key):
+    """ XORs in place a chunk that starts `offset` bytes into an encrypted .project """
+    states = lcg_states(s_proj_key, len(data), offset)
+    if HAS_NUMPY:
+        np.frombuffer(data, dtype=np.uint8)[:] ^= (states >> 16).astype(np.uint8) # rand() & 0xFF
+    else:
+        for j, state in enumerate(states):
+            data[j] ^= (state >> 16) & 0xFF
     return data
 
 def decrypt_proj(data, s_proj_key):
-    srand(s_proj_key)
-    return bytearray([byte ^ rand(0xFF) for byte in data])
+    data = bytearray(data)
+    with memoryview(data) as view:
+        for offset in range(0, len(data), DECRYPT_CHUNK_SIZE):
+            decrypt_proj_range(view[offset:offset + DECRYPT_CHUNK_SIZE], offset, s_proj_key)
+    return data